@@ -40,7 +40,8 @@ def generate_token(user_id: int, username: str) -> str:
 def verify_token(token: str) -> dict:
     """Verify and decode JWT token."""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        # sub is a numeric user id (here and in Node-issued tokens); jose only accepts string subs
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={"verify_sub": False})
         return payload
     except jwt.ExpiredSignatureError:
         raise ValueError("Token has expired")
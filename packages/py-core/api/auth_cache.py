@@ -0,0 +1,135 @@
+"""
+In-process caches for authentication: decoded tokens and resolved users.
+Lets get_current_user skip JWT decoding and the users lookup on hot paths.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from dotenv import load_dotenv
+from db.models import User
+
+load_dotenv()
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def get(self, key) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidations"] += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._data),
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+# sha256(token) -> (user_id, exp); raw tokens are never kept in memory
+token_cache = TTLCache()
+# user_id -> detached User snapshot without the password hash
+user_cache = TTLCache()
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def cache_token(token: str, user_id: int, exp: Optional[float]):
+    """Cache a verified token until min(AUTH_CACHE_TTL, token expiry)."""
+    ttl = (exp - time.time()) if exp else None
+    token_cache.set(token_key(token), (user_id, exp), ttl)
+
+
+def get_cached_token(token: str) -> Optional[int]:
+    """User id for a previously verified, still unexpired token."""
+    entry = token_cache.get(token_key(token))
+    if entry is None:
+        return None
+    user_id, exp = entry
+    if exp and exp <= time.time():
+        token_cache.delete(token_key(token))
+        return None
+    return user_id
+
+
+def snapshot_user(user: User) -> User:
+    """Copy the fields routes need into a transient User, leaving the password behind."""
+    return User(id=user.id, username=user.username, role=user.role, created_at=user.created_at)
+
+
+def cache_user(user: User) -> User:
+    snapshot = snapshot_user(user)
+    user_cache.set(user.id, snapshot)
+    return snapshot
+
+
+def get_cached_user(user_id: int) -> Optional[User]:
+    return user_cache.get(user_id)
+
+
+def invalidate_user(user_id: int):
+    """Drop a user so the next request re-reads it (call after role/password changes or deletes)."""
+    user_cache.delete(user_id)
+
+
+def auth_cache_stats() -> Dict[str, Any]:
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    # Covers ORM updates/deletes made in this process; other processes rely on the TTL
+    invalidate_user(target.id)
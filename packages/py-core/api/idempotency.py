@@ -0,0 +1,195 @@
+"""
+Idempotency keys for creation endpoints.
+A client may send an `Idempotency-Key` header; the first request with a key
+runs and its response is kept in Redis for IDEMPOTENCY_TTL seconds, and
+repeats of the same request with that key get the stored response instead of
+creating and enqueueing everything again. Keys are scoped per user and route.
+Without Redis the header is ignored.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# A request whose process died stops blocking its key this long after its last heartbeat
+IDEMPOTENCY_PENDING_TTL = int(os.getenv("IDEMPOTENCY_PENDING_TTL", "60"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+IDEMPOTENCY_KEY = "ntg:idem:{user_id}:{scope}:{key}"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(body: Any) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Stored responses by idempotency key, with a pending marker while the first request runs."""
+
+    def __init__(self, redis_client, ttl: int = IDEMPOTENCY_TTL, pending_ttl: int = IDEMPOTENCY_PENDING_TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+
+    def begin(self, redis_key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim a key for a new request (returns None), or return the stored response
+        of a finished one. Raises 409 while the first request is still running and
+        422 if the key was used for a different request.
+        """
+        pending = json.dumps({"state": "pending", "fingerprint": fingerprint})
+        if self.redis.set(redis_key, pending, nx=True, ex=self.pending_ttl):
+            return None
+        raw = self.redis.get(redis_key)
+        if raw is None:
+            # Expired between the two calls
+            return self.begin(redis_key, fingerprint)
+        entry = json.loads(raw)
+        if entry.get("fingerprint") != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if entry.get("state") != "done":
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if entry.get("error"):
+            error = entry["error"]
+            raise HTTPException(status_code=error["status_code"], detail=error["detail"], headers={REPLAYED_HEADER: "true"})
+        return entry["response"]
+
+    def touch(self, redis_key: str):
+        """Extend the pending marker of a request that is still running."""
+        self.redis.expire(redis_key, self.pending_ttl)
+
+    def complete(self, redis_key: str, fingerprint: str, response: Dict[str, Any]):
+        entry = {"state": "done", "fingerprint": fingerprint, "response": response}
+        self.redis.set(redis_key, json.dumps(entry, default=str), ex=self.ttl)
+
+    def fail(self, redis_key: str, fingerprint: str, exc: BaseException):
+        """Keep the error of a request that failed after saving changes; repeats get it again."""
+        if isinstance(exc, HTTPException):
+            error = {"status_code": exc.status_code, "detail": exc.detail}
+        else:
+            error = {"status_code": 500, "detail": "Request failed after its changes were saved"}
+        entry = {"state": "done", "fingerprint": fingerprint, "error": error}
+        self.redis.set(redis_key, json.dumps(entry, default=str), ex=self.ttl)
+
+    def abort(self, redis_key: str):
+        """Release the key of a request that failed before saving anything, so it can be retried."""
+        self.redis.delete(redis_key)
+
+
+class PendingHeartbeat:
+    """
+    Keeps a pending marker alive while its request runs, so a slow fan-out is not
+    run twice. A thread rather than a task, as handlers block the event loop with
+    synchronous database work.
+    """
+
+    def __init__(self, store: IdempotencyStore, redis_key: str):
+        self.store = store
+        self.redis_key = redis_key
+        self.interval = max(0.1, store.pending_ttl / 3)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ntg-idempotency-heartbeat", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.touch(self.redis_key)
+            except Exception as e:
+                logging.warning(f"Failed to extend idempotency key: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> Optional[IdempotencyStore]:
+    """Store on the queue's Redis connection, or None when the queue module is unavailable."""
+    global _store
+    if _store is None:
+        try:
+            from worker.queue import redis_conn
+        except Exception:
+            return None
+        _store = IdempotencyStore(redis_conn)
+    return _store
+
+
+async def idempotent(
+    key: Optional[str],
+    user_id: int,
+    scope: str,
+    body: Any,
+    response: Response,
+    handler: Callable[[], Awaitable[Dict[str, Any]]],
+    db: Optional[Session] = None,
+) -> Dict[str, Any]:
+    """
+    Run `handler` once per (user, scope, key): repeats of the same request body
+    replay its response (marked with the Idempotent-Replayed header).
+    A failure frees the key for a retry, unless `db` committed during the
+    handler: then the error is stored and replayed, so a retry cannot repeat
+    the changes already saved.
+    """
+    if not key:
+        return await handler()
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+    store = get_idempotency_store()
+    redis_key = IDEMPOTENCY_KEY.format(user_id=user_id, scope=scope, key=key)
+    fingerprint = request_fingerprint(body)
+    try:
+        stored = store.begin(redis_key, fingerprint) if store else None
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.warning(f"Idempotency store unavailable, running request without it: {e}")
+        store = None
+        stored = None
+    if stored is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+        return stored
+
+    if store is None:
+        return await handler()
+
+    commits = []
+    on_commit = lambda session: commits.append(session)
+    if db is not None:
+        event.listen(db, "after_commit", on_commit)
+    try:
+        with PendingHeartbeat(store, redis_key):
+            result = await handler()
+    except BaseException as e:
+        try:
+            if commits:
+                store.fail(redis_key, fingerprint, e)
+            else:
+                store.abort(redis_key)
+        except Exception:
+            pass
+        raise
+    finally:
+        if db is not None:
+            event.remove(db, "after_commit", on_commit)
+    try:
+        store.complete(redis_key, fingerprint, result)
+    except Exception as e:
+        logging.warning(f"Failed to store idempotent response: {e}")
+    return result
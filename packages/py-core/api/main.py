@@ -4,26 +4,28 @@ FastAPI main application - matches Node.js API contract exactly.
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
-from api.routes import auth, profiles, proxies, sessions, jobs, logs, fingerprints, workflows, health, job_executions
+from api.routes import auth, profiles, proxies, sessions, jobs, logs, fingerprints, workflows, health, job_executions, dead_letters
 from api.compat import setup_compat
+from api.realtime import setup_realtime
 
 app = FastAPI(title="NTG Login API", version="1.0.0")
 
 # CORS middleware
 # Note: When allow_credentials=True, cannot use allow_origins=["*"]
 # Must specify explicit origins
+CORS_ORIGINS = [
+    "http://localhost:5175",
+    "http://localhost:5174",
+    "http://localhost:5173",
+    "http://127.0.0.1:5175",
+    "http://127.0.0.1:5174",
+    "http://127.0.0.1:5173",
+    "http://localhost:3000",
+    "http://127.0.0.1:3000",
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5175",
-        "http://localhost:5174",
-        "http://localhost:5173",
-        "http://127.0.0.1:5175",
-        "http://127.0.0.1:5174",
-        "http://127.0.0.1:5173",
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-    ],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -39,6 +41,7 @@ app.include_router(job_executions.router, prefix="/api")
 app.include_router(logs.router, prefix="/api")
 app.include_router(fingerprints.router, prefix="/api")
 app.include_router(workflows.router, prefix="/api")
+app.include_router(dead_letters.router, prefix="/api")
 app.include_router(health.router, prefix="/api")
 
 # Root endpoint
@@ -61,11 +64,12 @@ async def root():
     }
 
 # Socket.IO setup for realtime events
-sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode="asgi")
+sio = socketio.AsyncServer(cors_allowed_origins=CORS_ORIGINS, async_mode="asgi")
 socket_app = socketio.ASGIApp(sio, app)
 
-# Store socketio instance for worker to emit events
+# Store socketio instance; worker events arrive via Redis pub/sub and are relayed to rooms
 app.sio = sio
+setup_realtime(app, sio)
 
 # Compatibility layer setup
 setup_compat(app)
@@ -5,29 +5,45 @@ from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from .auth import verify_token
+from .auth_cache import get_cached_token, cache_token, get_cached_user, cache_user
 from db.database import get_db
 from db.models import User
 
 security = HTTPBearer()
 
 
+def authenticate_token(token: str, db: Session) -> User:
+    """
+    User a bearer token belongs to. Raises ValueError when the token is invalid,
+    expired, or its user no longer exists.
+    Verified tokens and users are cached in-process, so a warm call does no DB work.
+    """
+    user_id = get_cached_token(token)
+    if user_id is None:
+        payload = verify_token(token)
+        user_id = payload.get("sub")
+        if not user_id:
+            raise ValueError("Invalid token payload")
+        user_id = int(user_id)
+        cache_token(token, user_id, payload.get("exp"))
+    
+    user = get_cached_user(user_id)
+    if user is not None:
+        return user
+    
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise ValueError("User not found")
+    
+    return cache_user(user)
+
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
     """Dependency to get current authenticated user."""
-    token = credentials.credentials
     try:
-        payload = verify_token(token)
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return user
+        return authenticate_token(credentials.credentials, db)
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
-
@@ -0,0 +1,136 @@
+"""
+Socket.IO relay: fans worker events from Redis pub/sub out to connected clients.
+Clients authenticate with the same JWT as the REST API, sent in the connect
+payload ({"token": "..."}). They receive everything by default, plus events
+private to their user; they can narrow to job/session rooms with
+`subscribe` ({"jobId": 1} / {"sessionId": 2} / {"jobExecutionId": 3}, "all": false).
+"""
+import os
+import asyncio
+import logging
+import socketio
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from redis import asyncio as aioredis
+from dotenv import load_dotenv
+from api.middleware import authenticate_token
+from db.database import SessionLocal
+from services.events import EVENTS_CHANNEL, ALL_EVENTS_ROOM, decode_event, event_rooms, subscription_rooms, user_room
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+logger = logging.getLogger("ntg.realtime")
+
+
+def connect_token(auth) -> str:
+    """Bearer token from a client's connect payload ({"token": ...}, "Bearer " prefix optional)."""
+    token = auth.get("token") if isinstance(auth, dict) else None
+    if not isinstance(token, str) or not token.strip():
+        raise ValueError("Missing token")
+    token = token.strip()
+    if token.lower().startswith("bearer "):
+        token = token[7:].strip()
+    return token
+
+
+def authenticate_connection(auth) -> int:
+    """Id of the user a connect payload authenticates. Raises ValueError."""
+    token = connect_token(auth)
+    db = SessionLocal()
+    try:
+        return authenticate_token(token, db).id
+    finally:
+        db.close()
+
+
+def register_handlers(sio: socketio.AsyncServer):
+    """Room management events for clients."""
+
+    @sio.event
+    async def connect(sid, environ, auth=None):
+        try:
+            user_id = await run_in_threadpool(authenticate_connection, auth)
+        except ValueError as e:
+            raise socketio.exceptions.ConnectionRefusedError(str(e))
+        await sio.save_session(sid, {"user_id": user_id})
+        await sio.enter_room(sid, ALL_EVENTS_ROOM)
+        await sio.enter_room(sid, user_room(user_id))
+
+    @sio.event
+    async def subscribe(sid, data):
+        data = data or {}
+        try:
+            rooms = subscription_rooms(data)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "Invalid subscription"}
+        for room in rooms:
+            await sio.enter_room(sid, room)
+        # Narrow the client to its rooms unless it asked to keep everything
+        if data.get("all") is False:
+            await sio.leave_room(sid, ALL_EVENTS_ROOM)
+        return {"success": True, "rooms": rooms}
+
+    @sio.event
+    async def unsubscribe(sid, data):
+        data = data or {}
+        try:
+            rooms = subscription_rooms(data)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "Invalid subscription"}
+        for room in rooms:
+            await sio.leave_room(sid, room)
+        return {"success": True, "rooms": rooms}
+
+
+async def relay_events(sio: socketio.AsyncServer, redis_url: str = REDIS_URL):
+    """Subscribe to the worker event channel and re-emit each event to its rooms. Reconnects on errors."""
+    backoff = 1
+    while True:
+        client = aioredis.from_url(redis_url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(EVENTS_CHANNEL)
+            backoff = 1
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    event = decode_event(message["data"])
+                except ValueError as e:
+                    logger.warning("Dropping malformed event: %s", e)
+                    continue
+                data = event.get("data") or {}
+                await sio.emit(event["event"], data, room=event_rooms(event["event"], data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Event relay error: %s; reconnecting in %ss", e, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+        finally:
+            try:
+                await pubsub.close()
+                await client.close()
+            except Exception:
+                pass
+
+
+def setup_realtime(app: FastAPI, sio: socketio.AsyncServer):
+    """Register socket handlers and run the relay for the lifetime of the app."""
+    register_handlers(sio)
+
+    @app.on_event("startup")
+    async def start_event_relay():
+        app.state.event_relay = asyncio.create_task(relay_events(sio))
+
+    @app.on_event("shutdown")
+    async def stop_event_relay():
+        task = getattr(app.state, "event_relay", None)
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,111 @@
+"""
+Dead-letter routes - list, re-drive and discard jobs that failed for good.
+"""
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional, List
+from db.database import get_db
+from db.models import JobExecution, User
+from api.middleware import get_current_user
+try:
+    from worker.retry import get_dead_letters, execution_ids
+    REDIS_AVAILABLE = True
+except Exception as e:
+    logging.error(f"Failed to import dead-letter queue: {str(e)}")
+    REDIS_AVAILABLE = False
+
+router = APIRouter(prefix="/dead-letters", tags=["dead-letters"])
+
+MAX_PAGE_SIZE = 500
+MAX_REDRIVE = 5000
+
+
+class RedriveRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    job_type: Optional[str] = None
+    all: bool = False
+    limit: int = 1000
+
+
+def dead_letters():
+    if not REDIS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Redis queue is not available")
+    return get_dead_letters()
+
+
+@router.get("")
+async def get_dead_letter_entries(
+    job_type: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """List dead-lettered jobs, newest first."""
+    entries, total = dead_letters().list(job_type=job_type, limit=limit, offset=offset)
+    return {
+        "success": True,
+        "data": entries,
+        "pagination": {"limit": limit, "offset": offset, "total": total},
+    }
+
+
+@router.post("/redrive")
+async def redrive_dead_letters(
+    request: RedriveRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Re-enqueue dead-lettered jobs from attempt 1: the given ids, or the newest
+    `limit` entries of `job_type`, or (with all=true) of any type.
+    """
+    if not request.ids and not request.job_type and not request.all:
+        raise HTTPException(status_code=400, detail="Specify ids, job_type or all=true")
+    if not 1 <= request.limit <= MAX_REDRIVE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_REDRIVE}")
+
+    queue = dead_letters()
+    selected = queue.select(request.ids, request.job_type, request.limit)
+    redriven, failed = queue.redrive(selected)
+
+    # Executions of re-driven jobs are pending again
+    exec_ids = [exec_id for entry in redriven for exec_id in execution_ids(entry["job_type"], entry["payload"])]
+    if exec_ids:
+        db.execute(
+            update(JobExecution)
+            .where(JobExecution.id.in_(exec_ids))
+            .values(status="pending", completed_at=None, error=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    response = {
+        "success": True,
+        "message": f"Re-drove {len(redriven)} of {len(selected)} jobs",
+        "data": {
+            "requested": len(selected),
+            "redriven": len(redriven),
+            "failed": len(failed),
+            "not_found": len(selected) - len(redriven) - len(failed),
+        },
+    }
+    if failed:
+        response["failures"] = [{"id": entry["id"], "error": error} for entry, error in failed]
+    return response
+
+
+@router.delete("/{entry_id}")
+async def delete_dead_letter(
+    entry_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Discard a dead-lettered job."""
+    if not dead_letters().take([entry_id]):
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    return {
+        "success": True,
+        "message": "Dead letter deleted successfully",
+    }
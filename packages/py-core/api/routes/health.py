@@ -3,7 +3,15 @@ Health check route.
 """
 from fastapi import APIRouter
 from sqlalchemy import text
-from db.database import SessionLocal
+from db.database import SessionLocal, pool_status
+from api.auth_cache import auth_cache_stats
+try:
+    from worker.queue import lane_stats
+    from worker.scheduler import get_delayed_jobs
+    from worker.retry import get_dead_letters
+    REDIS_AVAILABLE = True
+except Exception:
+    REDIS_AVAILABLE = False
 
 router = APIRouter(tags=["health"])
 
@@ -20,9 +28,25 @@ async def health_check():
     except Exception:
         db_status = "error"
     
+    queues = None
+    scheduled = None
+    dead_letters = None
+    if REDIS_AVAILABLE:
+        try:
+            queues = lane_stats()
+            scheduled = get_delayed_jobs().stats()
+            dead_letters = get_dead_letters().count()
+        except Exception:
+            queues = "unavailable"
+    
     return {
         "status": "ok" if db_status == "ok" else "degraded",
         "database": db_status,
+        "database_pool": pool_status(),
+        "auth_cache": auth_cache_stats(),
+        "queues": queues,
+        "scheduled": scheduled,
+        "dead_letters": dead_letters,
         "version": "1.0.0",
     }
 
@@ -1,25 +1,110 @@
 """
 Job Execution routes - GET /api/job-executions
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import os
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Dict, Any, Optional, Tuple
+from dotenv import load_dotenv
 try:
     from db.database import get_db
     from db.models import JobExecution, User
     from api.middleware import get_current_user
+    from services.storage import get_screenshot_store
+    from services.cancellation import cancel_executions
 except ImportError:
     # For relative imports
     import sys
-    import os
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
     from db.database import get_db
     from db.models import JobExecution, User
     from api.middleware import get_current_user
+    from services.storage import get_screenshot_store
+    from services.cancellation import cancel_executions
+
+load_dotenv()
+
+# Thumbnail widths served by ?width= (a request is rounded up to the next one)
+ARTIFACT_THUMBNAIL_WIDTHS = sorted(
+    int(w) for w in os.getenv("ARTIFACT_THUMBNAIL_WIDTHS", "160,320,640,1280").split(",") if w.strip()
+)
+# Artifacts are content-addressed, so a URL's bytes never change for a given ETag
+ARTIFACT_CACHE_CONTROL = "private, max-age=31536000, immutable"
 
 router = APIRouter(prefix="/job-executions", tags=["job-executions"])
 
 
+def artifact_keys(result: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Store keys of the artifacts an execution result references, by artifact name:
+    "screenshot", "thumbnail", and "nodes/<node_id>" / "nodes/<node_id>/thumbnail"
+    for workflow screenshot nodes.
+    """
+    keys: Dict[str, str] = {}
+    if not isinstance(result, dict):
+        return keys
+
+    def add(name: str, info: Any):
+        if isinstance(info, dict) and info.get("key"):
+            keys[name] = info["key"]
+            thumbnail = info.get("thumbnail")
+            if isinstance(thumbnail, dict) and thumbnail.get("key"):
+                keys[f"{name}/thumbnail" if name != "screenshot" else "thumbnail"] = thumbnail["key"]
+
+    add("screenshot", result.get("screenshot_info"))
+    screenshot = result.get("screenshot")
+    if "screenshot" not in keys and isinstance(screenshot, str) and screenshot.startswith("screenshots/"):
+        keys["screenshot"] = screenshot[len("screenshots/"):]
+    for entry in result.get("results") or []:
+        if isinstance(entry, dict) and entry.get("node_id") is not None:
+            add(f"nodes/{entry['node_id']}", entry.get("result"))
+    return keys
+
+
+def thumbnail_width(requested: int) -> int:
+    """Smallest configured width at least as large as requested (largest if none is)."""
+    for width in ARTIFACT_THUMBNAIL_WIDTHS:
+        if width >= requested:
+            return width
+    return ARTIFACT_THUMBNAIL_WIDTHS[-1]
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, lists and "*")."""
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single byte range from a Range header as (start, end) inclusive.
+    None means "send the whole file": no header, or a form we ignore (malformed,
+    multiple ranges). Raises ValueError when the range is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    if not (start_s.isdigit() or end_s.isdigit()) or any(v and not v.isdigit() for v in (start_s, end_s)):
+        return None
+    if not start_s:
+        # Suffix range: the last N bytes
+        length = int(end_s)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if end_s and end < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
 @router.get("")
 async def get_job_executions(
     job_id: Optional[int] = Query(None, alias="jobId"),
@@ -59,3 +144,99 @@ async def get_job_executions(
             "data": [],
         }
 
+
+
+@router.post("/{job_exec_id}/cancel")
+async def cancel_job_execution(
+    job_exec_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Cancel a job execution: a pending one is cancelled at once, a running one
+    stops at its next workflow node or within CANCEL_POLL_INTERVAL seconds.
+    """
+    execution = db.query(JobExecution).filter(JobExecution.id == job_exec_id).first()
+    if not execution:
+        raise HTTPException(status_code=404, detail="Job execution not found")
+    if execution.status not in ("pending", "running"):
+        raise HTTPException(status_code=409, detail=f"Job execution already {execution.status}")
+    
+    try:
+        counts = cancel_executions(db, [(execution.id, execution.status)])
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Failed to signal cancellation: {str(e)}")
+    db.commit()
+    db.refresh(execution)
+    
+    return {
+        "success": True,
+        "message": "Job execution cancelled" if counts["cancelled"] else "Job execution cancel requested",
+        "data": {"id": execution.id, "status": execution.status},
+    }
+
+
+@router.get("/{job_exec_id}/artifacts/{artifact:path}")
+async def get_job_execution_artifact(
+    job_exec_id: int,
+    artifact: str,
+    request: Request,
+    width: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream an artifact of a job execution ("screenshot", "thumbnail", "nodes/<id>", ...).
+    Supports single byte ranges and ETag revalidation; ?width= serves a cached thumbnail.
+    """
+    execution = db.query(JobExecution).filter(JobExecution.id == job_exec_id).first()
+    if not execution:
+        raise HTTPException(status_code=404, detail="Job execution not found")
+
+    key = artifact_keys(execution.result).get(artifact)
+    if not key:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    store = get_screenshot_store()
+    # Index lookups (and the backend fallback for unindexed files) run off the event loop
+    meta = await run_in_threadpool(store.describe, key)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Artifact no longer stored")
+    if width:
+        try:
+            key = await run_in_threadpool(store.thumbnail, key, thumbnail_width(width))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to build thumbnail: {str(e)}")
+        meta = await run_in_threadpool(store.index.get, key)
+
+    etag = f'"{meta["sha256"]}"'
+    headers = {"ETag": etag, "Cache-Control": ARTIFACT_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    size = meta["size"]
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"},
+            )
+
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    status_code = status.HTTP_200_OK
+    if byte_range:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    # Sync chunk iterator: Starlette pulls it in a worker thread, so file/S3 reads never block the loop
+    return StreamingResponse(
+        store.read_range(key, start, end) if size else iter(()),
+        status_code=status_code,
+        media_type=meta["content_type"] or "application/octet-stream",
+        headers=headers,
+    )
@@ -1,27 +1,41 @@
 """
 Job routes - CRUD operations and job execution management.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import time
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from db.database import get_db
-from db.models import Job, JobExecution, Profile, User
+from db.models import Job, JobExecution, User
 from api.middleware import get_current_user
+from api.idempotency import idempotent
+from services.cancellation import cancel_executions, UNFINISHED_STATUSES
+from services.job_fanout import (
+    existing_profile_ids,
+    create_job_executions,
+    fanout_jobs,
+)
+from worker.readiness import parse_readiness
+from worker.resource_blocking import parse_blocking
+from worker.screenshots import parse_screenshot
+from worker.scheduler import parse_schedule, next_run, get_delayed_jobs, job_entry_id
 try:
-    from worker.queue import enqueue_job
+    from worker.queue import enqueue_jobs_bulk, LANES
     REDIS_AVAILABLE = True
 except Exception as e:
-    import logging
-    logging.error(f"Failed to import enqueue_job: {str(e)}")
+    logging.error(f"Failed to import enqueue_jobs_bulk: {str(e)}")
     REDIS_AVAILABLE = False
-    def enqueue_job(*args, **kwargs):
+    LANES = ("interactive", "normal", "bulk")
+    def enqueue_jobs_bulk(*args, **kwargs):
         raise RuntimeError("Redis queue is not available")
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
 
+
 class JobCreate(BaseModel):
     type: str
     payload: dict
@@ -36,6 +50,13 @@ class JobUpdate(BaseModel):
     scheduled_at: Optional[datetime] = None
 
 
+def epoch(value: datetime) -> float:
+    """Epoch seconds; naive datetimes are taken as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
 @router.get("")
 async def get_all_jobs(
     status_filter: Optional[str] = Query(None, alias="status"),
@@ -93,80 +114,141 @@ async def get_job(
 @router.post("")
 async def create_job(
     request: JobCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Create new job and optionally JobExecution records for each profile."""
+    """
+    Create new job and optionally JobExecution records for each profile.
+    Retries with the same Idempotency-Key return the first response instead of fanning out again.
+    """
+    return await idempotent(
+        idempotency_key, current_user.id, "jobs.create", request.dict(), response,
+        lambda: run_create_job(request, db, current_user),
+        db=db,
+    )
+
+
+async def run_create_job(request: JobCreate, db: Session, current_user: User):
     if not request.type or not request.payload:
         raise HTTPException(status_code=400, detail="Type and payload are required")
+    try:
+        if request.payload.get("readiness") is not None:
+            parse_readiness(request.payload["readiness"])
+        if request.payload.get("blocking") is not None:
+            parse_blocking(request.payload["blocking"])
+        if request.payload.get("screenshot") is not None:
+            parse_screenshot(request.payload["screenshot"])
+        if request.payload.get("priority") is not None and request.payload["priority"] not in LANES:
+            raise ValueError(f"priority must be one of {', '.join(LANES)}")
+        schedule = None
+        if request.payload.get("schedule") is not None:
+            schedule = parse_schedule(request.payload["schedule"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if schedule and not REDIS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Redis queue is not available; recurring jobs cannot be scheduled")
+    
+    # Recurring jobs start at scheduled_at (if in the future) or the schedule's first occurrence;
+    # one-shot jobs with a future scheduled_at have their fan-out held until then
+    now = time.time()
+    run_at = epoch(request.scheduled_at) if request.scheduled_at else None
+    if run_at is not None and run_at <= now:
+        run_at = None
+    if schedule and run_at is None:
+        run_at = next_run(schedule, now)
     
     job = Job(
         type=request.type,
         payload=request.payload,
         status=request.status or "queued",
-        scheduled_at=request.scheduled_at,
+        scheduled_at=datetime.fromtimestamp(run_at, timezone.utc) if schedule else request.scheduled_at,
     )
     db.add(job)
     db.commit()
     db.refresh(job)
     
-    # Create JobExecution for each profile_id if provided
-    if request.profile_ids:
-        job_executions = []
-        for profile_id in request.profile_ids:
-            profile = db.query(Profile).filter(Profile.id == profile_id).first()
-            if profile:
-                job_exec = JobExecution(
-                    job_id=job.id,
-                    profile_id=profile_id,
-                    status="pending",
-                )
-                db.add(job_exec)
-                job_executions.append((job_exec, profile_id))
+    enqueue_errors = []
+    failures = []
+    fanout = None
+    schedule_info = None
+    if schedule:
+        # Each run creates its own JobExecutions (see run_scheduled_job)
+        try:
+            get_delayed_jobs().schedule(
+                job_entry_id(job.id),
+                run_at,
+                [("run_scheduled_job", {"job_id": job.id, "profile_ids": request.profile_ids or [], "user_id": current_user.id})],
+                user_id=current_user.id,
+                schedule=schedule,
+            )
+            schedule_info = {**schedule, "next_run_at": job.scheduled_at.isoformat()}
+        except Exception as e:
+            error_msg = f"Failed to schedule recurring job: {e}"
+            logging.error(error_msg)
+            enqueue_errors.append(error_msg)
+    elif request.profile_ids:
+        # Create JobExecution for each profile_id
+        profile_ids = request.profile_ids
+        existing = existing_profile_ids(db, profile_ids)
+        valid_ids = [pid for pid in profile_ids if pid in existing]
+        failures.extend(
+            {"profile_id": pid, "error": "Profile not found"}
+            for pid in profile_ids if pid not in existing
+        )
+        
+        job_executions = create_job_executions(db, job.id, valid_ids)
         db.commit()
         
-        # Enqueue jobs to RQ worker
-        enqueue_errors = []
-        if not REDIS_AVAILABLE:
+        # Enqueue jobs to RQ worker: (members, (job_type, payload)) where members are (exec_id, profile_id)
+        to_enqueue = fanout_jobs(job.type, request.payload, job_executions)
+        
+        enqueued = 0
+        scheduled = 0
+        if to_enqueue and not REDIS_AVAILABLE:
             enqueue_errors.append("Redis queue is not available. Jobs have been created but will not be executed automatically.")
-        else:
+        elif to_enqueue and run_at is not None:
             try:
-                if job.type == "run_workflow":
-                    workflow_id = request.payload.get("workflow_id")
-                    if workflow_id:
-                        for job_exec, profile_id in job_executions:
-                            # Enqueue workflow job for each profile
-                            try:
-                                enqueue_job("run_workflow", {
-                                    "workflow_id": workflow_id,
-                                    "profile_id": profile_id,
-                                })
-                            except Exception as e:
-                                # Log error and collect for response
-                                import logging
-                                error_msg = f"Failed to enqueue workflow job for profile {profile_id}: {str(e)}"
-                                logging.error(error_msg)
-                                enqueue_errors.append(error_msg)
-                elif job.type == "run_job_execution":
-                    for job_exec, profile_id in job_executions:
-                        # Enqueue job execution
-                        db.refresh(job_exec)  # Refresh to get the ID
-                        try:
-                            enqueue_job("run_job_execution", {
-                                "job_execution_id": job_exec.id,
-                            })
-                        except Exception as e:
-                            # Log error and collect for response
-                            import logging
-                            error_msg = f"Failed to enqueue job execution {job_exec.id}: {str(e)}"
-                            logging.error(error_msg)
-                            enqueue_errors.append(error_msg)
+                get_delayed_jobs().schedule(
+                    job_entry_id(job.id),
+                    run_at,
+                    [item for _, item in to_enqueue],
+                    user_id=current_user.id,
+                    lane=request.payload.get("priority"),
+                )
+                scheduled = sum(len(members) for members, _ in to_enqueue)
             except Exception as e:
-                # Log error and collect for response
-                import logging
-                error_msg = f"Failed to enqueue jobs: {str(e)}"
+                error_msg = f"Failed to schedule job executions: {e}"
+                logging.error(error_msg)
+                enqueue_errors.append(error_msg)
+        elif to_enqueue:
+            results = enqueue_jobs_bulk(
+                [item for _, item in to_enqueue],
+                user_id=current_user.id,
+                lane=request.payload.get("priority"),
+            )
+            total = sum(len(members) for members, _ in to_enqueue)
+            for (members, _), (rq_job, error) in zip(to_enqueue, results):
+                if error:
+                    failures.extend(
+                        {"profile_id": profile_id, "job_execution_id": exec_id, "error": error}
+                        for exec_id, profile_id in members
+                    )
+                else:
+                    enqueued += len(members)
+            if total > enqueued:
+                error_msg = f"Failed to enqueue {total - enqueued} of {total} job executions"
                 logging.error(error_msg)
                 enqueue_errors.append(error_msg)
+        
+        fanout = {
+            "requested": len(profile_ids),
+            "created": len(job_executions),
+            "enqueued": enqueued,
+            "scheduled": scheduled,
+            "failed": len(failures),
+        }
     
     response_data = {
         "success": True,
@@ -182,6 +264,13 @@ async def create_job(
         },
     }
     
+    if fanout is not None:
+        response_data["fanout"] = fanout
+    if schedule_info is not None:
+        response_data["schedule"] = schedule_info
+    if failures:
+        response_data["failures"] = failures
+    
     # Add enqueue errors to response if any
     if enqueue_errors:
         response_data["warnings"] = enqueue_errors
@@ -212,6 +301,13 @@ async def update_job(
     db.commit()
     db.refresh(job)
     
+    # Move a pending delayed fan-out or the next run of a recurring job
+    if request.scheduled_at is not None and REDIS_AVAILABLE:
+        try:
+            get_delayed_jobs().reschedule(job_entry_id(job.id), epoch(request.scheduled_at))
+        except Exception as e:
+            logging.error(f"Failed to reschedule job {job.id}: {e}")
+    
     return {
         "success": True,
         "message": "Job updated successfully",
@@ -227,6 +323,43 @@ async def update_job(
     }
 
 
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Cancel a job: pending executions are cancelled at once, running ones stop
+    within seconds, and a held fan-out or recurring schedule is disarmed.
+    """
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    executions = (
+        db.query(JobExecution.id, JobExecution.status)
+        .filter(JobExecution.job_id == job_id, JobExecution.status.in_(UNFINISHED_STATUSES))
+        .all()
+    )
+    try:
+        counts = cancel_executions(db, [tuple(row) for row in executions])
+        if REDIS_AVAILABLE:
+            get_delayed_jobs().cancel(job_entry_id(job.id))
+    except Exception as e:
+        logging.error(f"Failed to cancel job {job_id}: {e}")
+        raise HTTPException(status_code=503, detail=f"Failed to signal cancellation: {str(e)}")
+    
+    job.status = "cancelled"
+    db.commit()
+    
+    return {
+        "success": True,
+        "message": "Job cancel requested",
+        "data": {"job_id": job.id, "status": job.status, **counts},
+    }
+
+
 @router.delete("/{job_id}")
 async def delete_job(
     job_id: int,
@@ -241,6 +374,12 @@ async def delete_job(
     db.delete(job)
     db.commit()
     
+    if REDIS_AVAILABLE:
+        try:
+            get_delayed_jobs().cancel(job_entry_id(job_id))
+        except Exception as e:
+            logging.error(f"Failed to cancel schedule of job {job_id}: {e}")
+    
     return {
         "success": True,
         "message": "Job deleted successfully",
@@ -1,13 +1,17 @@
 """
 Profile routes - CRUD operations.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List, Tuple
 from db.database import get_db
 from db.models import Profile, User
 from api.middleware import get_current_user
+from api.auth_cache import TTLCache
+from services.injection_cache import precompute_injection
 
 router = APIRouter(prefix="/profiles", tags=["profiles"])
 
@@ -24,26 +28,136 @@ class ProfileUpdate(BaseModel):
     fingerprint: Optional[dict] = None
 
 
+# Columns selectable via ?fields=; id is always returned since it is the pagination key
+PROFILE_FIELDS = ("id", "name", "user_agent", "fingerprint", "created_at")
+MAX_PAGE_SIZE = 500
+PROFILE_COUNT_CACHE_TTL = float(os.getenv("PROFILE_COUNT_CACHE_TTL", "30"))
+PROFILE_COUNT_CACHE_SIZE = int(os.getenv("PROFILE_COUNT_CACHE_SIZE", "1000"))
+
+# search prefix -> total; bounded, since searches are arbitrary client strings
+_total_cache = TTLCache(maxsize=PROFILE_COUNT_CACHE_SIZE, ttl=PROFILE_COUNT_CACHE_TTL)
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Parse a comma-separated ?fields= value into a list of known profile columns."""
+    if not fields:
+        return list(PROFILE_FIELDS)
+    
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in PROFILE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    return ["id"] + [f for f in PROFILE_FIELDS if f in requested and f != "id"]
+
+
+def _name_prefix_filter(search: str):
+    # Escape LIKE wildcards so the prefix is matched literally
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return Profile.name.like(f"{escaped}%", escape="\\")
+
+
+def query_profiles(
+    db: Session,
+    fields: List[str],
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+    search: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Keyset-paginated profile listing that only selects the requested columns.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    columns = [getattr(Profile, f) for f in fields]
+    query = db.query(*columns)
+    if search:
+        query = query.filter(_name_prefix_filter(search))
+    if cursor is not None:
+        query = query.filter(Profile.id > cursor)
+    query = query.order_by(Profile.id)
+    
+    if limit is None:
+        rows = query.all()
+        has_more = False
+    else:
+        # Fetch one extra row to learn whether another page exists
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    
+    data = []
+    for row in rows:
+        item = dict(zip(fields, row))
+        if "created_at" in item:
+            item["created_at"] = item["created_at"].isoformat() if item["created_at"] else None
+        data.append(item)
+    
+    next_cursor = data[-1]["id"] if has_more and data else None
+    return data, next_cursor
+
+
+def count_profiles(db: Session, search: Optional[str] = None) -> int:
+    """Total number of profiles matching `search`, cached for PROFILE_COUNT_CACHE_TTL seconds."""
+    key = search or ""
+    cached = _total_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    query = db.query(func.count(Profile.id))
+    if search:
+        query = query.filter(_name_prefix_filter(search))
+    total = query.scalar() or 0
+    _total_cache.set(key, total)
+    return total
+
+
+def invalidate_profile_count():
+    """Drop cached totals after profiles are added, renamed or removed."""
+    _total_cache.clear()
+
+
+def precompute_profile_injection(profile: Profile):
+    """Build the profile's injection script now so job startup finds it cached."""
+    try:
+        precompute_injection(profile.fingerprint, profile.user_agent)
+    except Exception as e:
+        # Never fail the save; the worker builds the script on demand
+        print(f"Failed to precompute injection script for profile {profile.id}: {e}")
+
+
 @router.get("")
 async def get_all_profiles(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None),
+    fields: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
+    include_total: bool = Query(False, alias="includeTotal"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all profiles."""
-    profiles = db.query(Profile).all()
-    return {
+    """
+    Get profiles. Without query params returns every profile (legacy behaviour).
+    limit/cursor page by id, fields= selects columns, search= matches a name prefix.
+    """
+    selected = parse_fields(fields)
+    data, next_cursor = query_profiles(db, selected, limit=limit, cursor=cursor, search=search)
+    
+    response = {
         "success": True,
-        "data": [
-            {
-                "id": p.id,
-                "name": p.name,
-                "user_agent": p.user_agent,
-                "fingerprint": p.fingerprint,
-                "created_at": p.created_at.isoformat() if p.created_at else None,
-            }
-            for p in profiles
-        ],
+        "data": data,
     }
+    
+    if limit is not None or cursor is not None or include_total:
+        pagination = {
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+        }
+        if include_total:
+            pagination["total"] = count_profiles(db, search)
+        response["pagination"] = pagination
+    
+    return response
 
 
 @router.get("/{profile_id}")
@@ -87,6 +201,8 @@ async def create_profile(
     db.add(profile)
     db.commit()
     db.refresh(profile)
+    invalidate_profile_count()
+    precompute_profile_injection(profile)
     
     return {
         "success": True,
@@ -122,6 +238,10 @@ async def update_profile(
     
     db.commit()
     db.refresh(profile)
+    if request.name is not None:
+        invalidate_profile_count()
+    if request.fingerprint is not None or request.user_agent is not None:
+        precompute_profile_injection(profile)
     
     return {
         "success": True,
@@ -149,6 +269,7 @@ async def delete_profile(
     
     db.delete(profile)
     db.commit()
+    invalidate_profile_count()
     
     return {
         "success": True,
@@ -1,14 +1,16 @@
 """
-Session routes - CRUD operations and control (start/stop).
+Session routes - CRUD operations and control (start/stop/cancel).
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
+from sqlalchemy.orm import Session, joinedload, load_only
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Tuple
 from datetime import datetime
 from db.database import get_db
 from db.models import Session as SessionModel, Profile, Proxy, User
 from api.middleware import get_current_user
+from api.idempotency import idempotent
+from worker.cancellation import get_cancel_flags
 try:
     from worker.queue import enqueue_job
     REDIS_AVAILABLE = True
@@ -36,39 +38,96 @@ class SessionUpdate(BaseModel):
     meta: Optional[dict] = None
 
 
+MAX_PAGE_SIZE = 500
+
+# Only the columns the listing returns; profile and proxy come from the same joined query
+_SESSION_LIST_OPTIONS = (
+    load_only(
+        SessionModel.id,
+        SessionModel.profile_id,
+        SessionModel.proxy_id,
+        SessionModel.status,
+        SessionModel.started_at,
+        SessionModel.stopped_at,
+        SessionModel.meta,
+    ),
+    joinedload(SessionModel.profile).load_only(Profile.id, Profile.name),
+    joinedload(SessionModel.proxy).load_only(Proxy.id, Proxy.host, Proxy.port),
+)
+
+
+def serialize_session(s: SessionModel) -> dict:
+    """Serialize a session with its profile and proxy summaries."""
+    return {
+        "id": s.id,
+        "profile_id": s.profile_id,
+        "proxy_id": s.proxy_id,
+        "status": s.status,
+        "started_at": s.started_at.isoformat() if s.started_at else None,
+        "stopped_at": s.stopped_at.isoformat() if s.stopped_at else None,
+        "meta": s.meta,
+        "profile": {
+            "id": s.profile.id,
+            "name": s.profile.name,
+        } if s.profile else None,
+        "proxy": {
+            "id": s.proxy.id,
+            "host": s.proxy.host,
+            "port": s.proxy.port,
+        } if s.proxy else None,
+    }
+
+
+def query_sessions(
+    db: Session,
+    status_filter: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+) -> Tuple[List[SessionModel], Optional[int]]:
+    """
+    Keyset-paginated session listing in a single query, regardless of row count.
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
+    """
+    query = db.query(SessionModel).options(*_SESSION_LIST_OPTIONS)
+    if status_filter:
+        query = query.filter(SessionModel.status == status_filter)
+    if cursor is not None:
+        query = query.filter(SessionModel.id > cursor)
+    query = query.order_by(SessionModel.id)
+    
+    if limit is None:
+        return query.all(), None
+    
+    # Fetch one extra row to learn whether another page exists
+    sessions = query.limit(limit + 1).all()
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
+    return sessions, (sessions[-1].id if has_more and sessions else None)
+
+
 @router.get("")
 async def get_all_sessions(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all sessions."""
-    sessions = db.query(SessionModel).all()
-    result = []
-    for s in sessions:
-        session_data = {
-            "id": s.id,
-            "profile_id": s.profile_id,
-            "proxy_id": s.proxy_id,
-            "status": s.status,
-            "started_at": s.started_at.isoformat() if s.started_at else None,
-            "stopped_at": s.stopped_at.isoformat() if s.stopped_at else None,
-            "meta": s.meta,
-            "profile": {
-                "id": s.profile.id,
-                "name": s.profile.name,
-            } if s.profile else None,
-            "proxy": {
-                "id": s.proxy.id,
-                "host": s.proxy.host,
-                "port": s.proxy.port,
-            } if s.proxy else None,
-        }
-        result.append(session_data)
+    """Get sessions, optionally filtered by status and paged by id (limit/cursor)."""
+    sessions, next_cursor = query_sessions(db, status_filter=status_filter, limit=limit, cursor=cursor)
     
-    return {
+    response = {
         "success": True,
-        "data": result,
+        "data": [serialize_session(s) for s in sessions],
     }
+    if limit is not None or cursor is not None:
+        response["pagination"] = {
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+        }
+    
+    return response
 
 
 @router.get("/{session_id}")
@@ -78,40 +137,41 @@ async def get_session(
     current_user: User = Depends(get_current_user)
 ):
     """Get session by ID."""
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = (
+        db.query(SessionModel)
+        .options(*_SESSION_LIST_OPTIONS)
+        .filter(SessionModel.id == session_id)
+        .first()
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     return {
         "success": True,
-        "data": {
-            "id": session.id,
-            "profile_id": session.profile_id,
-            "proxy_id": session.proxy_id,
-            "status": session.status,
-            "started_at": session.started_at.isoformat() if session.started_at else None,
-            "stopped_at": session.stopped_at.isoformat() if session.stopped_at else None,
-            "meta": session.meta,
-            "profile": {
-                "id": session.profile.id,
-                "name": session.profile.name,
-            } if session.profile else None,
-            "proxy": {
-                "id": session.proxy.id,
-                "host": session.proxy.host,
-                "port": session.proxy.port,
-            } if session.proxy else None,
-        },
+        "data": serialize_session(session),
     }
 
 
 @router.post("")
 async def create_session(
     request: SessionCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Create new session and enqueue start job."""
+    """
+    Create new session and enqueue start job.
+    Retries with the same Idempotency-Key return the first response instead of creating another session.
+    """
+    return await idempotent(
+        idempotency_key, current_user.id, "sessions.create", request.dict(), response,
+        lambda: run_create_session(request, db, current_user),
+        db=db,
+    )
+
+
+async def run_create_session(request: SessionCreate, db: Session, current_user: User):
     if not request.profile_id:
         raise HTTPException(status_code=400, detail="Profile ID is required")
     
@@ -141,7 +201,7 @@ async def create_session(
     if request.status == "running" or not request.status:
         try:
             if REDIS_AVAILABLE:
-                enqueue_job("start_session", {"session_id": session.id})
+                enqueue_job("start_session", {"session_id": session.id}, user_id=current_user.id)
             else:
                 enqueue_warning = "Redis queue is not available. Session created but job not enqueued."
         except Exception as e:
@@ -174,10 +234,23 @@ async def create_session(
 @router.post("/{session_id}/stop")
 async def stop_session(
     session_id: int,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Stop a running session."""
+    """
+    Stop a running session.
+    A stop already queued for the session is not enqueued again.
+    """
+    return await idempotent(
+        idempotency_key, current_user.id, f"sessions.{session_id}.stop", {}, response,
+        lambda: run_stop_session(session_id, db, current_user),
+        db=db,
+    )
+
+
+async def run_stop_session(session_id: int, db: Session, current_user: User):
     session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -186,7 +259,7 @@ async def stop_session(
     enqueue_warning = None
     try:
         if REDIS_AVAILABLE:
-            enqueue_job("stop_session", {"session_id": session_id})
+            enqueue_job("stop_session", {"session_id": session_id}, user_id=current_user.id)
         else:
             enqueue_warning = "Redis queue is not available. Session stop job not enqueued."
     except Exception as e:
@@ -201,6 +274,31 @@ async def stop_session(
     }
 
 
+@router.post("/{session_id}/cancel")
+async def cancel_session(
+    session_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Cancel a session: a start still in progress (e.g. stuck navigating to its
+    URL) is interrupted within seconds, and the session is stopped.
+    """
+    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        get_cancel_flags().request([("session", session_id)])
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Failed to signal cancellation: {str(e)}")
+    
+    # A session already running is stopped like any other
+    response = await run_stop_session(session_id, db, current_user)
+    response["message"] = "Session cancel requested"
+    return response
+
+
 @router.put("/{session_id}")
 async def update_session(
     session_id: int,
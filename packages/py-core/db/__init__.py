@@ -1,5 +1,5 @@
 from .models import Base, User, Profile, Proxy, Session, Job, Log, JobExecution, Fingerprint, Workflow
-from .database import SessionLocal, get_db, engine
+from .database import SessionLocal, get_db, engine, pool_status
 
 __all__ = [
     "Base",
@@ -15,5 +15,6 @@ __all__ = [
     "SessionLocal",
     "get_db",
     "engine",
+    "pool_status",
 ]
 
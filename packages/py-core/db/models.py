@@ -69,7 +69,7 @@ class Job(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     type = Column(String, nullable=False)
     payload = Column(JSON, nullable=False)
-    status = Column(String, default="queued", index=True)  # "queued", "processing", "done", "failed"
+    status = Column(String, default="queued", index=True)  # "queued", "processing", "done", "failed", "cancelled"
     attempts = Column(Integer, default=0)
     scheduled_at = Column(DateTime(timezone=True), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -94,7 +94,7 @@ class JobExecution(Base):
     job_id = Column(Integer, ForeignKey("jobs.id", ondelete="CASCADE"), nullable=False, index=True)
     profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), nullable=False)
     session_id = Column(Integer, ForeignKey("sessions.id", ondelete="SET NULL"), nullable=True)
-    status = Column(String, default="pending")  # "pending", "running", "completed", "failed"
+    status = Column(String, default="pending")  # "pending", "running", "completed", "failed", "cancelled"
     started_at = Column(DateTime(timezone=True), nullable=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
     result = Column(JSON, nullable=True)  # screenshot path, logs, etc.
@@ -1,13 +1,17 @@
 from .crypto import encrypt, decrypt
 from .fingerprint_injection import build_injection, get_default_fingerprint
-from .storage import save_screenshot, get_screenshot_path, delete_screenshot
+from .injection_cache import get_injection, precompute_injection
+from .storage import save_screenshot, save_screenshot_content, get_screenshot_path, delete_screenshot
 
 __all__ = [
     "encrypt",
     "decrypt",
     "build_injection",
     "get_default_fingerprint",
+    "get_injection",
+    "precompute_injection",
     "save_screenshot",
+    "save_screenshot_content",
     "get_screenshot_path",
     "delete_screenshot",
 ]
@@ -0,0 +1,35 @@
+"""
+Cancelling job executions from the API. Every unfinished execution is flagged
+in Redis so a worker already running it stops (see worker.cancellation), and
+pending ones are recorded as cancelled straight away so queued work is skipped.
+"""
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from db.models import JobExecution
+from worker.cancellation import get_cancel_flags
+
+UNFINISHED_STATUSES = ("pending", "running")
+CANCEL_REASON = "Cancelled by user"
+
+
+def cancel_executions(db: Session, executions: List[Tuple[int, str]], reason: str = CANCEL_REASON) -> Dict[str, int]:
+    """
+    Cancel (job_execution_id, status) pairs; finished ones are ignored.
+    Flags are set before any row changes, so a Redis error leaves the database
+    untouched. Returns counts of executions cancelled now and of running ones
+    signalled to stop. Caller commits.
+    """
+    unfinished = [(exec_id, status) for exec_id, status in executions if status in UNFINISHED_STATUSES]
+    get_cancel_flags().request((("execution", exec_id) for exec_id, _ in unfinished), reason)
+
+    pending_ids = [exec_id for exec_id, status in unfinished if status == "pending"]
+    if pending_ids:
+        db.execute(
+            update(JobExecution)
+            .where(JobExecution.id.in_(pending_ids), JobExecution.status == "pending")
+            .values(status="cancelled", completed_at=datetime.utcnow(), error=reason)
+            .execution_options(synchronize_session=False)
+        )
+    return {"cancelled": len(pending_ids), "stopping": len(unfinished) - len(pending_ids)}
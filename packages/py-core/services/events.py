@@ -0,0 +1,78 @@
+"""
+Realtime event bus shared by the worker (publisher) and API (Socket.IO relay).
+Events travel over a Redis pub/sub channel as JSON {"event": ..., "data": ...}.
+"""
+import os
+import json
+from typing import Dict, Any, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "ntg:events")
+
+# Every client joins this room on connect, matching the old broadcast-to-all behaviour
+ALL_EVENTS_ROOM = "events:all"
+
+
+def user_room(user_id: int) -> str:
+    """Room of one user's connections; an authenticated client joins it on connect."""
+    return f"user:{int(user_id)}"
+
+
+def encode_event(event_name: str, data: Dict[str, Any]) -> str:
+    """Serialize an event for the Redis channel."""
+    return json.dumps({"event": event_name, "data": data}, default=str)
+
+
+def decode_event(raw) -> Dict[str, Any]:
+    """Parse a message published by encode_event."""
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    message = json.loads(raw)
+    if not isinstance(message, dict) or "event" not in message:
+        raise ValueError("Malformed event message")
+    return message
+
+
+def event_rooms(event_name: str, data: Dict[str, Any]) -> List[str]:
+    """
+    Socket.IO rooms an event should be delivered to. An event carrying a
+    user_id is private to that user's connections.
+    """
+    if data.get("user_id") is not None:
+        return [user_room(data["user_id"])]
+    rooms = [ALL_EVENTS_ROOM]
+    if event_name.startswith("jobExecution:"):
+        if data.get("id") is not None:
+            rooms.append(f"jobExecution:{data['id']}")
+        if data.get("job_id") is not None:
+            rooms.append(f"job:{data['job_id']}")
+    elif event_name.startswith("session:"):
+        if data.get("id") is not None:
+            rooms.append(f"session:{data['id']}")
+    if data.get("profile_id") is not None:
+        rooms.append(f"profile:{data['profile_id']}")
+    return rooms
+
+
+def subscription_rooms(request: Dict[str, Any]) -> List[str]:
+    """Rooms named by a client's subscribe/unsubscribe payload."""
+    rooms = []
+    for key, prefix in (
+        ("jobId", "job"),
+        ("jobExecutionId", "jobExecution"),
+        ("sessionId", "session"),
+        ("profileId", "profile"),
+    ):
+        value = request.get(key)
+        if value is not None:
+            rooms.append(f"{prefix}:{int(value)}")
+    if request.get("all"):
+        rooms.append(ALL_EVENTS_ROOM)
+    return rooms
+
+
+def publish_event(redis_conn, event_name: str, data: Dict[str, Any]) -> int:
+    """Publish an event; returns the number of API processes that received it."""
+    return redis_conn.publish(EVENTS_CHANNEL, encode_event(event_name, data))
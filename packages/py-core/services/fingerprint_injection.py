@@ -2,6 +2,7 @@
 Build JavaScript injection code for fingerprint spoofing in Playwright.
 Patches navigator.webdriver, user agent, canvas, webgl, media devices, etc.
 """
+import json
 from typing import Dict, Any, Optional
 
 
@@ -106,7 +107,7 @@ def build_injection(fp: Dict[str, Any]) -> str:
     }} catch (e) {{}}
     
     // Canvas fingerprint spoofing
-    if ({bool(canvas_hash)}) {{
+    if ({'true' if canvas_hash else 'false'}) {{
         const originalToDataURL = HTMLCanvasElement.prototype.toDataURL;
         const originalGetImageData = CanvasRenderingContext2D.prototype.getImageData;
         
@@ -0,0 +1,171 @@
+"""
+Cache of built fingerprint injection scripts, keyed by a hash of the fingerprint.
+Scripts are kept in a per-process LRU and, when Redis is reachable, shared
+across workers so a profile's script is built once (usually when the profile
+is saved) rather than on every job.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+from services.fingerprint_injection import build_injection
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+INJECTION_CACHE_SIZE = int(os.getenv("INJECTION_CACHE_SIZE", "1024"))
+INJECTION_CACHE_REDIS = os.getenv("INJECTION_CACHE_REDIS", "true").lower() in ("1", "true", "yes", "on")
+INJECTION_CACHE_REDIS_TTL = int(os.getenv("INJECTION_CACHE_REDIS_TTL", str(7 * 24 * 3600)))
+
+# Bump when build_injection's output changes so stale shared scripts are not reused
+INJECTION_VERSION = "2"
+REDIS_KEY_PREFIX = "ntg:fpjs:"
+# After a Redis error, stay on the local cache for this long before retrying
+REDIS_RETRY_AFTER = 30
+
+
+def normalize_fingerprint(fingerprint: Optional[Dict[str, Any]], user_agent: Optional[str] = None) -> Dict[str, Any]:
+    """Fingerprint as the worker injects it: the profile's user agent wins over the stored one."""
+    fp = dict(fingerprint or {})
+    if user_agent:
+        fp["user_agent"] = user_agent
+    return fp
+
+
+def fingerprint_key(fp: Dict[str, Any]) -> str:
+    """Content hash of a fingerprint; key order does not matter."""
+    canonical = json.dumps(fp, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{INJECTION_VERSION}:{canonical}".encode("utf-8")).hexdigest()
+
+
+class InjectionCache:
+    """LRU of built scripts with optional Redis backing."""
+
+    def __init__(self, maxsize: int = INJECTION_CACHE_SIZE, redis_client=None, redis_ttl: int = INJECTION_CACHE_REDIS_TTL):
+        self.maxsize = max(1, maxsize)
+        self.redis_ttl = redis_ttl
+        self._redis = redis_client
+        self._redis_down_until = 0.0
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "redis_hits": 0, "builds": 0, "build_ms_total": 0.0, "redis_errors": 0, "evictions": 0}
+
+    def _count(self, key: str, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _remember(self, key: str, script: str):
+        with self._lock:
+            self._data[key] = script
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _redis_call(self, method: str, *args):
+        if self._redis is None or time.monotonic() < self._redis_down_until:
+            return None
+        try:
+            return getattr(self._redis, method)(*args)
+        except Exception as e:
+            self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+            self._count("redis_errors")
+            print(f"Injection cache: Redis unavailable ({e}); using local cache only")
+            return None
+
+    def _local(self, key: str) -> Optional[str]:
+        with self._lock:
+            script = self._data.get(key)
+            if script is not None:
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+            return script
+
+    def get(self, fp: Dict[str, Any]) -> str:
+        """Built script for a fingerprint: local LRU, then Redis, then build and store."""
+        key = fingerprint_key(fp)
+        script = self._local(key)
+        if script is not None:
+            return script
+
+        raw = self._redis_call("get", REDIS_KEY_PREFIX + key)
+        if raw is not None:
+            script = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+            self._count("redis_hits")
+            self._remember(key, script)
+            return script
+
+        return self._build(key, fp)
+
+    async def aget(self, fp: Dict[str, Any]) -> str:
+        """get() for the event loop: a local hit is served inline, the Redis lookup and build run in a thread."""
+        script = self._local(fingerprint_key(fp))
+        if script is not None:
+            return script
+        return await asyncio.to_thread(self.get, fp)
+
+    def precompute(self, fp: Dict[str, Any]) -> str:
+        """Build a script ahead of time (profile create/update) and share it. Returns its key."""
+        key = fingerprint_key(fp)
+        with self._lock:
+            cached = key in self._data
+        if not cached:
+            self._build(key, fp)
+        return key
+
+    def _build(self, key: str, fp: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        script = build_injection(fp)
+        self._count("build_ms_total", (time.perf_counter() - started) * 1000)
+        self._count("builds")
+        self._remember(key, script)
+        self._redis_call("set", REDIS_KEY_PREFIX + key, script, self.redis_ttl)
+        return script
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._data)
+        lookups = stats["hits"] + stats["redis_hits"] + stats["builds"]
+        stats["build_ms_total"] = round(stats["build_ms_total"], 3)
+        stats["size"] = size
+        stats["hit_rate"] = round((stats["hits"] + stats["redis_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def _default_redis():
+    if not INJECTION_CACHE_REDIS:
+        return None
+    try:
+        from redis import Redis
+        return Redis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+    except Exception:
+        return None
+
+
+_cache: Optional[InjectionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_injection_cache() -> InjectionCache:
+    """Per-process injection cache, created lazily."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = InjectionCache(redis_client=_default_redis())
+        return _cache
+
+
+def get_injection(fingerprint: Optional[Dict[str, Any]], user_agent: Optional[str] = None) -> str:
+    """Injection script for a profile's fingerprint, built at most once per fingerprint."""
+    return get_injection_cache().get(normalize_fingerprint(fingerprint, user_agent))
+
+
+def precompute_injection(fingerprint: Optional[Dict[str, Any]], user_agent: Optional[str] = None) -> str:
+    """Build and share a profile's injection script before any job needs it."""
+    return get_injection_cache().precompute(normalize_fingerprint(fingerprint, user_agent))
@@ -0,0 +1,92 @@
+"""
+Fan-out of a Job over profiles: one JobExecution row per profile and the
+worker jobs that run them. Shared by the jobs API (immediate and one-shot
+scheduled jobs) and the worker (each run of a recurring job).
+"""
+import os
+from typing import List, Set, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from db.models import JobExecution, Profile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Profiles per worker job for run_workflow_batch (overridable per job via payload.batch_size)
+WORKFLOW_BATCH_SIZE = int(os.getenv("WORKFLOW_BATCH_SIZE", "50"))
+
+# (members, (job_type, payload)) where members are the (exec_id, profile_id) pairs the worker job covers
+FanoutItem = Tuple[List[Tuple[int, int]], Tuple[str, dict]]
+
+
+def existing_profile_ids(db: Session, profile_ids: List[int]) -> Set[int]:
+    """Return which of `profile_ids` exist, using a single IN query."""
+    if not profile_ids:
+        return set()
+    rows = db.query(Profile.id).filter(Profile.id.in_(set(profile_ids))).all()
+    return {row[0] for row in rows}
+
+
+def create_job_executions(db: Session, job_id: int, profile_ids: List[int]) -> List[Tuple[int, int]]:
+    """
+    Insert one pending JobExecution per profile with a single INSERT ... RETURNING.
+    Returns (job_execution_id, profile_id) pairs; row order is not guaranteed. Caller commits.
+    """
+    if not profile_ids:
+        return []
+    stmt = insert(JobExecution).returning(JobExecution.id, JobExecution.profile_id)
+    rows = db.execute(stmt, [
+        {"job_id": job_id, "profile_id": profile_id, "status": "pending"}
+        for profile_id in profile_ids
+    ]).all()
+    return [(row[0], row[1]) for row in rows]
+
+
+def workflow_batches(job_executions: List[Tuple[int, int]], payload: dict) -> List[FanoutItem]:
+    """
+    Split a run_workflow_batch job into worker jobs of up to `batch_size` profiles,
+    each running the workflow once-compiled across its profiles.
+    """
+    batch_size = max(1, int(payload.get("batch_size") or WORKFLOW_BATCH_SIZE))
+    ordered = sorted(job_executions)
+    batches = []
+    for start in range(0, len(ordered), batch_size):
+        members = ordered[start:start + batch_size]
+        batch_payload = {
+            "workflow_id": payload["workflow_id"],
+            "job_execution_ids": [exec_id for exec_id, _ in members],
+        }
+        for key in ("concurrency", "headless", "blocking", "persist_storage"):
+            if payload.get(key) is not None:
+                batch_payload[key] = payload[key]
+        batches.append((members, ("run_workflow_batch", batch_payload)))
+    return batches
+
+
+def fanout_jobs(job_type: str, payload: dict, job_executions: List[Tuple[int, int]]) -> List[FanoutItem]:
+    """Worker jobs that run a Job's executions; empty for job types without a per-profile run."""
+    if job_type == "run_workflow":
+        workflow_id = payload.get("workflow_id")
+        if not workflow_id:
+            return []
+        return [
+            ([(exec_id, profile_id)], ("run_workflow", {
+                "workflow_id": workflow_id,
+                "profile_id": profile_id,
+                "job_execution_id": exec_id,
+                **{
+                    key: payload[key]
+                    for key in ("blocking", "persist_storage")
+                    if payload.get(key) is not None
+                },
+            }))
+            for exec_id, profile_id in job_executions
+        ]
+    if job_type == "run_workflow_batch":
+        return workflow_batches(job_executions, payload) if payload.get("workflow_id") else []
+    if job_type == "run_job_execution":
+        return [
+            ([(exec_id, profile_id)], ("run_job_execution", {"job_execution_id": exec_id}))
+            for exec_id, profile_id in job_executions
+        ]
+    return []
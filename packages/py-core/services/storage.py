@@ -1,16 +1,51 @@
 """
 File storage utilities for screenshots and other files.
+Artifacts are content-addressed (SHA-256) and kept in hash-sharded paths on a
+storage backend: the local filesystem under SCREEN_DIR, or an S3-compatible
+bucket. A small SQLite index records every artifact and which job execution /
+profile references it, so retention can be enforced without listing the store.
+The index lives on one host, so GC only deletes from a shared bucket when
+S3_GC_DELETE says every writer uses that same index.
 """
+import io
 import os
+import time
+import sqlite3
+import hashlib
+import threading
 from pathlib import Path
-from datetime import datetime
+from contextlib import contextmanager
 from PIL import Image
-from typing import Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SCREEN_DIR = os.getenv("SCREEN_DIR", "./data/screenshots")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local | s3
+STORAGE_INDEX_PATH = os.getenv("STORAGE_INDEX_PATH", "")  # default: <SCREEN_DIR>/index.sqlite3
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "screenshots/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")  # e.g. a local MinIO: http://localhost:9000
+# GC deletes unreferenced objects from the bucket only when every host writing to it shares this index
+S3_GC_DELETE = os.getenv("S3_GC_DELETE", "false").lower() in ("1", "true", "yes", "on")
+SCREENSHOT_RETENTION_DAYS = float(os.getenv("SCREENSHOT_RETENTION_DAYS", "30"))  # 0 = keep forever
+SCREENSHOT_RETENTION_PER_PROFILE = int(os.getenv("SCREENSHOT_RETENTION_PER_PROFILE", "0"))  # 0 = no limit
+SCREENSHOT_RETENTION_BYTES = int(os.getenv("SCREENSHOT_RETENTION_BYTES", "0"))  # 0 = no limit
+
+# Chunk size for streaming artifacts out of the store
+READ_CHUNK_SIZE = 64 * 1024
+THUMBNAIL_QUALITY = 70
+
+# Unreferenced artifacts younger than this are left alone (their reference is being written)
+ORPHAN_GRACE_SECONDS = 3600
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
 
 
 def ensure_dir(path: str) -> None:
@@ -18,9 +53,547 @@ def ensure_dir(path: str) -> None:
     Path(path).mkdir(parents=True, exist_ok=True)
 
 
+def thumbnail_image(image: Image.Image, width: int) -> Image.Image:
+    """RGB thumbnail `width` px wide of the top of an image (at most 2:1 height to width)."""
+    if image.format == "JPEG":
+        # Let libjpeg decode at a reduced scale instead of full resolution
+        image.draft("RGB", (width, width * image.height // max(image.width, 1)))
+    if image.height > image.width * 2:
+        image = image.crop((0, 0, image.width, image.width * 2))
+    thumb = image.convert("RGB")
+    thumb.thumbnail((width, width * 2))
+    return thumb
+
+
+def encode_image(image: Image.Image, fmt: str, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    """Encode as "webp", "jpeg" or "png" (quality is ignored for png)."""
+    buf = io.BytesIO()
+    if fmt == "webp":
+        image.save(buf, "WEBP", quality=quality, method=4)
+    elif fmt == "jpeg":
+        image.convert("RGB").save(buf, "JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buf, "PNG", optimize=False)
+    return buf.getvalue()
+
+
+def artifact_key(digest: str, ext: str) -> str:
+    """Two-level sharded key for a content hash: ab/cd/abcd....ext"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+class LocalBackend:
+    """Artifacts as files under a root directory."""
+
+    name = "local"
+    shared = False  # Only this host's index writes here
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        path = self.path(key)
+        ensure_dir(str(path.parent))
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)  # Atomic: a concurrent reader never sees a partial file
+
+    def get(self, key: str) -> bytes:
+        return self.path(key).read_bytes()
+
+    def read_range(self, key: str, start: int, end: int, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive) in chunks without reading the whole file."""
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def delete(self, key: str):
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        return str(self.path(key))
+
+
+class S3Backend:
+    """
+    Artifacts in an S3-compatible bucket (AWS S3, MinIO, ...).
+    `client` is a boto3 S3 client; one is created from S3_ENDPOINT_URL when not given.
+    """
+
+    name = "s3"
+    shared = True  # Other hosts, with their own index, may write and reference the same keys
+
+    def __init__(self, bucket: str, prefix: str = S3_PREFIX, client=None, endpoint_url: Optional[str] = None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url or S3_ENDPOINT_URL or None)
+        if not bucket:
+            raise ValueError("S3 storage requires a bucket (S3_BUCKET)")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, **extra)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+
+    def read_range(self, key: str, start: int, end: int, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key, Range=f"bytes={start}-{end}")["Body"]
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except Exception:
+            return False
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+
+class ArtifactIndex:
+    """
+    SQLite index of stored artifacts and their references.
+    artifacts: one row per stored key. refs: one row per saved screenshot
+    (key plus its thumbnail), with the job execution and profile it belongs to.
+    derived: cached variants (resized thumbnails) kept as long as their source.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            key TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS refs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL,
+            thumbnail_key TEXT,
+            job_exec_id INTEGER,
+            profile_id INTEGER,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS derived (
+            source_key TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (source_key, variant)
+        );
+        CREATE INDEX IF NOT EXISTS derived_key ON derived (key);
+        CREATE INDEX IF NOT EXISTS refs_key ON refs (key);
+        CREATE INDEX IF NOT EXISTS refs_thumbnail_key ON refs (thumbnail_key);
+        CREATE INDEX IF NOT EXISTS refs_profile ON refs (profile_id, created_at);
+        CREATE INDEX IF NOT EXISTS refs_created ON refs (created_at);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            ensure_dir(str(Path(path).parent))
+        self._lock = threading.Lock()
+        # One connection shared by the process' threads; WAL lets the API and workers read while one writes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction, exclusive across this process' threads and other processes on the index."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def add_artifact(
+        self,
+        key: str,
+        sha256: str,
+        size: int,
+        content_type: Optional[str],
+        link: Optional[Callable[[sqlite3.Connection, str], None]] = None,
+    ) -> bool:
+        """Record an artifact and run `link` in the same transaction. Returns False if it was already indexed."""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO artifacts (key, sha256, size, content_type, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sha256, size, content_type, time.time()),
+            )
+            if link:
+                link(conn, key)
+            return cursor.rowcount == 1
+
+    def link_existing(self, key: str, link: Optional[Callable[[sqlite3.Connection, str], None]] = None) -> bool:
+        """
+        If `key` is indexed, run `link` in the same transaction and return True.
+        GC removes artifacts in a transaction too, so a linked artifact is never deleted as an orphan.
+        A hit also restarts the orphan grace period, covering a reference written after put() returns.
+        """
+        with self.transaction() as conn:
+            if conn.execute("UPDATE artifacts SET created_at = ? WHERE key = ?", (time.time(), key)).rowcount == 0:
+                return False
+            if link:
+                link(conn, key)
+            return True
+
+    def has(self, key: str) -> bool:
+        return bool(self.execute("SELECT 1 FROM artifacts WHERE key = ?", (key,)))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        rows = self.execute("SELECT key, sha256, size, content_type, created_at FROM artifacts WHERE key = ?", (key,))
+        if not rows:
+            return None
+        return dict(zip(("key", "sha256", "size", "content_type", "created_at"), rows[0]))
+
+    @staticmethod
+    def insert_ref(conn, key: str, thumbnail_key: Optional[str], job_exec_id: Optional[int], profile_id: Optional[int]):
+        conn.execute(
+            "INSERT INTO refs (key, thumbnail_key, job_exec_id, profile_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, thumbnail_key, job_exec_id, profile_id, time.time()),
+        )
+
+    @staticmethod
+    def insert_derived(conn, source_key: str, variant: str, key: str):
+        conn.execute("INSERT OR REPLACE INTO derived (source_key, variant, key) VALUES (?, ?, ?)", (source_key, variant, key))
+
+    def add_ref(self, key: str, thumbnail_key: Optional[str], job_exec_id: Optional[int], profile_id: Optional[int]):
+        with self._lock:
+            self.insert_ref(self._conn, key, thumbnail_key, job_exec_id, profile_id)
+
+    def get_derived(self, source_key: str, variant: str) -> Optional[str]:
+        rows = self.execute(
+            "SELECT d.key FROM derived d JOIN artifacts a ON a.key = d.key WHERE d.source_key = ? AND d.variant = ?",
+            (source_key, variant),
+        )
+        return rows[0][0] if rows else None
+
+    def add_derived(self, source_key: str, variant: str, key: str):
+        with self._lock:
+            self.insert_derived(self._conn, source_key, variant, key)
+
+    @staticmethod
+    def _remove(conn, key: str):
+        # Variants of a removed source become orphans and go in the next GC pass
+        conn.execute("DELETE FROM derived WHERE source_key = ?", (key,))
+        conn.execute("DELETE FROM refs WHERE key = ?", (key,))
+        conn.execute("UPDATE refs SET thumbnail_key = NULL WHERE thumbnail_key = ?", (key,))
+        conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+
+    def remove_ref(self, key: str, job_exec_id: Optional[int] = None) -> bool:
+        """Drop the newest reference to `key` (of `job_exec_id` if given). Returns False if there was none."""
+        with self.transaction() as conn:
+            sql, params = "SELECT id FROM refs WHERE key = ?", [key]
+            if job_exec_id is not None:
+                sql += " AND job_exec_id = ?"
+                params.append(job_exec_id)
+            rows = conn.execute(sql + " ORDER BY created_at DESC, id DESC LIMIT 1", params).fetchall()
+            if not rows:
+                return False
+            conn.execute("DELETE FROM refs WHERE id = ?", (rows[0][0],))
+            return True
+
+    def remove_orphan(self, key: str, delete: Callable[[str], None], grace_seconds: float = ORPHAN_GRACE_SECONDS) -> Optional[int]:
+        """
+        Delete an artifact (`delete(key)` on the backend, then its rows) if it is still an
+        orphan past the grace period, all inside one transaction. Returns its size, or None if it was kept.
+        """
+        with self.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT size FROM artifacts a WHERE key = ? AND created_at < ? AND {self.UNREFERENCED}",
+                (key, time.time() - grace_seconds),
+            ).fetchall()
+            if not rows:
+                return None
+            delete(key)
+            self._remove(conn, key)
+            return rows[0][0]
+
+    def expire_refs(self, max_age_days: float = 0, per_profile: int = 0, total_bytes: int = 0) -> int:
+        """Drop references outside the retention policy, oldest first. Returns refs removed."""
+        removed = 0
+        with self._lock:
+            conn = self._conn
+            if max_age_days:
+                cutoff = time.time() - max_age_days * 86400
+                removed += conn.execute("DELETE FROM refs WHERE created_at < ?", (cutoff,)).rowcount
+            if per_profile:
+                removed += conn.execute(
+                    """
+                    DELETE FROM refs WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (PARTITION BY profile_id ORDER BY created_at DESC, id DESC) AS rank
+                            FROM refs WHERE profile_id IS NOT NULL
+                        ) WHERE rank > ?
+                    )
+                    """,
+                    (per_profile,),
+                ).rowcount
+            if total_bytes:
+                # Walk refs newest first and drop every ref past the point where the
+                # artifacts they reference (counted once each) exceed the budget
+                rows = conn.execute(
+                    """
+                    SELECT r.id, r.key, a.size, r.thumbnail_key, t.size
+                    FROM refs r
+                    LEFT JOIN artifacts a ON a.key = r.key
+                    LEFT JOIN artifacts t ON t.key = r.thumbnail_key
+                    ORDER BY r.created_at DESC, r.id DESC
+                    """
+                ).fetchall()
+                seen, used, expired = set(), 0, []
+                for ref_id, key, size, thumb_key, thumb_size in rows:
+                    added = 0
+                    for k, s in ((key, size), (thumb_key, thumb_size)):
+                        if k and k not in seen:
+                            added += s or 0
+                    if used + added > total_bytes:
+                        expired.append((ref_id,))
+                        continue
+                    used += added
+                    seen.update(k for k in (key, thumb_key) if k)
+                conn.executemany("DELETE FROM refs WHERE id = ?", expired)
+                removed += len(expired)
+        return removed
+
+    # Condition on artifacts row `a` that nothing references it
+    UNREFERENCED = """
+        NOT EXISTS (SELECT 1 FROM refs WHERE refs.key = a.key)
+        AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.thumbnail_key = a.key)
+        AND NOT EXISTS (SELECT 1 FROM derived WHERE derived.key = a.key)
+    """
+
+    def orphans(self, grace_seconds: float = ORPHAN_GRACE_SECONDS) -> List[str]:
+        """Artifacts no ref points at, older than the grace period."""
+        return [row[0] for row in self.execute(
+            f"SELECT key FROM artifacts a WHERE created_at < ? AND {self.UNREFERENCED}",
+            (time.time() - grace_seconds,),
+        )]
+
+    def stats(self) -> Dict[str, Any]:
+        count, size = self.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts")[0]
+        refs = self.execute("SELECT COUNT(*) FROM refs")[0][0]
+        return {"artifacts": count, "bytes": size, "refs": refs}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ScreenshotStore:
+    """
+    Content-addressed artifact store: a backend for bytes plus the index for metadata and retention.
+    gc_delete: whether GC may delete from the backend; off for a shared bucket unless
+    every host writing to it uses this index (S3_GC_DELETE).
+    """
+
+    def __init__(self, backend, index: ArtifactIndex, gc_delete: Optional[bool] = None):
+        self.backend = backend
+        self.index = index
+        self.gc_delete = (not backend.shared or S3_GC_DELETE) if gc_delete is None else gc_delete
+
+    def put(self, data: bytes, ext: str, link: Optional[Callable[[sqlite3.Connection, str], None]] = None) -> Dict[str, Any]:
+        """
+        Store bytes under their hash. Returns {"key", "sha256", "bytes", "deduplicated"}.
+        `link(conn, key)` records what uses the artifact (see ArtifactIndex.insert_ref) in the
+        transaction that finds or adds it, so GC cannot delete it in between.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        key = artifact_key(digest, ext)
+        # The index answers "already stored?" without touching the backend
+        deduplicated = self.index.link_existing(key, link)
+        if not deduplicated:
+            content_type = CONTENT_TYPES.get(ext)
+            self.backend.put(key, data, content_type)
+            self.index.add_artifact(key, digest, len(data), content_type, link)
+        return {"key": key, "sha256": digest, "bytes": len(data), "deduplicated": deduplicated}
+
+    def reference(self, key: str, thumbnail_key: Optional[str] = None, job_exec_id: Optional[int] = None, profile_id: Optional[int] = None):
+        """Record that a job execution uses a stored artifact (and its thumbnail)."""
+        self.index.add_ref(key, thumbnail_key, job_exec_id, profile_id)
+
+    def unreference(self, key: str, job_exec_id: Optional[int] = None) -> bool:
+        """
+        Drop one reference to an artifact. Other executions may share it, so the
+        bytes stay until GC finds the artifact unreferenced.
+        """
+        return self.index.remove_ref(key, job_exec_id)
+
+    def describe(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Index metadata of an artifact, or for a file the index does not know (e.g. a
+        legacy screenshots/job_exec_*.png) metadata computed from the backend; None if
+        neither has it. Unindexed files are not adopted, so GC never deletes them. Blocking.
+        """
+        meta = self.index.get(key)
+        if meta is not None:
+            return meta
+        if not key or key.startswith("/") or ".." in Path(key).parts:
+            return None
+        try:
+            data = self.backend.get(key)
+        except Exception:
+            return None
+        ext = key.rsplit(".", 1)[-1].lower() if "." in key else ""
+        return {
+            "key": key,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "content_type": CONTENT_TYPES.get(ext),
+            "created_at": None,
+        }
+
+    def read_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        """Stream part of an artifact from the backend."""
+        return self.backend.read_range(key, start, end)
+
+    def thumbnail(self, key: str, width: int) -> str:
+        """
+        Key of a WebP thumbnail of `key` at `width` px, generated on first use and
+        cached in the store as a derived artifact. Blocking (image decode/encode).
+        """
+        variant = f"w{width}"
+        cached = self.index.get_derived(key, variant)
+        if cached:
+            return cached
+
+        thumb = thumbnail_image(Image.open(io.BytesIO(self.backend.get(key))), width)
+        info = self.put(encode_image(thumb, "webp"), "webp", lambda conn, thumb_key: self.index.insert_derived(conn, key, variant, thumb_key))
+        return info["key"]
+
+    def gc(
+        self,
+        max_age_days: float = SCREENSHOT_RETENTION_DAYS,
+        per_profile: int = SCREENSHOT_RETENTION_PER_PROFILE,
+        total_bytes: int = SCREENSHOT_RETENTION_BYTES,
+        grace_seconds: float = ORPHAN_GRACE_SECONDS,
+    ) -> Dict[str, Any]:
+        """
+        Apply retention, then delete artifacts nothing references anymore.
+        Without gc_delete, orphans are only counted and stay in the store.
+        """
+        started = time.perf_counter()
+        refs_removed = self.index.expire_refs(max_age_days, per_profile, total_bytes)
+        orphans = self.index.orphans(grace_seconds)
+        deleted, freed = 0, 0
+        for key in orphans if self.gc_delete else []:
+            try:
+                size = self.index.remove_orphan(key, self.backend.delete, grace_seconds)
+            except Exception as e:
+                print(f"Failed to delete artifact {key}: {e}")
+                continue
+            if size is not None:
+                deleted += 1
+                freed += size
+        return {
+            "refs_removed": refs_removed,
+            "artifacts_deleted": deleted,
+            "orphans_kept": 0 if self.gc_delete else len(orphans),
+            "bytes_freed": freed,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend.name, **self.index.stats()}
+
+
+_store: Optional[ScreenshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_screenshot_store() -> ScreenshotStore:
+    """Per-process screenshot store for the configured backend, created lazily."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if STORAGE_BACKEND == "s3":
+                backend = S3Backend(S3_BUCKET, S3_PREFIX)
+            else:
+                backend = LocalBackend(SCREEN_DIR)
+            index = ArtifactIndex(STORAGE_INDEX_PATH or os.path.join(SCREEN_DIR, "index.sqlite3"))
+            _store = ScreenshotStore(backend, index)
+        return _store
+
+
+def screenshot_store_stats() -> Optional[Dict[str, Any]]:
+    """Stats of the screenshot store if this process has opened it (without opening it)."""
+    with _store_lock:
+        store = _store
+    return store.stats() if store else None
+
+
+def _key_from_path(relative_path: str) -> str:
+    # Stored paths are prefixed with "screenshots/"
+    parts = Path(relative_path).parts
+    if parts and parts[0] == "screenshots":
+        parts = parts[1:]
+    return "/".join(parts)
+
+
+def save_screenshot_content(
+    screenshot_bytes: bytes,
+    format: str = "png",
+    job_exec_id: Optional[int] = None,
+    profile_id: Optional[int] = None,
+    thumbnail_key: Optional[str] = None,
+    reference: bool = True,
+) -> Dict[str, Any]:
+    """
+    Save image bytes under their content hash, so identical screenshots are stored once.
+    Returns {"path", "key", "sha256", "bytes", "deduplicated"}; path is relative like save_screenshot's.
+    With reference=False the artifact is only stored (e.g. a thumbnail referenced with its screenshot).
+    """
+    store = get_screenshot_store()
+    link = None
+    if reference:
+        def link(conn, key):
+            store.index.insert_ref(conn, key, thumbnail_key, job_exec_id, profile_id)
+    info = store.put(screenshot_bytes, format, link)
+    info["path"] = "screenshots/" + info["key"]
+    return info
+
+
 def save_screenshot(job_exec_id: int, screenshot_bytes: bytes, format: str = "png") -> str:
     """
-    Save screenshot to disk.
+    Save screenshot to the store.
     Args:
         job_exec_id: Job execution ID
         screenshot_bytes: Raw image bytes
@@ -28,42 +601,26 @@ def save_screenshot(job_exec_id: int, screenshot_bytes: bytes, format: str = "pn
     Returns:
         Relative path to saved screenshot
     """
-    ensure_dir(SCREEN_DIR)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"job_exec_{job_exec_id}_{timestamp}.{format}"
-    filepath = os.path.join(SCREEN_DIR, filename)
-    
-    # Save image
-    with open(filepath, "wb") as f:
-        f.write(screenshot_bytes)
-    
-    # Return relative path for storage in DB
-    return os.path.join("screenshots", filename)
+    return save_screenshot_content(screenshot_bytes, format, job_exec_id=job_exec_id)["path"]
 
 
 def get_screenshot_path(relative_path: str) -> Optional[str]:
-    """Get full path to screenshot from relative path."""
+    """Get full path to screenshot from relative path (local backend only)."""
     if not relative_path:
         return None
-    
+
     # If already absolute, return as is
     if os.path.isabs(relative_path):
         return relative_path if os.path.exists(relative_path) else None
-    
-    # Otherwise, resolve from SCREEN_DIR
-    full_path = os.path.join(SCREEN_DIR, relative_path)
+
+    # Otherwise, resolve from the local store
+    full_path = os.path.join(SCREEN_DIR, _key_from_path(relative_path))
     return full_path if os.path.exists(full_path) else None
 
 
-def delete_screenshot(relative_path: str) -> bool:
-    """Delete screenshot file."""
-    full_path = get_screenshot_path(relative_path)
-    if full_path and os.path.exists(full_path):
-        try:
-            os.remove(full_path)
-            return True
-        except Exception:
-            return False
-    return False
-
+def delete_screenshot(relative_path: str, job_exec_id: Optional[int] = None) -> bool:
+    """
+    Drop a saved screenshot's reference (the one of `job_exec_id` if given).
+    The file is deleted by GC once nothing references it anymore.
+    """
+    return get_screenshot_store().unreference(_key_from_path(relative_path), job_exec_id)
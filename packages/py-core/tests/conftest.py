@@ -0,0 +1,20 @@
+"""
+Shared test fixtures.
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db.models import Base
+
+
+@pytest.fixture
+def sqlite_db():
+    """In-memory SQLite session with all tables created."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
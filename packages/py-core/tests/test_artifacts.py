@@ -0,0 +1,127 @@
+"""
+Tests for the job execution artifact endpoint.
+"""
+import io
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from db.models import Base, JobExecution
+from db.database import get_db
+from api.middleware import get_current_user
+from api.routes import job_executions
+from services import storage
+
+
+def jpeg(width=1000, height=3000):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (20, 120, 200)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = storage.ScreenshotStore(storage.LocalBackend(str(tmp_path)), storage.ArtifactIndex(":memory:"))
+    monkeypatch.setattr(storage, "_store", store)
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+
+    image = store.put(jpeg(), "jpg")
+    db.add(JobExecution(id=1, job_id=1, profile_id=1, status="completed", result={
+        "screenshot": "screenshots/" + image["key"],
+        "screenshot_info": {"key": image["key"]},
+        "results": [{"node_id": "n2", "result": {"key": image["key"]}}],
+    }))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(job_executions.router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: None
+    try:
+        yield TestClient(app), store, image
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def test_parse_range():
+    """Test byte range parsing, including suffix, open-ended and ignored forms."""
+    assert job_executions.parse_range(None, 100) is None
+    assert job_executions.parse_range("bytes=0-9", 100) == (0, 9)
+    assert job_executions.parse_range("bytes=90-", 100) == (90, 99)
+    assert job_executions.parse_range("bytes=-10", 100) == (90, 99)
+    assert job_executions.parse_range("bytes=50-500", 100) == (50, 99)
+    assert job_executions.parse_range("bytes=0-1,5-6", 100) is None
+    assert job_executions.parse_range("bytes=x-1", 100) is None
+    with pytest.raises(ValueError):
+        job_executions.parse_range("bytes=100-", 100)
+
+
+def test_full_range_and_etag(client):
+    """Test streaming the whole file, a partial range, and 304 on a matching ETag."""
+    http, store, image = client
+    data = store.backend.get(image["key"])
+
+    full = http.get("/api/job-executions/1/artifacts/screenshot")
+    assert full.status_code == 200 and full.content == data
+    assert full.headers["etag"] == f'"{image["sha256"]}"'
+    assert full.headers["content-type"] == "image/jpeg"
+    assert full.headers["accept-ranges"] == "bytes"
+
+    part = http.get("/api/job-executions/1/artifacts/nodes/n2", headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.content == data[10:20]
+    assert part.headers["content-range"] == f"bytes 10-19/{len(data)}"
+
+    bad = http.get("/api/job-executions/1/artifacts/screenshot", headers={"Range": f"bytes={len(data)}-"})
+    assert bad.status_code == 416
+
+    cached = http.get("/api/job-executions/1/artifacts/screenshot", headers={"If-None-Match": full.headers["etag"]})
+    assert cached.status_code == 304 and cached.content == b""
+
+    assert http.get("/api/job-executions/1/artifacts/missing").status_code == 404
+    assert http.get("/api/job-executions/2/artifacts/screenshot").status_code == 404
+
+
+def test_thumbnail_width_is_generated_once(client):
+    """Test that ?width= rounds up to a configured size and reuses the cached variant."""
+    http, store, image = client
+    first = http.get("/api/job-executions/1/artifacts/screenshot?width=300")
+    assert first.status_code == 200 and first.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(first.content)).size == (320, 640)
+
+    second = http.get("/api/job-executions/1/artifacts/screenshot?width=320")
+    assert second.headers["etag"] == first.headers["etag"]
+    assert store.stats()["artifacts"] == 2
+
+    # Variants live as long as their source
+    store.index.execute("UPDATE artifacts SET created_at = created_at - 7200")
+    assert store.gc(max_age_days=0)["artifacts_deleted"] == 1
+
+
+def test_legacy_screenshot_outside_the_index(client, tmp_path):
+    """Test that a pre-store result (screenshots/job_exec_*.png) is served from the backend and never adopted."""
+    http, store, _ = client
+    legacy = b"\x89PNG legacy bytes"
+    (tmp_path / "job_exec_7_1690000000.png").write_bytes(legacy)
+    db = http.app.dependency_overrides[job_executions.get_db]()
+    db.add(JobExecution(id=7, job_id=1, profile_id=1, status="completed", result={
+        "screenshot": "screenshots/job_exec_7_1690000000.png",
+    }))
+    db.commit()
+
+    full = http.get("/api/job-executions/7/artifacts/screenshot")
+    assert full.status_code == 200 and full.content == legacy
+    assert full.headers["content-type"] == "image/png"
+    part = http.get("/api/job-executions/7/artifacts/screenshot", headers={"Range": "bytes=0-3"})
+    assert part.status_code == 206 and part.content == legacy[:4]
+    assert http.get("/api/job-executions/7/artifacts/screenshot", headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+    assert not store.index.has("job_exec_7_1690000000.png")
+
+    (tmp_path / "job_exec_7_1690000000.png").unlink()
+    assert http.get("/api/job-executions/7/artifacts/screenshot").status_code == 404
@@ -0,0 +1,98 @@
+"""
+Tests for the token/user caches behind get_current_user.
+"""
+import time
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event
+from api import auth_cache
+from api.auth import generate_token
+from api.auth_cache import TTLCache
+from api.middleware import get_current_user
+from db.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    auth_cache.token_cache.clear()
+    auth_cache.user_cache.clear()
+    yield
+
+
+def credentials(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def count_queries(db, fn):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def test_ttl_cache_lru_eviction():
+    """Test that the least recently used entry is evicted first."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expiry():
+    """Test that entries expire after their TTL."""
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_second_request_skips_database(sqlite_db):
+    """Test that a repeated token resolves the user without a query."""
+    user = User(username="admin", password="hash", role="admin")
+    sqlite_db.add(user)
+    sqlite_db.commit()
+    token = generate_token(user.id, user.username)
+
+    first, first_queries = count_queries(sqlite_db, lambda: get_current_user(credentials(token), sqlite_db))
+    second, second_queries = count_queries(sqlite_db, lambda: get_current_user(credentials(token), sqlite_db))
+
+    assert first.username == second.username == "admin"
+    assert first_queries == 1
+    assert second_queries == 0
+    assert second.password is None
+    assert auth_cache.auth_cache_stats()["users"]["hits"] == 1
+
+
+def test_user_delete_invalidates(sqlite_db):
+    """Test that deleting a user evicts it so cached tokens stop working."""
+    user = User(username="gone", password="hash")
+    sqlite_db.add(user)
+    sqlite_db.commit()
+    token = generate_token(user.id, user.username)
+    get_current_user(credentials(token), sqlite_db)
+
+    sqlite_db.delete(user)
+    sqlite_db.commit()
+
+    with pytest.raises(HTTPException) as exc_info:
+        get_current_user(credentials(token), sqlite_db)
+    assert exc_info.value.status_code == 401
+
+
+def test_invalid_token_rejected(sqlite_db):
+    """Test that bad tokens are never cached as valid."""
+    with pytest.raises(HTTPException):
+        get_current_user(credentials("not-a-token"), sqlite_db)
+    assert auth_cache.token_cache.stats()["size"] == 0
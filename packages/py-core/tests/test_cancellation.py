@@ -0,0 +1,200 @@
+"""
+Tests for cooperative cancellation of job executions.
+"""
+import asyncio
+import time
+import pytest
+from db.models import Job, JobExecution, Profile, Workflow
+from services.cancellation import cancel_executions
+from worker import cancellation, readiness, run_job
+from worker.cancellation import CancelFlags, CancelScope, JobCancelled, cancel_key, check_cancelled
+from worker.workflow_executor import execute_workflow
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None):
+        self.redis.data[key] = value.encode()
+
+    def execute(self):
+        return []
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def mget(self, keys):
+        self.reads += 1
+        return [self.data.get(key) for key in keys]
+
+
+@pytest.fixture
+def flags(monkeypatch):
+    flags = CancelFlags(FakeRedis())
+    monkeypatch.setattr(cancellation, "_flags", flags)
+    return flags
+
+
+def test_watcher_interrupts_a_stuck_wait(flags):
+    """Test that a flag set mid-wait ends the scope with JobCancelled within the poll interval."""
+    async def main():
+        async def cancel_soon():
+            await asyncio.sleep(0.05)
+            flags.request([("execution", 1)], "Stop it")
+
+        asyncio.ensure_future(cancel_soon())
+        started = time.monotonic()
+        with pytest.raises(JobCancelled, match="Stop it"):
+            async with CancelScope([("execution", 1)], interval=0.01):
+                await asyncio.sleep(30)  # e.g. a navigation that never settles
+        elapsed = time.monotonic() - started
+        # The task itself is not left cancelled and can record the outcome
+        await asyncio.sleep(0)
+        return elapsed
+
+    assert asyncio.run(main()) < 1
+
+
+def test_watcher_without_task_uncancel(flags, monkeypatch):
+    """Test the interruption on Pythons whose tasks have no uncancel() (before 3.11)."""
+    class OldTask:
+        def __init__(self, task):
+            self.cancel = task.cancel
+
+    current_task = asyncio.current_task
+    monkeypatch.setattr(asyncio, "current_task", lambda: OldTask(current_task()))
+
+    async def main():
+        flags_set = asyncio.get_running_loop().call_later(0.02, flags.request, [("execution", 2)])
+        with pytest.raises(JobCancelled):
+            async with CancelScope([("execution", 2)], interval=0.01):
+                await asyncio.sleep(30)
+        flags_set.cancel()
+
+    asyncio.run(main())
+
+
+def test_scope_entry_and_checks(flags):
+    """Test that flagged work never starts, and checks are no-ops outside a scope."""
+    check_cancelled()
+    flags.request([("session", 3)])
+
+    async def main():
+        async with CancelScope([("session", 3)], interval=0):
+            pass
+
+    with pytest.raises(JobCancelled, match="Cancelled"):
+        asyncio.run(main())
+    with pytest.raises(ValueError):
+        cancel_key("job", 1)
+
+
+def test_workflow_stops_between_nodes(flags):
+    """Test that execute_workflow checks the flag before each node and does not swallow it."""
+    workflow = {
+        "nodes": [{"id": "a", "type": "start"}, {"id": "b", "type": "merge"}, {"id": "c", "type": "end"}],
+        "edges": [{"source": "a", "target": "b"}, {"source": "b", "target": "c"}],
+    }
+
+    async def main():
+        async with CancelScope([("execution", 5)], interval=0):
+            assert (await execute_workflow(None, workflow))["success"]
+            flags.request([("execution", 5)])
+            await execute_workflow(None, workflow)
+
+    with pytest.raises(JobCancelled):
+        asyncio.run(main())
+
+
+def test_cancel_executions_and_batch(sqlite_db, flags, monkeypatch):
+    """Test that the API cancels pending rows, flags running ones, and a batch stops only the flagged profile."""
+    sqlite_db.add_all([Profile(id=i, name=f"p{i}") for i in range(1, 5)])
+    sqlite_db.add(Workflow(id=1, name="wf", data={"nodes": [{"id": "s", "type": "start"}], "edges": []}))
+    sqlite_db.add(Job(id=1, type="run_workflow_batch", payload={"workflow_id": 1}))
+    statuses = {1: "pending", 2: "running", 3: "running", 4: "completed"}
+    sqlite_db.add_all([JobExecution(id=i, job_id=1, profile_id=i, status=s) for i, s in statuses.items()])
+    sqlite_db.commit()
+
+    counts = cancel_executions(sqlite_db, [(1, "pending"), (2, "running"), (4, "completed")])
+    sqlite_db.commit()
+    assert counts == {"cancelled": 1, "stopping": 1}
+    assert set(flags.redis.data) == {cancel_key("execution", 1), cancel_key("execution", 2)}
+
+    class FakeExecutor:
+        class browser_pool:
+            stats = staticmethod(dict)
+
+    ran = []
+
+    async def fake_run(pool, plan, profile, proxy_config, kind="headed", blocking=None, persist_storage=True):
+        ran.append(profile.id)
+        await asyncio.sleep(0.01)
+        return {"success": True, "results": []}
+
+    monkeypatch.setattr(run_job, "run_workflow_for_profile", fake_run)
+    monkeypatch.setattr(run_job, "get_executor", lambda: FakeExecutor())
+    monkeypatch.setattr(run_job, "emit_event", lambda *args: None)
+    monkeypatch.setattr(run_job, "log_to_db", lambda *args, **kwargs: None)
+
+    summary = asyncio.run(run_job.handle_run_workflow_batch({"workflow_id": 1, "job_execution_ids": [1, 2, 3]}, sqlite_db))
+    assert summary["profiles"] == 2 and summary["cancelled"] == 1 and summary["completed"] == 1
+    assert ran == [3]  # 1 was already cancelled, 2 stopped before opening a browser
+
+    sqlite_db.expire_all()
+    rows = {e.id: (e.status, e.error) for e in sqlite_db.query(JobExecution).all()}
+    assert rows[1] == ("cancelled", "Cancelled by user") and rows[2] == ("cancelled", "Cancelled by user")
+    assert rows[3][0] == "completed" and rows[4][0] == "completed"
+
+
+def test_cancel_during_navigation_marks_workflow_cancelled(sqlite_db, flags, monkeypatch):
+    """Test that a cancel raised inside an openPage node cancels the execution instead of failing the node."""
+    sqlite_db.add(Profile(id=1, name="p"))
+    sqlite_db.add(Workflow(id=2, name="nav", data={
+        "nodes": [{"id": "open", "type": "openPage", "data": {"config": {"url": "https://a.example"}}}],
+        "edges": [],
+    }))
+    sqlite_db.add(Job(id=1, type="run_workflow", payload={}))
+    sqlite_db.add(JobExecution(id=1, job_id=1, profile_id=1, status="pending"))
+    sqlite_db.commit()
+
+    async def throttle(url):
+        # The user cancels while the navigation waits for its rate-limit slot
+        flags.request([("execution", 1)], "Stop it")
+        return 0
+
+    class FakePage:
+        url = "about:blank"
+
+        async def goto(self, url, **kwargs):
+            raise AssertionError("navigation started after the cancel")
+
+    class FakeExecutor:
+        class browser_pool:
+            stats = staticmethod(dict)
+
+    async def fake_run(pool, plan, profile, proxy_config, kind="headed", blocking=None, persist_storage=True):
+        return await execute_workflow(FakePage(), plan)
+
+    monkeypatch.setattr(readiness, "throttle", throttle)
+    monkeypatch.setattr(run_job, "run_workflow_for_profile", fake_run)
+    monkeypatch.setattr(run_job, "get_executor", lambda: FakeExecutor())
+    monkeypatch.setattr(run_job, "emit_event", lambda *args: None)
+    monkeypatch.setattr(run_job, "log_to_db", lambda *args, **kwargs: None)
+
+    result = asyncio.run(run_job.handle_run_workflow({"workflow_id": 2, "profile_id": 1, "job_execution_id": 1}, sqlite_db))
+    assert result.get("cancelled") is True
+    sqlite_db.expire_all()
+    assert (sqlite_db.get(JobExecution, 1).status, sqlite_db.get(JobExecution, 1).error) == ("cancelled", "Stop it")
@@ -0,0 +1,47 @@
+"""
+Tests for database pool configuration and statistics.
+"""
+from sqlalchemy import text
+import db.database as database
+
+
+def test_pool_settings_defaults():
+    """Test that each profile resolves to a full set of pool settings."""
+    for profile in ("api", "worker"):
+        settings = database.get_pool_settings(profile)
+        assert set(settings) == {"pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"}
+
+
+def test_pool_settings_env_override(monkeypatch):
+    """Test that env vars override only their own profile."""
+    monkeypatch.setenv("WORKER_DB_POOL_SIZE", "3")
+    monkeypatch.setenv("WORKER_DB_POOL_PRE_PING", "false")
+
+    worker = database.get_pool_settings("worker")
+    api = database.get_pool_settings("api")
+
+    assert worker["pool_size"] == 3
+    assert worker["pool_pre_ping"] is False
+    assert api["pool_size"] == database.POOL_DEFAULTS["api"]["pool_size"]
+
+
+def test_pool_status_tracks_checkouts(monkeypatch, tmp_path):
+    """Test that pool_status reports checked-out connections and wait time."""
+    engine = database.create_db_engine("worker", f"sqlite:///{tmp_path / 'pool.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        status = database.pool_status()
+        assert status["checked_out"] == 1
+        assert status["checkouts"] == 1
+
+    status = database.pool_status()
+    assert status["checked_out"] == 0
+    assert status["wait_ms_max"] >= 0
+    engine.dispose()
+
+
+def test_worker_pool_covers_concurrency():
+    """Test that the worker pool has a connection per concurrent job and some headroom."""
+    assert database.get_pool_settings("worker")["pool_size"] > database.WORKER_CONCURRENCY
@@ -0,0 +1,103 @@
+"""
+Tests for realtime event encoding and room routing.
+"""
+import time
+import asyncio
+import pytest
+from api import auth_cache, realtime
+from api.auth import generate_token
+from api.realtime import connect_token
+from db.models import User
+from worker import run_job
+from services.events import (
+    ALL_EVENTS_ROOM,
+    encode_event,
+    decode_event,
+    event_rooms,
+    subscription_rooms,
+    user_room,
+)
+
+
+def test_encode_decode_roundtrip():
+    """Test that events survive the trip through the Redis channel."""
+    raw = encode_event("jobExecution:update", {"id": 1, "status": "running"})
+    message = decode_event(raw.encode("utf-8"))
+
+    assert message == {"event": "jobExecution:update", "data": {"id": 1, "status": "running"}}
+
+
+def test_decode_rejects_malformed():
+    """Test that non-event payloads are rejected."""
+    with pytest.raises(ValueError):
+        decode_event('["not", "an", "event"]')
+
+
+def test_job_execution_rooms():
+    """Test that execution events reach the execution, job, profile and firehose rooms."""
+    rooms = event_rooms("jobExecution:update", {"id": 7, "job_id": 3, "profile_id": 9})
+
+    assert rooms == [ALL_EVENTS_ROOM, "jobExecution:7", "job:3", "profile:9"]
+
+
+def test_session_rooms():
+    """Test that session events reach the session room."""
+    assert "session:4" in event_rooms("session:update", {"id": 4})
+
+
+def test_subscription_rooms():
+    """Test that client subscribe payloads map to the same room names."""
+    assert subscription_rooms({"jobId": "3", "sessionId": 4}) == ["job:3", "session:4"]
+    assert subscription_rooms({"all": True}) == [ALL_EVENTS_ROOM]
+    with pytest.raises(ValueError):
+        subscription_rooms({"jobId": "abc"})
+
+
+def test_private_events_go_to_their_user():
+    """Test that an event carrying a user_id reaches only that user's room."""
+    assert event_rooms("jobExecution:update", {"id": 7, "user_id": 2}) == [user_room(2)]
+
+
+def test_connect_token():
+    """Test that the connect payload must carry a token, with or without the Bearer prefix."""
+    assert connect_token({"token": "Bearer abc"}) == "abc"
+    assert connect_token({"token": "abc"}) == "abc"
+    for auth in (None, {}, {"token": ""}, "abc"):
+        with pytest.raises(ValueError):
+            connect_token(auth)
+
+
+def test_connect_authenticates(sqlite_db, monkeypatch):
+    """Test that connections are checked against the same tokens as the REST API."""
+    sqlite_db.add(User(id=5, username="u", password="x"))
+    sqlite_db.commit()
+    monkeypatch.setattr(realtime, "SessionLocal", lambda: sqlite_db)
+    auth_cache.token_cache.clear()
+    auth_cache.user_cache.clear()
+
+    assert realtime.authenticate_connection({"token": generate_token(5, "u")}) == 5
+    with pytest.raises(ValueError):
+        realtime.authenticate_connection({"token": "not-a-jwt"})
+    with pytest.raises(ValueError):
+        realtime.authenticate_connection({"token": generate_token(6, "gone")})
+
+
+def test_emit_event_does_not_block_the_loop(monkeypatch):
+    """Test that events emitted on the event loop are published in order off the loop."""
+    published = []
+
+    def slow_publish(redis_conn, event_name, data):
+        time.sleep(0.05)
+        published.append(data["id"])
+
+    monkeypatch.setattr(run_job, "publish_event", slow_publish)
+
+    async def main():
+        started = time.monotonic()
+        for i in range(5):
+            run_job.emit_event("jobExecution:update", {"id": i})
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) < 0.05
+    run_job.flush_events()
+    assert published == [0, 1, 2, 3, 4]
@@ -0,0 +1,78 @@
+"""
+Tests for the asyncio job executor (concurrency, backpressure, cancellation).
+"""
+import asyncio
+import time
+import pytest
+import worker.run_job as run_job
+from worker.executor import JobExecutor, ExecutorFull, JobTimeout, job_timed_out
+
+
+async def fake_run_job_async(job_type, payload):
+    try:
+        await asyncio.sleep(payload.get("sleep", 0))
+    except asyncio.CancelledError:
+        payload["timed_out"] = job_timed_out()
+        raise
+    if payload.get("fail"):
+        raise RuntimeError("boom")
+    return payload.get("value")
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(run_job, "run_job_async", fake_run_job_async)
+    ex = JobExecutor(max_concurrency=3, max_pending=1)
+    yield ex
+    ex.shutdown(cancel_running=True, timeout=1)
+
+
+def test_jobs_run_concurrently(executor):
+    """Test that jobs up to max_concurrency overlap instead of running serially."""
+    started = time.perf_counter()
+    futures = [executor.submit("run_job_execution", {"sleep": 0.3, "value": i}) for i in range(3)]
+    results = [f.result(timeout=5) for f in futures]
+    elapsed = time.perf_counter() - started
+
+    assert results == [0, 1, 2]
+    assert elapsed < 0.8
+
+
+def test_failure_is_reraised(executor):
+    """Test that handler exceptions surface through run()."""
+    with pytest.raises(RuntimeError):
+        executor.run("run_job_execution", {"fail": True})
+    assert executor.stats()["failed"] == 1
+
+
+def test_backpressure_rejects_when_saturated(executor):
+    """Test that submit(block=False) refuses work beyond running + pending capacity."""
+    futures = [executor.submit("run_job_execution", {"sleep": 0.5}) for _ in range(4)]
+
+    with pytest.raises(ExecutorFull):
+        executor.submit("run_job_execution", {}, block=False)
+
+    for f in futures:
+        f.result(timeout=5)
+
+
+def test_cancel_running_job(executor):
+    """Test that a running job can be cancelled by key."""
+    future = executor.submit("run_job_execution", {"sleep": 10}, job_key="job-1")
+    time.sleep(0.1)
+
+    assert executor.cancel("job-1") is True
+    assert future.cancelled()
+    assert executor.cancel("unknown") is False
+
+
+def test_job_timeout_fails_job(executor):
+    """Test that a job running past job_timeout is cancelled and fails with JobTimeout."""
+    payload = {"sleep": 10}
+    future = executor.submit("run_job_execution", payload, job_timeout=0.1)
+
+    with pytest.raises(JobTimeout):
+        future.result(timeout=5)
+    assert payload["timed_out"] is True
+    assert executor.stats()["failed"] == 1
+    assert executor.submit("run_job_execution", {"sleep": 0.05, "value": 1}, job_timeout=1).result(timeout=5) == 1
@@ -0,0 +1,126 @@
+"""
+Tests for idempotency keys and enqueue deduplication keys.
+"""
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException, Response
+from db.models import Profile
+from api import idempotency
+from api.idempotency import IdempotencyStore, idempotent
+from worker.queue import dedupe_key
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = []
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def expire(self, key, ttl):
+        self.expires.append((key, ttl))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = IdempotencyStore(FakeRedis())
+    monkeypatch.setattr(idempotency, "_store", store)
+    return store
+
+
+def call(key, body, handler, user_id=1, db=None):
+    response = Response()
+    result = asyncio.run(idempotent(key, user_id, "jobs.create", body, response, handler, db=db))
+    return result, response
+
+
+def test_repeats_replay_the_first_response(store):
+    """Test that a repeated key runs the handler once and marks the replay."""
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return {"success": True, "data": {"id": len(calls)}}
+
+    first, response = call("k1", {"type": "run_job_execution"}, handler)
+    again, replayed = call("k1", {"type": "run_job_execution"}, handler)
+    assert first == again == {"success": True, "data": {"id": 1}}
+    assert "idempotent-replayed" not in response.headers and replayed.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+    # Keys are per user; no key means no deduplication
+    call("k1", {"type": "run_job_execution"}, handler, user_id=2)
+    call(None, {"type": "run_job_execution"}, handler)
+    assert len(calls) == 3
+
+
+def test_conflicts_and_failures(store):
+    """Test reuse with another body, a request still in flight, and that failed requests free their key."""
+    async def ok():
+        return {"success": True}
+
+    call("k2", {"a": 1}, ok)
+    with pytest.raises(HTTPException) as exc:
+        call("k2", {"a": 2}, ok)
+    assert exc.value.status_code == 422
+
+    store.begin("ntg:idem:1:jobs.create:k3", idempotency.request_fingerprint({"a": 1}))
+    with pytest.raises(HTTPException) as exc:
+        call("k3", {"a": 1}, ok)
+    assert exc.value.status_code == 409
+
+    async def fails():
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    with pytest.raises(HTTPException):
+        call("k4", {"a": 1}, fails)
+    assert call("k4", {"a": 1}, ok)[0] == {"success": True}
+
+
+def test_slow_requests_keep_their_key(store):
+    """Test that the pending marker is extended while a slow, loop-blocking handler runs."""
+    store.pending_ttl = 0.3
+
+    async def slow():
+        time.sleep(0.35)  # Synchronous work, as in a large fan-out
+        return {"success": True}
+
+    call("k5", {"a": 1}, slow)
+    assert ("ntg:idem:1:jobs.create:k5", 0.3) in store.redis.expires
+
+
+def test_failures_after_a_commit_are_replayed(store, sqlite_db):
+    """Test that a request failing after it committed keeps its key and replays the error."""
+    calls = []
+
+    async def commits_then_fails():
+        calls.append(1)
+        sqlite_db.add(Profile(name="p"))
+        sqlite_db.commit()
+        raise HTTPException(status_code=500, detail="Enqueue failed")
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            call("k6", {"a": 1}, commits_then_fails, db=sqlite_db)
+        assert exc.value.status_code == 500 and exc.value.detail == "Enqueue failed"
+    assert len(calls) == 1 and sqlite_db.query(Profile).count() == 1
+
+
+def test_dedupe_keys():
+    """Test that enqueue dedupe keys name the job type and its target."""
+    assert dedupe_key("start_session", {"session_id": 7}) == "start_session:7"
+    assert dedupe_key("stop_session", {"session_id": 7}) == "stop_session:7"
+    assert dedupe_key("run_job_execution", {"job_execution_id": 3, "attempt": 2}) == "run_job_execution:3"
+    assert dedupe_key("run_workflow_batch", {"job_execution_ids": [1, 2]}) is None
+    assert dedupe_key("gc_screenshots", {}) is None
@@ -0,0 +1,121 @@
+"""
+Tests for the fingerprint injection script cache.
+"""
+import asyncio
+import threading
+from services.fingerprint_injection import build_injection, get_default_fingerprint
+from services.injection_cache import InjectionCache, fingerprint_key, normalize_fingerprint, REDIS_KEY_PREFIX
+
+
+class DictRedis:
+    """Minimal in-memory stand-in for the two Redis calls the cache makes."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode("utf-8")
+
+
+class DownRedis:
+    def get(self, key):
+        raise ConnectionError("down")
+
+    def set(self, key, value, ex=None):
+        raise ConnectionError("down")
+
+
+def test_key_ignores_dict_order():
+    """Test that equal fingerprints hash the same regardless of key order."""
+    a = {"user_agent": "UA", "screen_width": 1280, "plugins": [{"name": "x"}]}
+    b = {"plugins": [{"name": "x"}], "screen_width": 1280, "user_agent": "UA"}
+    assert fingerprint_key(a) == fingerprint_key(b)
+    assert fingerprint_key(a) != fingerprint_key({**a, "screen_width": 1920})
+
+
+def test_normalize_prefers_profile_user_agent():
+    """Test that the profile user agent overrides the fingerprint without mutating it."""
+    stored = {"user_agent": "old"}
+    fp = normalize_fingerprint(stored, "new")
+    assert fp["user_agent"] == "new"
+    assert stored["user_agent"] == "old"
+
+
+def test_builds_once_per_fingerprint():
+    """Test that repeated lookups reuse the built script."""
+    cache = InjectionCache(maxsize=8)
+    fp = get_default_fingerprint()
+
+    first = cache.get(fp)
+    second = cache.get(dict(fp))
+
+    assert first == second == build_injection(fp)
+    stats = cache.stats()
+    assert stats["builds"] == 1
+    assert stats["hits"] == 1
+
+
+def test_precompute_shares_through_redis():
+    """Test that a script precomputed in one process is found by another."""
+    redis = DictRedis()
+    api_cache = InjectionCache(redis_client=redis)
+    worker_cache = InjectionCache(redis_client=redis)
+    fp = get_default_fingerprint()
+
+    key = api_cache.precompute(fp)
+    assert REDIS_KEY_PREFIX + key in redis.data
+
+    assert worker_cache.get(fp) == build_injection(fp)
+    assert worker_cache.stats()["redis_hits"] == 1
+    assert worker_cache.stats()["builds"] == 0
+
+
+def test_aget_looks_up_redis_off_the_loop():
+    """Test that aget() only touches Redis from a worker thread and serves local hits inline."""
+    redis = DictRedis()
+    InjectionCache(redis_client=redis).precompute(get_default_fingerprint())
+    threads = []
+    redis_get = redis.get
+    redis.get = lambda key: threads.append(threading.current_thread()) or redis_get(key)
+    cache = InjectionCache(redis_client=redis)
+    fp = get_default_fingerprint()
+
+    async def lookup():
+        return await cache.aget(fp), await cache.aget(fp), threading.current_thread()
+
+    first, second, loop_thread = asyncio.run(lookup())
+
+    assert first == second == build_injection(fp)
+    assert len(threads) == 1 and threads[0] is not loop_thread
+    assert cache.stats()["redis_hits"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_redis_errors_fall_back_to_local():
+    """Test that an unreachable Redis does not break script lookup."""
+    cache = InjectionCache(redis_client=DownRedis())
+    fp = get_default_fingerprint()
+
+    assert cache.get(fp) == build_injection(fp)
+    assert cache.get(fp) == build_injection(fp)
+    assert cache.stats()["redis_errors"] == 1
+
+
+def test_lru_eviction():
+    """Test that the cache stays within maxsize."""
+    cache = InjectionCache(maxsize=2)
+    for width in (800, 1024, 1280):
+        cache.get({"screen_width": width})
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_build_injection_emits_valid_js_literals():
+    """Test that plugins serialize and the canvas flag is a JS boolean."""
+    script = build_injection({"plugins": [{"name": "PDF"}], "canvas": None})
+    assert '[{"name": "PDF"}]' in script
+    assert "if (false)" in script
+    assert "if (False)" not in script
@@ -0,0 +1,53 @@
+"""
+Tests for bulk job fan-out helpers.
+"""
+from sqlalchemy import event
+from db.models import Job, JobExecution, Profile
+from api.routes import jobs
+from services.job_fanout import workflow_batches
+
+
+def test_bulk_fanout_uses_constant_queries(sqlite_db):
+    """Test that validating and inserting N executions takes one query each."""
+    sqlite_db.add_all([Profile(name=f"p{i}") for i in range(300)])
+    job = Job(type="run_job_execution", payload={"url": "https://example.com"})
+    sqlite_db.add(job)
+    sqlite_db.commit()
+
+    requested = list(range(1, 301)) + [9999]
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(sqlite_db.get_bind(), "before_cursor_execute", listener)
+    try:
+        existing = jobs.existing_profile_ids(sqlite_db, requested)
+        valid = [pid for pid in requested if pid in existing]
+        created = jobs.create_job_executions(sqlite_db, job.id, valid)
+        sqlite_db.commit()
+    finally:
+        event.remove(sqlite_db.get_bind(), "before_cursor_execute", listener)
+
+    assert 9999 not in existing
+    assert sorted(profile_id for _, profile_id in created) == sorted(valid)
+    assert len({exec_id for exec_id, _ in created}) == 300
+    assert sqlite_db.query(JobExecution).filter(JobExecution.job_id == job.id).count() == 300
+    # One SELECT ... IN plus a multi-row INSERT ... RETURNING (split only at the driver's parameter limit)
+    assert statements[0].startswith("SELECT")
+    assert 2 <= len(statements) <= 4
+
+
+def test_empty_fanout(sqlite_db):
+    """Test that empty inputs do not hit the database."""
+    assert jobs.existing_profile_ids(sqlite_db, []) == set()
+    assert jobs.create_job_executions(sqlite_db, 1, []) == []
+
+
+def test_workflow_batches_split_by_batch_size():
+    """Test that batch workflow jobs carry up to batch_size executions each."""
+    executions = [(exec_id, exec_id + 100) for exec_id in range(1, 8)]
+    batches = workflow_batches(executions, {"workflow_id": 4, "batch_size": 3, "concurrency": 2})
+
+    assert [len(members) for members, _ in batches] == [3, 3, 1]
+    job_type, payload = batches[0][1]
+    assert job_type == "run_workflow_batch"
+    assert payload == {"workflow_id": 4, "job_execution_ids": [1, 2, 3], "concurrency": 2}
+    assert batches[2][0] == [(7, 107)]
@@ -0,0 +1,115 @@
+"""
+Tests for the buffered worker log sink.
+"""
+import multiprocessing
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db.models import Base, Log
+from worker.log_sink import LogSink
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_flush_writes_buffered_rows(session_factory):
+    """Test that flush() bulk-writes everything emitted so far."""
+    sink = LogSink(batch_size=1000, flush_interval=60, session_factory=session_factory)
+    for i in range(50):
+        assert sink.emit("info", f"message {i}", {"i": i})
+
+    assert sink.flush(wait=True, timeout=5)
+    db = session_factory()
+    assert db.query(Log).count() == 50
+    db.close()
+    assert sink.stats()["batches"] == 1
+    sink.close()
+
+
+def test_batch_size_threshold(session_factory):
+    """Test that rows are written once a batch fills, without an explicit flush."""
+    sink = LogSink(batch_size=10, flush_interval=60, session_factory=session_factory)
+    for i in range(25):
+        sink.emit("info", f"message {i}")
+    sink.close()
+
+    db = session_factory()
+    assert db.query(Log).count() == 25
+    db.close()
+    assert sink.stats()["batches"] >= 3
+
+
+def test_overflow_is_counted(session_factory):
+    """Test that a full queue drops rows and counts them instead of blocking."""
+    sink = LogSink(max_queue=1, batch_size=1000, flush_interval=60, session_factory=session_factory)
+    results = [sink.emit("info", "x") for _ in range(200)]
+    sink.close()
+
+    stats = sink.stats()
+    assert results.count(False) == stats["dropped_overflow"]
+    assert stats["dropped_overflow"] > 0
+    assert stats["written"] + stats["dropped_overflow"] == 200
+
+
+def test_write_error_is_counted():
+    """Test that a failing database does not kill the writer thread."""
+    def broken_factory():
+        raise_engine = create_engine("sqlite:///nonexistent_dir/x/y.db")
+        return sessionmaker(bind=raise_engine)()
+
+    sink = LogSink(batch_size=1, flush_interval=60, session_factory=broken_factory)
+    sink.emit("error", "lost")
+    sink.flush(wait=True, timeout=5)
+    sink.emit("error", "lost too")
+    sink.close()
+
+    assert sink.stats()["write_errors"] == 2
+    assert sink.stats()["dropped_errors"] == 2
+
+
+def _run_job_in_horse(db_url):
+    """Work horse body: process one failing job, then leave like RQ does (os._exit, no atexit)."""
+    import os
+    from worker import log_sink, run_job
+
+    engine = create_engine(db_url)
+    log_sink._sink = LogSink(batch_size=1000, flush_interval=60, session_factory=sessionmaker(bind=engine))
+
+    class FailingExecutor:
+        def run(self, job_type, payload, job_key=None):
+            run_job.log_to_db("info", "job started")
+            raise ValueError("JobExecution 1 not found")
+
+    class DeadLetters:
+        def add(self, *args, **kwargs):
+            run_job.log_to_db("error", "dead-lettered")
+
+    run_job.get_executor = FailingExecutor
+    run_job.get_dead_letters = DeadLetters
+    try:
+        run_job.process_job("run_job_execution", {"job_execution_id": 1})
+    except ValueError:
+        pass
+    os._exit(0)
+
+
+def test_forked_horse_persists_logs_without_atexit(tmp_path):
+    """Test that process_job writes its logs before a forked horse exits through os._exit."""
+    db_url = f"sqlite:///{tmp_path / 'logs.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+
+    horse = multiprocessing.get_context("fork").Process(target=_run_job_in_horse, args=(db_url,))
+    horse.start()
+    horse.join(30)
+    assert horse.exitcode == 0
+
+    db = sessionmaker(bind=engine)()
+    assert [row.message for row in db.query(Log).order_by(Log.id)] == ["job started", "dead-lettered"]
+    db.close()
+    engine.dispose()
@@ -0,0 +1,82 @@
+"""
+Tests for profile listing: keyset pagination, field projection and name search.
+"""
+import pytest
+from fastapi import HTTPException
+from db.models import Profile
+from api.routes import profiles
+from api.auth_cache import TTLCache
+
+
+@pytest.fixture
+def seeded_db(sqlite_db):
+    for i in range(25):
+        name = f"shop_{i:02d}" if i % 2 else f"ads_{i:02d}"
+        sqlite_db.add(Profile(name=name, user_agent="UA", fingerprint={"canvas": "x" * 100}))
+    sqlite_db.add(Profile(name="100%_real", fingerprint={}))
+    sqlite_db.commit()
+    profiles.invalidate_profile_count()
+    return sqlite_db
+
+
+def test_keyset_pagination_walks_all_rows(seeded_db):
+    """Test that following next_cursor visits every profile exactly once."""
+    fields = profiles.parse_fields(None)
+    seen = []
+    cursor = None
+    while True:
+        data, cursor = profiles.query_profiles(seeded_db, fields, limit=10, cursor=cursor)
+        seen.extend(row["id"] for row in data)
+        if cursor is None:
+            break
+
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen)) == 26
+
+
+def test_fields_projection_omits_fingerprint(seeded_db):
+    """Test that ?fields= limits the returned columns and always keeps id."""
+    fields = profiles.parse_fields("name")
+    data, _ = profiles.query_profiles(seeded_db, fields, limit=5)
+
+    assert fields == ["id", "name"]
+    assert set(data[0]) == {"id", "name"}
+
+
+def test_unknown_field_rejected():
+    """Test that unknown field names are a 400."""
+    with pytest.raises(HTTPException) as exc_info:
+        profiles.parse_fields("name,password")
+    assert exc_info.value.status_code == 400
+
+
+def test_name_prefix_search_is_literal(seeded_db):
+    """Test that search matches a name prefix and treats LIKE wildcards literally."""
+    fields = profiles.parse_fields("name")
+    shop, _ = profiles.query_profiles(seeded_db, fields, search="shop_")
+    percent, _ = profiles.query_profiles(seeded_db, fields, search="100%")
+
+    assert len(shop) == 12
+    assert all(row["name"].startswith("shop_") for row in shop)
+    assert [row["name"] for row in percent] == ["100%_real"]
+
+
+def test_total_count_is_cached(seeded_db):
+    """Test that totals are served from cache until invalidated."""
+    assert profiles.count_profiles(seeded_db) == 26
+
+    seeded_db.add(Profile(name="late"))
+    seeded_db.commit()
+    assert profiles.count_profiles(seeded_db) == 26
+
+    profiles.invalidate_profile_count()
+    assert profiles.count_profiles(seeded_db) == 27
+
+
+def test_total_cache_is_bounded(seeded_db, monkeypatch):
+    """Test that distinct searches cannot grow the totals cache past its size."""
+    monkeypatch.setattr(profiles, "_total_cache", TTLCache(maxsize=2, ttl=30))
+    for search in ("a", "b", "shop_", "100"):
+        profiles.count_profiles(seeded_db, search)
+    assert profiles._total_cache.stats()["size"] == 2
+    assert profiles.count_profiles(seeded_db, "shop_") == 12
@@ -0,0 +1,68 @@
+"""
+Tests for priority lanes and fair dequeue ordering.
+"""
+from collections import Counter
+import pytest
+from worker import queue
+from worker.queue import LaneScheduler, lane_for, lane_of_queue
+
+
+def test_lane_for():
+    """Test lane selection by job type, payload priority and explicit lane."""
+    assert lane_for("start_session", {}) == "interactive"
+    assert lane_for("run_workflow_batch", {}) == "bulk"
+    assert lane_for("run_job_execution", {}) == "normal"
+    assert lane_for("run_job_execution", {"priority": "bulk"}) == "bulk"
+    assert lane_for("start_session", {}, lane="normal") == "normal"
+    with pytest.raises(ValueError):
+        lane_for("run_job_execution", {"priority": "urgent"})
+
+
+def test_user_sub_queues(monkeypatch):
+    """Test that fairness puts users' jobs in their own sub-queue, except interactive ones."""
+    assert queue.queue_name("bulk", 7) == "ntg_bulk"
+    monkeypatch.setattr(queue, "QUEUE_FAIRNESS", True)
+    assert queue.queue_name("bulk", 7) == "ntg_bulk:u7"
+    assert queue.queue_name("interactive", 7) == "ntg_interactive"
+    assert lane_of_queue("ntg_bulk:u7") == "bulk"
+
+
+def test_interactive_first_and_weighted_lanes():
+    """Test that interactive is always tried first and normal/bulk share picks by weight."""
+    scheduler = LaneScheduler({"normal": 4, "bulk": 1})
+    queues = {"interactive": ["ntg_interactive"], "normal": ["ntg_jobs"], "bulk": ["ntg_bulk"]}
+    served = Counter()
+    for _ in range(50):
+        order = scheduler.order(queues)
+        assert order[0] == "ntg_interactive"
+        # Pretend interactive is empty: the first non-interactive queue is served
+        scheduler.served(order[1])
+        served[lane_of_queue(order[1])] += 1
+    assert served == {"normal": 40, "bulk": 10}
+
+
+def test_users_round_robin_within_lane():
+    """Test that sub-queues of one lane take turns."""
+    scheduler = LaneScheduler({"normal": 1, "bulk": 1})
+    queues = {"bulk": ["ntg_bulk", "ntg_bulk:u1", "ntg_bulk:u2"]}
+    firsts = []
+    for _ in range(6):
+        first = scheduler.order(queues)[0]
+        scheduler.served(first)
+        firsts.append(first)
+    assert firsts == ["ntg_bulk", "ntg_bulk:u1", "ntg_bulk:u2"] * 2
+
+
+def test_idle_lane_credit_is_bounded():
+    """Test that a lane that was empty for a long time cannot monopolize picks."""
+    scheduler = LaneScheduler({"normal": 4, "bulk": 1})
+    queues = {"normal": ["ntg_jobs"], "bulk": ["ntg_bulk"]}
+    for _ in range(1000):
+        scheduler.order(queues)
+        scheduler.served("ntg_jobs")  # bulk was empty every time
+    picks = []
+    for _ in range(10):
+        first = scheduler.order(queues)[0]
+        scheduler.served(first)
+        picks.append(first)
+    assert picks.count("ntg_jobs") >= 6
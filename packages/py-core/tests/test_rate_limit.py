@@ -0,0 +1,93 @@
+"""
+Tests for per-domain and per-proxy rate limits.
+"""
+import asyncio
+import threading
+import pytest
+from worker.rate_limit import RateLimiter, RateLimitExceeded, parse_rate, parse_overrides
+
+
+class PipelineRedis:
+    """In-memory stand-in for the INCR/EXPIRE pipeline, recording the thread each round trip ran on."""
+
+    def __init__(self):
+        self.counts = {}
+        self.threads = []
+
+    def pipeline(self):
+        return self
+
+    def __enter__(self):
+        self._ops = []
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def incr(self, key):
+        self._ops.append(key)
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        self.threads.append(threading.current_thread())
+        key = self._ops[0]
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return [self.counts[key], True]
+
+
+def test_parse_rates():
+    """Test rate and override parsing."""
+    assert parse_rate("30/60") == (30, 60.0)
+    assert parse_rate("") is None
+    assert parse_overrides("shop.com=10/60, api.x.com=5/1") == {"shop.com": (10, 60.0), "api.x.com": (5, 1.0)}
+    with pytest.raises(ValueError):
+        parse_rate("0/60")
+
+
+def test_fixed_window_counts_per_key():
+    """Test that each domain has its own window and overrides match subdomains."""
+    limiter = RateLimiter(domain_rate=(2, 60), domain_overrides={"shop.com": (1, 60)})
+    now = 1200.0
+    assert limiter.try_acquire("domain", "a.com", now) == 0
+    assert limiter.try_acquire("domain", "a.com", now) == 0
+    assert limiter.try_acquire("domain", "a.com", now + 10) == pytest.approx(50)
+    assert limiter.try_acquire("domain", "b.com", now) == 0
+    assert limiter.try_acquire("domain", "www.shop.com", now) == 0
+    assert limiter.try_acquire("domain", "shop.com", now) > 0
+    # Next window
+    assert limiter.try_acquire("domain", "a.com", now + 60) == 0
+    assert limiter.try_acquire("proxy", "http://p:1", now) == 0  # No proxy rule
+
+
+def test_acquire_waits_then_rejects():
+    """Test that navigations wait for the next window and give up past max_wait."""
+    limiter = RateLimiter(proxy_rate=(1, 0.2), max_wait=1)
+
+    async def scenario():
+        assert await limiter.acquire("https://a.com/x", "http://proxy:8080") == 0
+        waited = await limiter.acquire("https://b.com/y", "http://proxy:8080")
+        assert 0 < waited < 0.5
+
+    asyncio.run(scenario())
+    assert limiter.stats()["throttled"] == 1
+
+    strict = RateLimiter(domain_rate=(1, 3600), max_wait=1)
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(strict.acquire("https://a.com"))
+        asyncio.run(strict.acquire("https://a.com"))
+
+
+def test_acquire_counts_in_redis_off_the_loop():
+    """Test that the Redis counter round trip does not run on the event loop thread."""
+    redis = PipelineRedis()
+    limiter = RateLimiter(redis_client=redis, domain_rate=(5, 60))
+
+    async def scenario():
+        await limiter.acquire("https://a.com/x")
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(redis.threads) == 1 and redis.threads[0] is not loop_thread
+    assert list(redis.counts.values()) == [1]
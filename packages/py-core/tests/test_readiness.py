@@ -0,0 +1,96 @@
+"""
+Tests for page readiness strategies (driven by a fake page).
+"""
+import asyncio
+import pytest
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from worker.readiness import navigate, parse_readiness
+from worker.workflow_executor import compile_workflow
+
+
+class FakeRequest:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakePage:
+    """Emits scripted request events after goto; records goto arguments."""
+
+    def __init__(self, requests=(), selector_timeout=False):
+        self.listeners = {}
+        self.requests = requests
+        self.selector_timeout = selector_timeout
+        self.gotos = []
+
+    def on(self, name, handler):
+        self.listeners.setdefault(name, []).append(handler)
+
+    def remove_listener(self, name, handler):
+        self.listeners[name].remove(handler)
+
+    def fire(self, name, request):
+        for handler in list(self.listeners.get(name, [])):
+            handler(request)
+
+    async def goto(self, url, wait_until=None, timeout=None):
+        self.gotos.append((url, wait_until))
+        for url_, duration in self.requests:
+            request = FakeRequest(url_)
+            self.fire("request", request)
+            if duration is not None:
+                asyncio.get_running_loop().call_later(duration, self.fire, "requestfinished", request)
+
+    async def wait_for_selector(self, selector, state=None, timeout=None):
+        if self.selector_timeout:
+            raise PlaywrightTimeoutError("timeout")
+
+
+def test_parse_readiness_defaults_and_errors():
+    """Test spec normalization and validation."""
+    assert parse_readiness("load")["strategy"] == "load"
+    spec = parse_readiness({"strategy": "network-quiet", "allow": ["ads"]})
+    assert spec["strategy"] == "network_quiet" and spec["allow"] == ["ads"] and spec["quiet_ms"] > 0
+    with pytest.raises(ValueError):
+        parse_readiness("whenever")
+    with pytest.raises(ValueError):
+        parse_readiness({"strategy": "selector"})
+
+
+def test_goto_strategy_passes_wait_until():
+    """Test that built-in strategies map straight to goto."""
+    page = FakePage()
+    info = asyncio.run(navigate(page, "https://example.com", "domcontentloaded"))
+    assert page.gotos == [("https://example.com", "domcontentloaded")]
+    assert info["strategy"] == "domcontentloaded" and info["timed_out"] is False
+    assert page.listeners == {}
+
+
+def test_network_quiet_waits_for_requests_and_ignores_allowed():
+    """Test that network_quiet waits out tracked requests but not allow-listed ones."""
+    page = FakePage(requests=[("https://site/app.js", 0.1), ("https://ads.example/poll", None)])
+    info = asyncio.run(navigate(page, "https://site", {"strategy": "network_quiet", "quiet_ms": 50, "allow": ["ads.example"], "timeout": 2000}))
+
+    assert info["timed_out"] is False
+    assert info["ignored_requests"] == 1
+    assert 140 <= info["wait_ms"] < 1000
+    assert all(not handlers for handlers in page.listeners.values())
+
+
+def test_network_quiet_times_out_softly():
+    """Test that a never-ending request records a timeout instead of failing."""
+    page = FakePage(requests=[("https://site/stream", None)])
+    info = asyncio.run(navigate(page, "https://site", {"strategy": "network_quiet", "quiet_ms": 10, "timeout": 100}))
+    assert info["timed_out"] is True
+    assert info["pending_requests"] == 1
+
+
+def test_selector_timeout_recorded():
+    """Test that a missing selector is reported as timed_out."""
+    info = asyncio.run(navigate(FakePage(selector_timeout=True), "https://site", {"strategy": "selector", "selector": "#app"}))
+    assert info == {"strategy": "selector", "timed_out": True, "wait_ms": info["wait_ms"]}
+
+
+def test_workflow_rejects_invalid_readiness():
+    """Test that openPage readiness is validated when the workflow compiles."""
+    plan = compile_workflow({"nodes": [{"id": "o", "type": "openPage", "data": {"config": {"url": "x", "readiness": "soon"}}}]})
+    assert any("Invalid readiness" in e for e in plan.errors)
@@ -0,0 +1,83 @@
+"""
+Tests for resource blocking profiles.
+"""
+import asyncio
+import pytest
+from worker.resource_blocking import ResourceBlocker, parse_blocking
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = FakeRequest(url, resource_type)
+        self.outcome = None
+
+    async def abort(self, reason=None):
+        self.outcome = "aborted"
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+
+class FakeContext:
+    def __init__(self):
+        self.routes = []
+
+    async def route(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+
+def route_all(blocker, requests):
+    routes = [FakeRoute(url, kind) for url, kind in requests]
+    for route in routes:
+        asyncio.run(blocker._handle(route))
+    return [route.outcome for route in routes]
+
+
+def test_full_profile_installs_no_route():
+    """Test that the default profile leaves requests (and the HTTP cache) alone."""
+    context = FakeContext()
+    blocker = ResourceBlocker("full")
+    asyncio.run(blocker.attach(context))
+    assert context.routes == []
+    assert not blocker.active
+
+
+def test_no_media_blocks_media_and_trackers():
+    """Test type and tracker-domain blocking with counters."""
+    blocker = ResourceBlocker("no-media")
+    outcomes = route_all(blocker, [
+        ("https://site.com/", "document"),
+        ("https://site.com/app.css", "stylesheet"),
+        ("https://site.com/hero.jpg", "image"),
+        ("https://www.google-analytics.com/collect", "xhr"),
+        ("https://cdn.site.com/font.woff2", "font"),
+    ])
+    assert outcomes == ["continued", "continued", "aborted", "aborted", "aborted"]
+    stats = blocker.stats()
+    assert stats["blocked"] == 3 and stats["allowed"] == 2
+    assert stats["blocked_by_type"] == {"image": 1, "xhr": 1, "font": 1}
+    assert stats["bytes_saved_estimate"] > 0
+
+
+def test_custom_overrides():
+    """Test extra blocked types/domains and allow-listed domains."""
+    blocker = ResourceBlocker({
+        "profile": "minimal",
+        "block_domains": ["cdn.example"],
+        "allow_domains": ["images.site.com"],
+    })
+    assert blocker.should_block("https://images.site.com/a.png", "image") is False
+    assert blocker.should_block("https://static.cdn.example/x.js", "script") is True
+    assert blocker.should_block("https://site.com/x.js", "script") is False
+    assert blocker.should_block("https://site.com/a.css", "stylesheet") is True
+
+
+def test_unknown_profile_rejected():
+    with pytest.raises(ValueError):
+        parse_blocking("everything")
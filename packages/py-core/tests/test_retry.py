@@ -0,0 +1,250 @@
+"""
+Tests for job retries and the dead-letter queue.
+"""
+import asyncio
+import pytest
+from db.models import Job, JobExecution, Profile, Workflow
+from worker import queue, readiness, run_job
+from worker.workflow_executor import execute_workflow
+from worker.retry import (
+    RetryPolicy, DeadLetters, is_retryable, backoff_delay, retry_decision, parse_retry_policies,
+)
+
+
+def playwright_error(name, message):
+    return type(name, (Exception,), {"__module__": "playwright._impl._errors"})(message)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    """The hash and zset commands DeadLetters uses."""
+
+    def __init__(self):
+        self.hash, self.index = {}, {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def hset(self, key, field, value):
+        self.hash[field] = value
+
+    def hmget(self, key, fields):
+        return [self.hash.get(field) for field in fields]
+
+    def hdel(self, key, *fields):
+        return sum(self.hash.pop(field, None) is not None for field in fields)
+
+    def zadd(self, key, mapping):
+        self.index.update(mapping)
+
+    def zrem(self, key, *members):
+        return sum(self.index.pop(member, None) is not None for member in members)
+
+    def zcard(self, key):
+        return len(self.index)
+
+    def _ordered(self):
+        return sorted(self.index, key=self.index.get)
+
+    def zrange(self, key, start, end):
+        return self._ordered()[start:end + 1]
+
+    def zrevrange(self, key, start, end):
+        return self._ordered()[::-1][start:None if end == -1 else end + 1]
+
+    def zrangebyscore(self, key, low, high):
+        return [member for member in self._ordered() if self.index[member] <= high]
+
+
+def test_error_classification():
+    """Test that navigation timeouts and network/browser failures are retryable and bad input is not."""
+    assert is_retryable(playwright_error("TimeoutError", "Page.goto: Timeout 30000ms exceeded.\nnavigating to \"https://a.com/\""))
+    assert is_retryable(playwright_error("TimeoutError", "Page.wait_for_load_state: Timeout 30000ms exceeded."))
+    assert not is_retryable(playwright_error("TimeoutError", "Page.click: Timeout 30000ms exceeded.\nwaiting for locator(\"#buy\")"))
+    assert not is_retryable(playwright_error("TimeoutError", "Page.wait_for_selector: Timeout 5000ms exceeded."))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(playwright_error("Error", "net::ERR_PROXY_CONNECTION_FAILED at https://a.com"))
+    assert is_retryable(playwright_error("Error", "Target page, context or browser has been closed"))
+    assert not is_retryable(playwright_error("Error", "Unexpected token \"]\" while parsing selector \"a]\""))
+    assert not is_retryable(ValueError("JobExecution 5 not found"))
+    assert not is_retryable(RuntimeError("net::ERR_FAILED"))  # Only Playwright messages are inspected
+
+
+def test_backoff_and_decision():
+    """Test exponential, capped, jittered delays and that attempts run out."""
+    policy = RetryPolicy(5, 10, 60)
+    for attempt, full in ((1, 10), (2, 20), (3, 40), (4, 60), (9, 60)):
+        assert full / 2 <= backoff_delay(policy, attempt) <= full
+    timeout = asyncio.TimeoutError()
+    assert retry_decision("run_job_execution", {"job_execution_id": 1}, timeout) is not None
+    assert retry_decision("run_job_execution", {"job_execution_id": 1, "attempt": 3}, timeout) is None
+    assert retry_decision("run_workflow_batch", {}, timeout) is None
+    assert retry_decision("run_job_execution", {}, ValueError("bad")) is None
+    assert parse_retry_policies("run_job_execution=5, start_session=2:1:4") == {
+        "run_job_execution": RetryPolicy(5, 30, 600),
+        "start_session": RetryPolicy(2, 1, 4),
+    }
+    with pytest.raises(ValueError):
+        parse_retry_policies("run_workflow=0")
+
+
+def test_handle_job_failure_retries_or_dead_letters(monkeypatch):
+    """Test the retry path, the dead-letter path and that cancellations are neither."""
+    scheduled, marked = [], []
+    dead = DeadLetters(FakeRedis())
+    monkeypatch.setattr(run_job, "schedule_retry", lambda *args, **kwargs: scheduled.append((args, kwargs)))
+    monkeypatch.setattr(run_job, "mark_retrying", lambda *args: marked.append(args))
+    monkeypatch.setattr(run_job, "get_dead_letters", lambda: dead)
+    monkeypatch.setattr(run_job, "log_to_db", lambda *args, **kwargs: None)
+
+    class FakeRQJob:
+        id = "rq-1"
+        meta = {"user_id": 4, "lane": "bulk"}
+
+    info = run_job.handle_job_failure("run_job_execution", {"job_execution_id": 9}, asyncio.TimeoutError(), FakeRQJob())
+    assert info["retry_scheduled"] is True and info["attempt"] == 1
+    assert scheduled[0][1] == {"user_id": 4, "lane": "bulk"} and len(marked) == 1
+
+    payload = {"job_execution_id": 9, "attempt": 3}
+    assert run_job.handle_job_failure("run_job_execution", payload, asyncio.TimeoutError(), FakeRQJob()) is None
+    assert run_job.handle_job_failure("run_job_execution", payload, asyncio.CancelledError()) is None
+    entries, total = dead.list()
+    assert total == 1 and entries[0]["attempts"] == 3 and entries[0]["user_id"] == 4
+    assert entries[0]["error_type"].endswith("TimeoutError") and entries[0]["rq_job_id"] == "rq-1"
+
+
+def test_dead_letters_redrive(monkeypatch):
+    """Test listing, trimming and re-driving from attempt 1, once per entry."""
+    enqueued = []
+    monkeypatch.setattr(queue, "enqueue_jobs_bulk", lambda jobs, user_id=None, lane=None: (
+        enqueued.extend((job, user_id) for job in jobs) or [(object(), None) for _ in jobs]
+    ))
+    dead = DeadLetters(FakeRedis(), max_entries=3)
+    ids = [dead.add("run_workflow", {"job_execution_id": i, "attempt": 3}, ValueError(f"e{i}"), user_id=1) for i in range(4)]
+    dead.add("stop_session", {"session_id": 5}, ValueError("x"))
+    assert dead.count() == 3  # Oldest two trimmed
+
+    entries, total = dead.list(job_type="run_workflow")
+    assert total == 2 and [e["payload"]["job_execution_id"] for e in entries] == [3, 2]
+
+    redriven, failed = dead.redrive(dead.select(job_type="run_workflow"))
+    assert len(redriven) == 2 and not failed
+    assert enqueued[0] == (("run_workflow", {"job_execution_id": 3}), 1)
+    assert dead.redrive([ids[3]]) == ([], [])  # Already re-driven
+    assert dead.count() == 1
+
+
+def test_record_attempt_keeps_job_attempts_in_sync(sqlite_db):
+    """Test that Job.attempts tracks the highest attempt of its executions."""
+    sqlite_db.add(Profile(id=1, name="p"))
+    sqlite_db.add(Job(id=1, type="run_job_execution", payload={}, attempts=0))
+    sqlite_db.add_all([JobExecution(id=i, job_id=1, profile_id=1) for i in (1, 2)])
+    sqlite_db.commit()
+
+    run_job.record_attempt(sqlite_db, "run_job_execution", {"job_execution_id": 1})
+    run_job.record_attempt(sqlite_db, "run_job_execution", {"job_execution_id": 2, "attempt": 3})
+    run_job.record_attempt(sqlite_db, "run_job_execution", {"job_execution_id": 1, "attempt": 2})
+    sqlite_db.expire_all()
+    assert sqlite_db.get(Job, 1).attempts == 3
+
+
+def test_run_workflow_records_failures_for_retry(sqlite_db, monkeypatch):
+    """Test that a run_workflow execution goes running -> failed, so a scheduled retry puts it back to pending."""
+    sqlite_db.add(Profile(id=1, name="p"))
+    sqlite_db.add(Workflow(id=1, name="wf", data={"nodes": [{"id": "s", "type": "start"}], "edges": []}))
+    sqlite_db.add(Job(id=1, type="run_workflow", payload={}))
+    sqlite_db.add(JobExecution(id=1, job_id=1, profile_id=1, status="pending"))
+    sqlite_db.commit()
+
+    class FakeExecutor:
+        class browser_pool:
+            stats = staticmethod(dict)
+
+    statuses = []
+
+    async def fake_run(pool, plan, profile, proxy_config, kind="headed", blocking=None, persist_storage=True):
+        assert not sqlite_db.in_transaction()  # No connection held during browser work
+        statuses.append(sqlite_db.query(JobExecution.status).filter(JobExecution.id == 1).scalar())
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(run_job, "run_workflow_for_profile", fake_run)
+    monkeypatch.setattr(run_job, "get_executor", lambda: FakeExecutor())
+    monkeypatch.setattr(run_job, "get_db_session", lambda: sqlite_db)
+    monkeypatch.setattr(run_job, "emit_event", lambda *args: None)
+    monkeypatch.setattr(run_job, "log_to_db", lambda *args, **kwargs: None)
+
+    payload = {"workflow_id": 1, "profile_id": 1, "job_execution_id": 1}
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_job.handle_run_workflow(payload, sqlite_db))
+    assert statuses == ["running"]
+    assert sqlite_db.query(JobExecution.status).filter(JobExecution.id == 1).scalar() == "failed"
+
+    run_job.mark_retrying("run_workflow", payload, asyncio.TimeoutError(), 30)
+    sqlite_db.expire_all()
+    assert sqlite_db.get(JobExecution, 1).status == "pending"
+
+
+def test_workflow_node_goto_timeout_is_retried(sqlite_db, monkeypatch):
+    """Test that a node's navigation timeout fails the job (not just the result), so it is retried."""
+    sqlite_db.add(Profile(id=1, name="p"))
+    sqlite_db.add(Workflow(id=3, name="nav", data={
+        "nodes": [{"id": "open", "type": "openPage", "data": {"config": {"url": "https://a.example", "readiness": "load"}}}],
+        "edges": [],
+    }))
+    sqlite_db.add(Job(id=1, type="run_workflow", payload={}))
+    sqlite_db.add(JobExecution(id=1, job_id=1, profile_id=1, status="pending"))
+    sqlite_db.commit()
+
+    class FakePage:
+        url = "about:blank"
+
+        async def goto(self, url, **kwargs):
+            raise playwright_error("TimeoutError", "Page.goto: Timeout 30000ms exceeded.\nnavigating to \"https://a.example/\"")
+
+    class FakeExecutor:
+        class browser_pool:
+            stats = staticmethod(dict)
+
+    async def fake_run(pool, plan, profile, proxy_config, kind="headed", blocking=None, persist_storage=True):
+        return await execute_workflow(FakePage(), plan)
+
+    async def no_throttle(url):
+        return 0
+
+    scheduled, marked = [], []
+    monkeypatch.setattr(readiness, "throttle", no_throttle)
+    monkeypatch.setattr(run_job, "run_workflow_for_profile", fake_run)
+    monkeypatch.setattr(run_job, "get_executor", lambda: FakeExecutor())
+    monkeypatch.setattr(run_job, "emit_event", lambda *args: None)
+    monkeypatch.setattr(run_job, "log_to_db", lambda *args, **kwargs: None)
+    monkeypatch.setattr(run_job, "schedule_retry", lambda *args, **kwargs: scheduled.append(args))
+    monkeypatch.setattr(run_job, "mark_retrying", lambda *args: marked.append(args))
+
+    payload = {"workflow_id": 3, "profile_id": 1, "job_execution_id": 1}
+    with pytest.raises(Exception, match="Page.goto") as raised:
+        asyncio.run(run_job.handle_run_workflow(payload, sqlite_db))
+    sqlite_db.expire_all()
+    execution = sqlite_db.get(JobExecution, 1)
+    assert execution.status == "failed" and execution.result["results"][0]["node_id"] == "open"
+    assert "exception" not in execution.result
+
+    info = run_job.handle_job_failure("run_workflow", payload, raised.value)
+    assert info["retry_scheduled"] is True and len(scheduled) == 1 and len(marked) == 1
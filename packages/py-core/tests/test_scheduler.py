@@ -0,0 +1,169 @@
+"""
+Tests for delayed and recurring job scheduling.
+"""
+import json
+from datetime import datetime, timezone
+import pytest
+from worker import queue
+from worker import scheduler
+from worker.scheduler import DelayedJobs, parse_cron, next_cron, parse_schedule, next_run
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class FakePipeline:
+    """Like redis-py: buffers commands, except between watch() and multi()."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.buffered = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, key):
+        self.buffered = None
+
+    def multi(self):
+        self.buffered = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        if self.buffered is None:
+            return method
+        return lambda *args, **kwargs: self.buffered.append((method, args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.buffered or []]
+
+
+class FakeRedis:
+    """The hash, zset and string commands DelayedJobs uses."""
+
+    def __init__(self):
+        self.hashes, self.zsets, self.strings = {}, {}, {}
+
+    def register_script(self, source):
+        return None
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hdel(self, key, field):
+        return int(self.hashes.get(key, {}).pop(field, None) is not None)
+
+    def zadd(self, key, mapping, xx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not xx or member in zset:
+                zset[member] = score
+
+    def zrem(self, key, member):
+        return int(self.zsets.get(key, {}).pop(member, None) is not None)
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def exists(self, key):
+        return int(key in self.strings)
+
+    def set(self, key, value, ex=None):
+        self.strings[key] = value
+
+
+@pytest.fixture
+def delayed(monkeypatch):
+    enqueued = []
+    monkeypatch.setattr(queue, "enqueue_in_pipeline", lambda pipe, jobs, user_id, lane: enqueued.extend(jobs))
+    return DelayedJobs(FakeRedis()), enqueued
+
+
+def claim(delayed_jobs, entry_id):
+    """Move an entry to the claims set like the Lua claim script."""
+    redis = delayed_jobs.redis
+    due = redis.zsets[scheduler.SCHEDULE_KEY].pop(entry_id)
+    member = f"{entry_id}|{due}"
+    redis.zadd(scheduler.SCHEDULE_CLAIMS_KEY, {member: due + scheduler.SCHEDULER_LEASE})
+    return member, due
+
+
+def test_parse_cron_fields():
+    """Test ranges, steps, lists, aliases and Sunday as 7."""
+    spec = parse_cron("*/15 9-17 * * 1-5")
+    assert spec.minutes == {0, 15, 30, 45} and spec.hours == set(range(9, 18))
+    assert spec.weekdays == {1, 2, 3, 4, 5} and spec.any_day
+    assert parse_cron("@daily") == parse_cron("0 0 * * *")
+    assert parse_cron("0 0 * * 7").weekdays == {0}
+    assert parse_cron("5/20 * * * *").minutes == {5, 25, 45}
+    for bad in ("* * * *", "60 * * * *", "a * * * *", "*/0 * * * *", "5-1 * * * *"):
+        with pytest.raises(ValueError):
+            parse_cron(bad)
+
+
+def test_next_cron():
+    """Test next occurrences across hour, day, month and weekday boundaries."""
+    assert next_cron(parse_cron("30 3 * * *"), utc(2026, 1, 31, 3, 30)) == utc(2026, 2, 1, 3, 30)
+    assert next_cron(parse_cron("0 0 1 * *"), utc(2026, 12, 15, 8, 0)) == utc(2027, 1, 1, 0, 0)
+    # 2026-10-17 is a Saturday; next Monday 09:00
+    assert next_cron(parse_cron("0 9 * * 1"), utc(2026, 10, 17, 12, 0)) == utc(2026, 10, 19, 9, 0)
+    # Day-of-month and weekday both restricted: either matches
+    assert next_cron(parse_cron("0 0 20 * 1"), utc(2026, 10, 17, 12, 0)) == utc(2026, 10, 19, 0, 0)
+    with pytest.raises(ValueError):
+        parse_schedule("0 0 31 2 *")
+
+
+def test_parse_schedule_and_intervals():
+    """Test schedule normalization and that interval runs keep their phase without catching up."""
+    assert parse_schedule("@hourly") == {"cron": "@hourly"}
+    assert parse_schedule({"every": "3600"}) == {"every": 3600}
+    for bad in ({"every": 5}, {"every": "x"}, {"cron": "* *"}, {"at": 1}, 42):
+        with pytest.raises(ValueError):
+            parse_schedule(bad)
+    assert next_run({"every": 600}, 1000.0) == 1600.0
+    # Down for 35 minutes: one late run, then back on the 10-minute grid
+    assert next_run({"every": 600}, 1000.0 + 2100, last_due=1000.0) == 3400.0
+
+
+def test_one_shot_entry_fires_once(delayed):
+    """Test that a delayed fan-out is enqueued once, even if its occurrence is fired again."""
+    delayed_jobs, enqueued = delayed
+    jobs = [("run_job_execution", {"job_execution_id": 1}), ("run_job_execution", {"job_execution_id": 2})]
+    delayed_jobs.schedule("job:1", 1000.0, jobs, user_id=3)
+    member, _ = claim(delayed_jobs, "job:1")
+
+    assert delayed_jobs.fire(member, 1000.5) is True
+    assert enqueued == jobs
+    assert delayed_jobs.redis.hget(scheduler.SCHEDULE_DATA_KEY, "job:1") is None
+    assert delayed_jobs.redis.zsets[scheduler.SCHEDULE_CLAIMS_KEY] == {}
+
+    # A second claimant of the same occurrence (expired lease) must not enqueue again
+    delayed_jobs.redis.hset(scheduler.SCHEDULE_DATA_KEY, "job:1", json.dumps({"jobs": jobs}))
+    assert delayed_jobs.fire(member, 1001.0) is False
+    assert len(enqueued) == 2
+
+
+def test_recurring_entry_rearms_and_cancel(delayed):
+    """Test that a recurring entry is re-armed at its next occurrence and a cancelled one is skipped."""
+    delayed_jobs, enqueued = delayed
+    delayed_jobs.schedule("job:2", 1200.0, [("run_scheduled_job", {"job_id": 2})], schedule={"every": 600})
+    member, _ = claim(delayed_jobs, "job:2")
+    assert delayed_jobs.fire(member, 1201.0) is True
+    assert delayed_jobs.due_at("job:2") == 1800.0
+    assert delayed_jobs.reschedule("job:2", 2000.0) and delayed_jobs.due_at("job:2") == 2000.0
+
+    member, _ = claim(delayed_jobs, "job:2")
+    delayed_jobs.cancel("job:2")
+    assert delayed_jobs.fire(member, 2000.0) is False
+    assert len(enqueued) == 1 and delayed_jobs.due_at("job:2") is None
+    assert not delayed_jobs.reschedule("job:2", 3000.0)
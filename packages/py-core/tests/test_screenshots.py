@@ -0,0 +1,76 @@
+"""
+Tests for the screenshot pipeline.
+"""
+import io
+import asyncio
+import pytest
+from PIL import Image
+from services import storage
+from worker.screenshots import parse_screenshot, capture_screenshot, process_screenshot_sync
+
+
+def png(width=800, height=2400, color=(200, 30, 30)):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class FakePage:
+    def __init__(self, size=(1280, 20000)):
+        self.size = list(size)
+        self.calls = []
+
+    async def evaluate(self, expression):
+        return self.size
+
+    async def screenshot(self, **kwargs):
+        self.calls.append(kwargs)
+        return b"image"
+
+
+def test_parse_screenshot():
+    """Test spec normalization and validation."""
+    assert parse_screenshot("jpg")["format"] == "jpeg"
+    options = parse_screenshot({"format": "webp", "quality": 60, "fullPage": False, "thumbnail": False})
+    assert options["format"] == "webp" and options["quality"] == 60
+    assert options["full_page"] is False and options["thumbnail"] is False
+    with pytest.raises(ValueError):
+        parse_screenshot("gif")
+    with pytest.raises(ValueError):
+        parse_screenshot({"quality": 101})
+
+
+def test_capture_uses_cheapest_format_and_caps_height():
+    """Test that JPEG is captured directly and long full pages are clipped."""
+    page = FakePage()
+    data, info = asyncio.run(capture_screenshot(page, parse_screenshot({"format": "jpeg", "quality": 50, "max_height": 5000})))
+    call = page.calls[0]
+    assert call["type"] == "jpeg" and call["quality"] == 50 and call["scale"] == "css"
+    assert call["clip"] == {"x": 0, "y": 0, "width": 1280, "height": 5000}
+    assert info["truncated"] is True and info["captured_bytes"] == len(data)
+
+    page = FakePage(size=(1280, 900))
+    asyncio.run(capture_screenshot(page, parse_screenshot("webp")))
+    assert page.calls[0]["type"] == "png" and "clip" not in page.calls[0]
+
+
+def test_process_encodes_thumbnails_and_dedupes(tmp_path, monkeypatch):
+    """Test WebP encoding, thumbnail size, and that identical images are stored once."""
+    monkeypatch.setattr(storage, "SCREEN_DIR", str(tmp_path))
+    store = storage.ScreenshotStore(storage.LocalBackend(str(tmp_path)), storage.ArtifactIndex(":memory:"))
+    monkeypatch.setattr(storage, "_store", store)
+    options = parse_screenshot({"format": "webp", "quality": 60})
+
+    info = process_screenshot_sync(png(), options)
+    assert info["format"] == "webp" and info["path"].endswith(".webp")
+    assert (info["width"], info["height"]) == (800, 2400)
+    assert info["deduplicated"] is False
+    assert info["thumbnail"]["width"] == 320 and info["thumbnail"]["height"] == 640
+    assert storage.get_screenshot_path(info["path"]) is not None
+    assert storage.get_screenshot_path(info["thumbnail"]["path"]) is not None
+
+    again = process_screenshot_sync(png(), options)
+    assert again["path"] == info["path"] and again["deduplicated"] is True
+    assert again["thumbnail"]["deduplicated"] is True
+    assert len(list(tmp_path.rglob("*.webp"))) == 2
+    assert store.stats()["artifacts"] == 2 and store.stats()["refs"] == 2
@@ -0,0 +1,142 @@
+"""
+Tests for the live session supervisor.
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+import pytest
+from worker.session_supervisor import SessionSupervisor, SessionBudgetExceeded
+
+
+class FakeContext:
+    def __init__(self, options):
+        self.options = options
+        self.closed = False
+        self.pages = 0
+
+    async def new_page(self):
+        self.pages += 1
+        return object()
+
+
+class FakePool:
+    def __init__(self):
+        self.contexts = []
+
+    @asynccontextmanager
+    async def context(self, kind="headed", **options):
+        context = FakeContext(options)
+        self.contexts.append(context)
+        try:
+            yield context
+        finally:
+            context.closed = True
+
+
+def supervisor(**kwargs):
+    closed = []
+    sup = SessionSupervisor(FakePool(), on_close=lambda live, reason: closed.append((live.session_id, reason)), **kwargs)
+    return sup, closed
+
+
+def test_start_is_idempotent_and_jobs_attach():
+    """Test that a session keeps one context and jobs for its profile attach to it."""
+    async def scenario():
+        sup, _ = supervisor()
+        prepared = []
+
+        async def prepare(context):
+            prepared.append(context)
+
+        live = await sup.start(1, 10, context_options={"user_agent": "UA"}, prepare=prepare)
+        assert await sup.start(1, 10) is live
+        assert len(sup.pool.contexts) == 1 and prepared == [live.context]
+
+        async with sup.attach(10) as context:
+            assert context is live.context
+            assert live.in_use == 1
+        async with sup.attach(99) as context:
+            assert context is None
+        assert live.in_use == 0 and live.jobs == 1
+
+        assert await sup.stop(1) is True
+        assert live.context.closed
+        assert await sup.stop(1) is False
+
+    asyncio.run(scenario())
+
+
+def test_budget_evicts_least_recently_used_idle_session():
+    """Test that starting past the budget closes the LRU idle session, or refuses if all are busy."""
+    async def scenario():
+        sup, closed = supervisor(max_live=2)
+        first = await sup.start(1, 10)
+        await sup.start(2, 20)
+        async with sup.attach(10):
+            pass  # Session 1 used more recently than 2
+
+        await sup.start(3, 30)
+        assert closed == [(2, "budget")]
+        assert sup.get(2) is None and not first.context.closed
+
+        async with sup.attach(10), sup.attach(30):
+            with pytest.raises(SessionBudgetExceeded):
+                await sup.start(4, 40)
+        assert sup.stats()["evicted_budget"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_new_session_replaces_profile_session():
+    """Test that a profile has at most one live session."""
+    async def scenario():
+        sup, closed = supervisor()
+        old = await sup.start(1, 10)
+        await sup.start(2, 10)
+        assert closed == [(1, "replaced")] and old.context.closed
+        async with sup.attach(10) as context:
+            assert context is sup.get(2).context
+
+    asyncio.run(scenario())
+
+
+def test_reap_idle_and_gone_sessions():
+    """Test that idle sessions time out and sessions stopped elsewhere are closed without a callback."""
+    async def scenario():
+        sup, closed = supervisor(idle_timeout=60)
+        idle = await sup.start(1, 10)
+        await sup.start(2, 20)
+        await sup.start(3, 30)
+        idle.last_used -= 120
+
+        async with sup.attach(30):
+            reaped = await sup.reap(running_ids=lambda ids: [i for i in ids if i != 2])
+        assert sorted(reaped) == [1, 2]
+        assert closed == [(1, "idle")]
+        assert sup.stats()["live"] == 1
+
+        await sup.close()
+        assert closed[-1] == (3, "shutdown")
+        assert all(context.closed for context in sup.pool.contexts)
+
+    asyncio.run(scenario())
+
+
+def test_database_callbacks_run_off_the_loop():
+    """Test that running_ids and on_close, which query the database, are not called on the loop thread."""
+    threads = []
+
+    def record(result):
+        threads.append(threading.current_thread())
+        return result
+
+    async def scenario():
+        sup = SessionSupervisor(FakePool(), on_close=lambda live, reason: record(None))
+        await sup.start(1, 10)
+        await sup.start(2, 10)  # replaces session 1: on_close
+        await sup.reap(running_ids=lambda ids: record([]))
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(threads) == 2
+    assert all(thread is not loop_thread for thread in threads)
@@ -0,0 +1,69 @@
+"""
+Tests for session listing: eager loading, status filter and keyset pagination.
+Doubles as a query-count benchmark - the listing must not issue per-row queries.
+"""
+import pytest
+from sqlalchemy import event
+from db.models import Profile, Proxy, Session as SessionModel
+from api.routes import sessions
+
+
+def seed(db, count):
+    proxy = Proxy(host="127.0.0.1", port=8080, type="http")
+    db.add(proxy)
+    for i in range(count):
+        profile = Profile(name=f"p{i}", fingerprint={"canvas": "x" * 100})
+        db.add(profile)
+        db.add(SessionModel(profile=profile, proxy=proxy if i % 2 else None, status="running" if i % 3 else "stopped"))
+    db.commit()
+    db.expunge_all()
+
+
+def count_queries(db, fn):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements)
+
+
+@pytest.mark.parametrize("rows", [5, 50, 200])
+def test_listing_query_count_is_constant(sqlite_db, rows):
+    """Test that listing and serializing N sessions takes one query for any N."""
+    seed(sqlite_db, rows)
+
+    def run():
+        found, _ = sessions.query_sessions(sqlite_db)
+        data = [sessions.serialize_session(s) for s in found]
+        assert len(data) == rows
+        assert all(d["profile"] is not None for d in data)
+
+    assert count_queries(sqlite_db, run) == 1
+
+
+def test_status_filter(sqlite_db):
+    """Test filtering on the indexed status column."""
+    seed(sqlite_db, 30)
+    found, _ = sessions.query_sessions(sqlite_db, status_filter="stopped")
+
+    assert len(found) == 10
+    assert all(s.status == "stopped" for s in found)
+
+
+def test_keyset_pagination(sqlite_db):
+    """Test that following next_cursor visits every session once, in id order."""
+    seed(sqlite_db, 23)
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = sessions.query_sessions(sqlite_db, limit=10, cursor=cursor)
+        seen.extend(s.id for s in page)
+        if cursor is None:
+            break
+
+    assert seen == sorted(set(seen))
+    assert len(seen) == 23
@@ -0,0 +1,147 @@
+"""
+Tests for the content-addressed screenshot store and its retention GC.
+"""
+import io
+import time
+from services.storage import ArtifactIndex, LocalBackend, S3Backend, ScreenshotStore
+
+
+class FakeS3:
+    """In-memory stand-in for the S3 calls the backend makes."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise KeyError(Key)
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def local_store(tmp_path):
+    return ScreenshotStore(LocalBackend(str(tmp_path)), ArtifactIndex(":memory:"))
+
+
+def age(store, seconds):
+    """Backdate every artifact and ref."""
+    store.index.execute("UPDATE artifacts SET created_at = created_at - ?", (seconds,))
+    store.index.execute("UPDATE refs SET created_at = created_at - ?", (seconds,))
+
+
+def test_put_shards_and_dedupes(tmp_path):
+    """Test hash-sharded keys and that identical bytes are written once."""
+    store = local_store(tmp_path)
+    first = store.put(b"image-a", "png")
+    digest = first["sha256"]
+    assert first["key"] == f"{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert (tmp_path / first["key"]).read_bytes() == b"image-a"
+    assert store.put(b"image-a", "png")["deduplicated"] is True
+    assert store.stats() == {"backend": "local", "artifacts": 1, "bytes": 7, "refs": 0}
+
+
+def test_gc_age_and_orphans(tmp_path):
+    """Test that expired refs free their artifacts, thumbnails included, and fresh orphans survive."""
+    store = local_store(tmp_path)
+    old = store.put(b"old", "jpg")
+    thumb = store.put(b"old-thumb", "webp")
+    store.reference(old["key"], thumb["key"], job_exec_id=1, profile_id=1)
+    age(store, 10 * 86400)
+    store.put(b"in-flight", "jpg")  # Stored but not referenced yet
+
+    result = store.gc(max_age_days=7)
+    assert result["refs_removed"] == 1 and result["artifacts_deleted"] == 2
+    assert result["bytes_freed"] == len(b"old") + len(b"old-thumb")
+    assert not (tmp_path / old["key"]).exists()
+    assert store.stats()["artifacts"] == 1
+
+
+def test_gc_count_per_profile_and_total_bytes(tmp_path):
+    """Test keeping the newest N per profile and trimming to a byte budget."""
+    store = local_store(tmp_path)
+    for i in range(4):
+        info = store.put(f"p1-{i}".encode(), "jpg")
+        store.reference(info["key"], profile_id=1)
+        time.sleep(0.001)
+    shared = store.put(b"shared", "jpg")
+    store.reference(shared["key"], profile_id=2)
+    store.reference(shared["key"], profile_id=3)
+    age(store, 2 * 3600)
+
+    result = store.gc(max_age_days=0, per_profile=2)
+    assert result["refs_removed"] == 2 and result["artifacts_deleted"] == 2
+    assert store.stats()["refs"] == 4
+
+    # "shared" is counted once although two profiles reference it
+    result = store.gc(max_age_days=0, total_bytes=len(b"shared") + len(b"p1-3"))
+    assert result["artifacts_deleted"] == 1
+    assert store.index.has(shared["key"])
+
+
+def test_s3_backend_round_trip():
+    """Test the S3 backend against an in-memory stand-in."""
+    client = FakeS3()
+    store = ScreenshotStore(S3Backend("bucket", "shots/", client=client), ArtifactIndex(":memory:"))
+    info = store.put(b"s3-image", "webp")
+    assert client.objects[("bucket", "shots/" + info["key"])] == b"s3-image"
+    assert store.backend.get(info["key"]) == b"s3-image"
+    assert store.backend.exists(info["key"])
+    store.backend.delete(info["key"])
+    assert not store.backend.exists(info["key"])
+
+
+def test_unreference_leaves_shared_artifact_to_gc(tmp_path):
+    """Test that dropping one execution's reference keeps a shared artifact until nothing references it."""
+    store = local_store(tmp_path)
+    info = store.put(b"shared", "jpg")
+    store.reference(info["key"], job_exec_id=1, profile_id=1)
+    store.reference(info["key"], job_exec_id=2, profile_id=2)
+    age(store, 2 * 3600)
+
+    assert store.unreference(info["key"], job_exec_id=1) is True
+    assert store.unreference(info["key"], job_exec_id=1) is False
+    assert store.gc(max_age_days=0)["artifacts_deleted"] == 0
+    assert (tmp_path / info["key"]).exists()
+
+    assert store.unreference(info["key"]) is True
+    assert store.gc(max_age_days=0)["artifacts_deleted"] == 1
+    assert not (tmp_path / info["key"]).exists()
+
+
+def test_dedupe_hit_is_referenced_before_gc(tmp_path):
+    """Test that re-storing an old orphan references it in the same transaction, so GC keeps it."""
+    store = local_store(tmp_path)
+    orphan = store.put(b"again", "jpg")
+    age(store, 2 * 3600)
+    assert store.index.orphans() == [orphan["key"]]
+
+    info = store.put(b"again", "jpg", lambda conn, key: store.index.insert_ref(conn, key, None, 7, 1))
+    assert info["deduplicated"] is True
+    # GC that listed the orphan before the put re-checks it before deleting
+    assert store.index.remove_orphan(orphan["key"], store.backend.delete) is None
+    assert store.gc(max_age_days=0)["artifacts_deleted"] == 0
+    assert (tmp_path / orphan["key"]).exists()
+
+
+def test_gc_leaves_a_shared_bucket_alone():
+    """Test that GC on S3 only drops refs unless every writer shares the index."""
+    client = FakeS3()
+    store = ScreenshotStore(S3Backend("bucket", "shots/", client=client), ArtifactIndex(":memory:"))
+    info = store.put(b"elsewhere", "jpg")
+    age(store, 2 * 3600)
+
+    result = store.gc(max_age_days=0)
+    assert result["artifacts_deleted"] == 0 and result["orphans_kept"] == 1
+    assert ("bucket", "shots/" + info["key"]) in client.objects
+
+    store.gc_delete = True
+    assert store.gc(max_age_days=0)["artifacts_deleted"] == 1
+    assert not client.objects
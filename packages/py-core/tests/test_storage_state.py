@@ -0,0 +1,68 @@
+"""
+Tests for per-profile storage state persistence.
+"""
+import os
+import asyncio
+from worker.storage_state import StorageStateStore, storage_enabled, trim_state
+
+
+def state(cookie="a", origins=()):
+    return {
+        "cookies": [{"name": "sid", "value": cookie, "domain": "site.com", "path": "/"}],
+        "origins": [{"origin": o, "localStorage": [{"name": "k", "value": v}]} for o, v in origins],
+    }
+
+
+class FakeContext:
+    def __init__(self, value):
+        self.value = value
+
+    async def storage_state(self):
+        return self.value
+
+
+def test_round_trip_and_unchanged_skip(tmp_path):
+    """Test that state is saved, loaded back, and identical saves are skipped."""
+    store = StorageStateStore(root=str(tmp_path))
+    assert store.load(1) is None
+
+    assert asyncio.run(store.save(1, FakeContext(state("x")))) is True
+    assert store.load(1) == state("x")
+    assert store.save_state(1, state("x")) is False
+    assert store.save_state(1, state("y")) is True
+    assert store.stats()["saves"] == 2 and store.stats()["unchanged"] == 1
+
+
+def test_oversize_state_trimmed(tmp_path):
+    """Test that the largest localStorage origins are dropped to fit the cap."""
+    big = state(origins=[("https://small", "s"), ("https://big", "b" * 5000)])
+    trimmed = trim_state(big, 1000)
+    assert [o["origin"] for o in trimmed["origins"]] == ["https://small"]
+    assert trim_state(state("c" * 2000), 500) is None
+
+    store = StorageStateStore(root=str(tmp_path), max_bytes=1000)
+    assert store.save_state(1, big) is True
+    assert store.stats()["trimmed"] == 1
+
+
+def test_lru_gc_across_profiles(tmp_path):
+    """Test that the least recently used profiles are evicted first."""
+    store = StorageStateStore(root=str(tmp_path))
+    for profile_id in (1, 2, 3):
+        store.save_state(profile_id, state(str(profile_id) * 100))
+    for age, profile_id in ((300, 1), (200, 2), (100, 3)):
+        os.utime(store.path(profile_id), (0, os.path.getmtime(store.path(profile_id)) - age))
+    store.load(1)  # Recently used again
+
+    size = os.path.getsize(store.path(1))
+    store.total_bytes = size * 2
+    assert store.gc() == 1
+    assert not store.path(2).exists()
+    assert store.path(1).exists() and store.path(3).exists()
+    # An evicted profile is written again even with the same state
+    assert store.save_state(2, state("2" * 100)) is True
+
+
+def test_payload_override():
+    assert storage_enabled({"persist_storage": False}) is False
+    assert storage_enabled({"persist_storage": True}) is True
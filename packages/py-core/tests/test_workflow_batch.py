@@ -0,0 +1,78 @@
+"""
+Tests for the run_workflow_batch handler (browser work replaced by a fake runner).
+"""
+import asyncio
+from sqlalchemy import event
+from db.models import Job, JobExecution, Profile, Workflow
+from worker import run_job
+
+
+class FakePool:
+    def stats(self):
+        return {}
+
+
+class FakeExecutor:
+    browser_pool = FakePool()
+
+
+def setup_batch(db, count):
+    workflow = Workflow(name="wf", data={"nodes": [{"id": "s", "type": "start"}], "edges": []})
+    profiles = [Profile(name=f"p{i}") for i in range(count)]
+    job = Job(type="run_workflow_batch", payload={"workflow_id": 1})
+    db.add_all([workflow, job, *profiles])
+    db.commit()
+    executions = [JobExecution(job_id=job.id, profile_id=p.id, status="pending") for p in profiles]
+    db.add_all(executions)
+    db.commit()
+    return workflow, [e.id for e in executions]
+
+
+def test_batch_runs_profiles_concurrently_with_bulk_updates(sqlite_db, monkeypatch):
+    """Test that one batch job runs every profile, bounded, and writes statuses in bulk."""
+    workflow, exec_ids = setup_batch(sqlite_db, 6)
+    active = {"now": 0, "peak": 0}
+    events = []
+
+    async def fake_run(pool, plan, profile, proxy_config, kind="headed", blocking=None, persist_storage=True):
+        assert plan.valid
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        if profile.name == "p2":
+            raise RuntimeError("boom")
+        return {"success": True, "results": []}
+
+    monkeypatch.setattr(run_job, "run_workflow_for_profile", fake_run)
+    monkeypatch.setattr(run_job, "get_executor", lambda: FakeExecutor())
+    monkeypatch.setattr(run_job, "emit_event", lambda name, data: events.append(data["status"]))
+    monkeypatch.setattr(run_job, "log_to_db", lambda *args, **kwargs: None)
+    failures = []
+    monkeypatch.setattr(run_job, "handle_job_failure", lambda job_type, payload, exc: failures.append((job_type, payload, exc)))
+
+    updates = []
+    listener = lambda *args: updates.append(args[2]) if args[2].startswith("UPDATE") else None
+    event.listen(sqlite_db.get_bind(), "before_cursor_execute", listener)
+    try:
+        summary = asyncio.run(run_job.handle_run_workflow_batch(
+            {"workflow_id": workflow.id, "job_execution_ids": exec_ids, "concurrency": 2},
+            sqlite_db,
+        ))
+    finally:
+        event.remove(sqlite_db.get_bind(), "before_cursor_execute", listener)
+
+    assert summary == {"workflow_id": workflow.id, "profiles": 6, "completed": 5, "failed": 1, "cancelled": 0, "retrying": 0}
+    # The failed profile goes through the retry/dead-letter path as its own run_workflow job
+    [(job_type, retry_payload, exc)] = failures
+    assert job_type == "run_workflow" and str(exc) == "boom"
+    assert retry_payload["workflow_id"] == workflow.id and retry_payload["job_execution_id"] in exec_ids
+    assert active["peak"] == 2
+    # One UPDATE marks the batch running, one executemany writes the outcomes
+    assert len(updates) == 2
+
+    sqlite_db.expire_all()
+    statuses = {e.profile.name: e.status for e in sqlite_db.query(JobExecution).all()}
+    assert statuses["p2"] == "failed"
+    assert sum(status == "completed" for status in statuses.values()) == 5
+    assert events.count("running") == 6 and len(events) == 12
@@ -0,0 +1,227 @@
+"""
+Tests for the compiled workflow plan and its cache.
+"""
+import asyncio
+from worker import workflow_executor
+from worker.workflow_executor import (
+    PlanCache,
+    compile_workflow,
+    execute_workflow,
+    topological_sort,
+)
+
+
+class RecordingPage:
+    """Records page calls instead of driving a browser."""
+
+    def __init__(self):
+        self.calls = []
+        self.url = "about:blank"
+
+    async def goto(self, url, **kwargs):
+        self.calls.append(("goto", url))
+        self.url = url
+
+    async def click(self, selector):
+        self.calls.append(("click", selector))
+
+
+def node(node_id, action="click", **config):
+    return {"id": node_id, "type": action, "data": {"config": config or {"selector": f"#{node_id}"}}}
+
+
+def edge(source, target):
+    return {"source": source, "target": target}
+
+
+def diamond():
+    return {
+        "nodes": [node("start", "start"), node("a"), node("b"), node("join", "merge"), node("end", "end")],
+        "edges": [edge("start", "a"), edge("start", "b"), edge("a", "join"), edge("b", "join"), edge("join", "end")],
+    }
+
+
+def test_order_respects_dependencies():
+    """Test that every node runs after all of its predecessors, merge included."""
+    plan = compile_workflow(diamond())
+    order = [step.node_id for step in plan.order]
+    assert order == ["start", "a", "b", "join", "end"]
+    assert plan.predecessors["join"] == ["a", "b"]
+    assert plan.valid
+
+
+def test_large_chain_compiles():
+    """Test that a long generated graph compiles in linear order."""
+    count = 5000
+    data = {
+        "nodes": [node(str(i)) for i in range(count)],
+        "edges": [edge(str(i), str(i + 1)) for i in range(count - 1)],
+    }
+    plan = compile_workflow(data)
+    assert [step.node_id for step in plan.order] == [str(i) for i in range(count)]
+
+
+def test_cycle_and_unknown_action_rejected_up_front():
+    """Test that invalid graphs fail before any action runs."""
+    data = {
+        "nodes": [node("start", "start"), node("a"), node("b"), node("x", "teleport")],
+        "edges": [edge("start", "a"), edge("a", "b"), edge("b", "a")],
+    }
+    plan = compile_workflow(data)
+    assert any("cycle" in e for e in plan.errors)
+    assert any("teleport" in e for e in plan.errors)
+
+    page = RecordingPage()
+    result = asyncio.run(execute_workflow(page, plan))
+    assert result["success"] is False
+    assert page.calls == []
+
+
+def test_execute_runs_plan_and_stops_on_error():
+    """Test execution order and the unreached report after a failure."""
+    data = {
+        "nodes": [node("start", "start"), node("open", "openPage"), node("end", "end")],
+        "edges": [edge("start", "open"), edge("open", "end")],
+    }
+    page = RecordingPage()
+    result = asyncio.run(execute_workflow(page, data))
+    assert result["success"] is False  # openPage without url
+    assert [r["node_id"] for r in result["results"]] == ["start", "open"]
+    assert "Nodes never reached: ['end']" in result["errors"]
+
+    result = asyncio.run(execute_workflow(page, diamond()))
+    assert result["success"] is True
+    assert page.calls == [("click", "#a"), ("click", "#b")]
+
+
+def test_plan_cache_compiles_once_per_version():
+    """Test that plans are reused per version and recompiled when it changes."""
+    cache = PlanCache(maxsize=4)
+    first = cache.get(diamond(), "1:v1")
+    assert cache.get(diamond(), "1:v1") is first
+    assert cache.get(diamond(), "1:v2") is not first
+    assert cache.get(diamond()) is cache.get(diamond())
+    assert cache.stats() == {"hits": 2, "compiles": 3, "size": 3}
+
+
+def test_topological_sort_keeps_cycle_nodes():
+    """Test that topological_sort still returns every node."""
+    data = {"nodes": [node("a"), node("b"), node("c")], "edges": [edge("b", "c"), edge("c", "b")]}
+    assert [n["id"] for n in topological_sort(data["nodes"], data["edges"])] == ["a", "b", "c"]
+
+
+class SlowPage:
+    """Page whose clicks take a fixed time; tracks how many run at once."""
+
+    def __init__(self, context, delay=0.05):
+        self.context = context
+        self.delay = delay
+        self.url = "about:blank"
+        self.closed = False
+
+    async def click(self, selector):
+        self.context.active += 1
+        self.context.peak = max(self.context.peak, self.context.active)
+        self.context.calls.append((id(self), selector))
+        await asyncio.sleep(self.delay)
+        self.context.active -= 1
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+
+    async def new_page(self):
+        page = SlowPage(self)
+        self.pages.append(page)
+        return page
+
+
+def fan_out(width):
+    nodes = [node("start", "start")] + [node(f"b{i}") for i in range(width)] + [node("join", "merge"), node("after")]
+    edges = [edge("start", f"b{i}") for i in range(width)]
+    edges += [edge(f"b{i}", "join") for i in range(width)] + [edge("join", "after")]
+    return {"nodes": nodes, "edges": edges, "maxParallel": width}
+
+
+def test_branches_assigned_per_fork():
+    """Test that fork successors get their own branches and the join continues one."""
+    plan = compile_workflow(fan_out(3))
+    assert plan.branch_count == 3
+    assert plan.branch_of["start"] == plan.branch_of["b0"] == plan.branch_of["join"] == plan.branch_of["after"]
+    assert len({plan.branch_of[f"b{i}"] for i in range(3)}) == 3
+
+
+def test_parallel_branches_join_at_merge():
+    """Test that branches overlap, merge waits for all of them, and pages are cleaned up."""
+    context = FakeContext()
+    page = SlowPage(context)
+    result = asyncio.run(execute_workflow(page, fan_out(3)))
+
+    assert result["success"] is True
+    assert result["mode"] == "parallel"
+    assert context.peak == 3
+    assert len(context.pages) == 2 and all(p.closed for p in context.pages)
+    assert not page.closed
+
+    order = [r["node_id"] for r in result["results"]]
+    assert order.index("join") > max(order.index(f"b{i}") for i in range(3))
+    assert context.calls[-1] == (id(page), "#after")
+    assert set(result["branches"]) == {"0", "1", "2"}
+    # Sequentially this is 4 x 50ms; in parallel it is one branch plus the tail (~100ms)
+    assert result["duration_ms"] < 180
+
+
+def test_parallel_limit_and_sequential_override():
+    """Test that max_parallel caps concurrency and 1 falls back to sequential."""
+    context = FakeContext()
+    result = asyncio.run(execute_workflow(SlowPage(context, delay=0.01), fan_out(4), max_parallel=2))
+    assert result["success"] is True
+    assert context.peak == 2
+
+    context = FakeContext()
+    result = asyncio.run(execute_workflow(SlowPage(context, delay=0.01), fan_out(4), max_parallel=1))
+    assert result["success"] is True
+    assert "mode" not in result
+    assert context.peak == 1 and context.pages == []
+
+
+def test_parallel_failure_stops_new_nodes():
+    """Test that a failing branch prevents the merge and later nodes from running."""
+    data = fan_out(2)
+    data["nodes"][1] = node("b0", "openPage", url="")
+    context = FakeContext()
+    result = asyncio.run(execute_workflow(SlowPage(context), data))
+
+    assert result["success"] is False
+    ran = {r["node_id"] for r in result["results"]}
+    assert "join" not in ran and "after" not in ran
+    assert any("never reached" in e for e in result["errors"])
+
+
+def test_parallel_branch_pages_start_at_the_fork(monkeypatch):
+    """Test that forked branch pages open at the URL the parent page had when the fork node finished."""
+    visits = []
+
+    async def fake_navigate(page, url, readiness=None, timeout=None):
+        visits.append((page, url))
+        page.url = url
+        return {"strategy": "load", "timed_out": False}
+
+    monkeypatch.setattr(workflow_executor, "navigate", fake_navigate)
+    data = fan_out(3)
+    data["nodes"][0] = node("start", "openPage", url="https://shop.example/cart")
+    context = FakeContext()
+    page = SlowPage(context)
+    result = asyncio.run(execute_workflow(page, data))
+
+    assert result["success"] is True
+    forked = [(p, url) for p, url in visits if p is not page]
+    assert len(forked) == 2 and {p for p, _ in forked} == set(context.pages)
+    assert all(url == "https://shop.example/cart" for _, url in forked)
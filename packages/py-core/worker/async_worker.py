@@ -0,0 +1,172 @@
+"""
+Concurrent RQ consumer - runs up to MAX_CONCURRENCY jobs at once in a single process.
+Pulls jobs from the RQ queues only while the executor has capacity (backpressure)
+and keeps RQ's started/finished/failed registries up to date. Queues are served
+by lane priority, weighted between lanes and round-robin between users' sub-queues.
+Also runs the delayed/recurring job scheduler loop (SCHEDULER_ENABLED).
+
+Usage:
+    python -m worker.async_worker
+"""
+import os
+import time
+import signal
+import socket
+import threading
+import traceback
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from rq import Queue
+from rq.exceptions import DequeueTimeout
+from rq.job import Job as RQJob, JobStatus
+from rq.registry import StartedJobRegistry
+from rq.utils import utcnow
+from worker.queue import redis_conn, get_queue, lane_queues, lane_of_queue, record_dequeue, LaneScheduler
+from worker.executor import get_executor
+from worker.scheduler import start_scheduler_thread
+from worker.run_job import handle_job_failure
+from worker.log_sink import get_log_sink
+
+logger = logging.getLogger("ntg.async_worker")
+
+PROCESS_JOB_FUNC = "worker.run_job.process_job"
+DEQUEUE_TIMEOUT = 5  # seconds; also bounds how quickly shutdown is noticed
+QUEUE_REFRESH_INTERVAL = 2  # seconds between reloads of the users' sub-queues
+QUEUE_PRUNE_INTERVAL = 60  # seconds between removals of idle, empty sub-queues
+# Threads recording finished jobs (RQ registries, retries, dead letters) off the executor loop
+FINISH_WORKERS = int(os.getenv("ASYNC_WORKER_FINISH_WORKERS", "2"))
+
+
+class AsyncWorker:
+    """Feeds RQ jobs into the shared JobExecutor."""
+
+    def __init__(self):
+        self.executor = get_executor()
+        self.name = f"ntg-async-{socket.gethostname()}-{os.getpid()}"
+        self.scheduler = LaneScheduler()
+        self._registries = {}
+        self._queues_by_lane = None
+        self._refreshed_at = 0.0
+        self._pruned_at = 0.0
+        self._stopping = False
+        self._scheduler_stop = threading.Event()
+        self._finisher = ThreadPoolExecutor(max_workers=max(1, FINISH_WORKERS), thread_name_prefix="ntg-finish")
+
+    def _registry(self, job: RQJob) -> StartedJobRegistry:
+        registry = self._registries.get(job.origin)
+        if registry is None:
+            registry = self._registries[job.origin] = StartedJobRegistry(job.origin, connection=redis_conn)
+        return registry
+
+    def request_stop(self, *_):
+        logger.info("Shutdown requested; finishing in-flight jobs")
+        self._stopping = True
+
+    def _start(self, job: RQJob):
+        with redis_conn.pipeline() as pipeline:
+            job.prepare_for_execution(self.name, pipeline)
+            timeout = job.timeout or Queue.DEFAULT_TIMEOUT
+            self._registry(job).add(job, timeout + 60, pipeline=pipeline)
+            pipeline.execute()
+
+    def _finish(self, job: RQJob, future):
+        """Record a finished job; runs on a finisher thread as it does blocking DB and Redis work."""
+        job.ended_at = utcnow()
+        try:
+            try:
+                job._result = future.result()
+            except Exception as e:
+                # A scheduled retry counts as a finished RQ job; its result says so
+                job._result = handle_job_failure(job.args[0], job.args[1], e, job)
+                if job._result is None:
+                    raise
+            with redis_conn.pipeline() as pipeline:
+                job._handle_success(job.get_result_ttl(3600), pipeline=pipeline)
+                self._registry(job).remove(job, pipeline=pipeline)
+                pipeline.execute()
+        except BaseException as e:
+            exc_string = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            with redis_conn.pipeline() as pipeline:
+                job.set_status(JobStatus.STOPPED if future.cancelled() else JobStatus.FAILED, pipeline=pipeline)
+                job._handle_failure(exc_string, pipeline=pipeline)
+                self._registry(job).remove(job, pipeline=pipeline)
+                pipeline.execute()
+        finally:
+            # Write this job's logs (including handle_job_failure's) now, as process_job does
+            get_log_sink().flush(wait=True)
+
+    def _submit(self, job: RQJob):
+        if job.func_name != PROCESS_JOB_FUNC:
+            logger.error("Job %s has unsupported function %s", job.id, job.func_name)
+            with redis_conn.pipeline() as pipeline:
+                job.set_status(JobStatus.FAILED, pipeline=pipeline)
+                job._handle_failure(f"Unsupported function {job.func_name}", pipeline=pipeline)
+                pipeline.execute()
+            return
+
+        job_type, payload = job.args[0], job.args[1]
+        self._start(job)
+        # RQ enforces job.timeout by killing its work horse; here the executor cancels the job (-1 = no limit)
+        future = self.executor.submit(job_type, payload, job_key=job.id, job_timeout=job.timeout or Queue.DEFAULT_TIMEOUT)
+        # Done callbacks run on the executor loop; keep the loop free for the other jobs
+        future.add_done_callback(lambda f: self._finisher.submit(self._finish, job, f))
+
+    def _dequeue(self):
+        """Next job by lane priority and fairness; blocks up to DEQUEUE_TIMEOUT when all queues are empty."""
+        now = time.monotonic()
+        if self._queues_by_lane is None or now - self._refreshed_at >= QUEUE_REFRESH_INTERVAL:
+            prune = now - self._pruned_at >= QUEUE_PRUNE_INTERVAL
+            self._queues_by_lane = lane_queues(prune=prune)
+            self._refreshed_at = now
+            if prune:
+                self._pruned_at = now
+
+        queues = [get_queue(name) for name in self.scheduler.order(self._queues_by_lane)]
+        # Non-blocking pass in scheduler order, then BLPOP (which also honours key order)
+        result = Queue.dequeue_any(queues, None, connection=redis_conn)
+        if result is None:
+            result = Queue.dequeue_any(queues, DEQUEUE_TIMEOUT, connection=redis_conn)
+        if result is None:
+            return None
+        job, queue = result
+        self.scheduler.served(queue.name)
+        try:
+            record_dequeue(lane_of_queue(queue.name), job)
+        except Exception:
+            logger.exception("Failed to record queue metrics")
+        return job
+
+    def work(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        logger.info("%s listening on all lanes (max_concurrency=%s)", self.name, self.executor.max_concurrency)
+        start_scheduler_thread(self._scheduler_stop)
+
+        while not self._stopping:
+            # Backpressure: only take work from Redis when a job could start without queuing locally
+            if not self.executor.wait_for_capacity(timeout=DEQUEUE_TIMEOUT):
+                continue
+
+            try:
+                job = self._dequeue()
+            except DequeueTimeout:
+                continue
+            if job is None:
+                continue
+            try:
+                self._submit(job)
+            except Exception:
+                logger.exception("Failed to start job %s", job.id)
+
+        self._scheduler_stop.set()
+        self.executor.shutdown()
+        self._finisher.shutdown(wait=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    AsyncWorker().work()
+
+
+if __name__ == "__main__":
+    main()
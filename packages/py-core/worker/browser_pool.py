@@ -0,0 +1,235 @@
+"""
+Warm browser pool for the worker.
+Keeps launched Chromium instances alive across jobs and hands out a fresh
+BrowserContext per job, recycling browsers after N contexts or on crash.
+"""
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_POOL_RECYCLE_AFTER = int(os.getenv("BROWSER_POOL_RECYCLE_AFTER", "50"))
+BROWSER_POOL_CONTEXTS_PER_BROWSER = int(os.getenv("BROWSER_POOL_CONTEXTS_PER_BROWSER", "8"))
+
+# Chromium args shared by every pooled launch
+BASE_BROWSER_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--use-fake-device-for-media-stream",
+    "--use-fake-ui-for-media-stream",
+    "--disable-webgpu",
+    "--disable-features=WebRtcHideLocalIpsWithMdns",
+    "--force-webrtc-ip-handling-policy=disable_non_proxied_udp",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--autoplay-policy=no-user-gesture-required",
+]
+
+# Launch profiles: headless for job executions, headed for workflows so the user can watch
+LAUNCH_PROFILES: Dict[str, Dict[str, Any]] = {
+    "headless": {
+        "headless": True,
+        "args": BASE_BROWSER_ARGS,
+    },
+    "headed": {
+        "headless": False,
+        "args": BASE_BROWSER_ARGS + ["--disable-infobars"],  # Hide "Chrome is being controlled" message
+    },
+}
+
+
+class PooledBrowser:
+    """A launched browser plus the bookkeeping needed to decide when to recycle it."""
+
+    def __init__(self, browser: Browser, kind: str):
+        self.browser = browser
+        self.kind = kind
+        self.contexts_served = 0
+        self.active_contexts = 0
+        self.crashed = False
+        self.draining = False  # No new contexts; closed once the last active one is returned
+        browser.on("disconnected", lambda _: self._mark_crashed())
+
+    def _mark_crashed(self):
+        self.crashed = True
+
+    @property
+    def healthy(self) -> bool:
+        return not self.crashed and self.browser.is_connected()
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.draining
+
+
+class BrowserPool:
+    """
+    Size-bounded pool of launched browsers, one list per launch profile.
+    All methods must run on the event loop that owns the pool.
+    """
+
+    def __init__(
+        self,
+        max_browsers: int = BROWSER_POOL_SIZE,
+        recycle_after: int = BROWSER_POOL_RECYCLE_AFTER,
+        contexts_per_browser: int = BROWSER_POOL_CONTEXTS_PER_BROWSER,
+    ):
+        self.max_browsers = max(1, max_browsers)
+        self.recycle_after = max(1, recycle_after)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self._playwright: Optional[Playwright] = None
+        self._browsers: Dict[str, List[PooledBrowser]] = {}
+        self._launch_locks: Dict[str, asyncio.Lock] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "launches": 0,
+            "launch_ms_total": 0.0,
+            "launch_ms_max": 0.0,
+            "recycled": 0,
+            "crashed": 0,
+            "contexts_created": 0,
+        }
+
+    async def _ensure_playwright(self) -> Playwright:
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        return self._playwright
+
+    async def _launch(self, kind: str) -> PooledBrowser:
+        if kind not in LAUNCH_PROFILES:
+            raise ValueError(f"Unknown launch profile: {kind}")
+
+        playwright = await self._ensure_playwright()
+        started = time.perf_counter()
+        browser = await playwright.chromium.launch(**LAUNCH_PROFILES[kind])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self._stats["launches"] += 1
+        self._stats["launch_ms_total"] += elapsed_ms
+        self._stats["launch_ms_max"] = max(self._stats["launch_ms_max"], elapsed_ms)
+
+        pooled = PooledBrowser(browser, kind)
+        self._browsers.setdefault(kind, []).append(pooled)
+        return pooled
+
+    async def _retire(self, pooled: PooledBrowser):
+        browsers = self._browsers.get(pooled.kind, [])
+        if pooled in browsers:
+            browsers.remove(pooled)
+        try:
+            await pooled.browser.close()
+        except Exception:
+            pass
+
+    def _pick(self, kind: str) -> Optional[PooledBrowser]:
+        """Least-loaded available browser with spare context capacity, if any."""
+        candidates = [
+            b for b in self._browsers.get(kind, [])
+            if b.available and b.active_contexts < self.contexts_per_browser
+        ]
+        return min(candidates, key=lambda b: b.active_contexts) if candidates else None
+
+    async def _checkout(self, kind: str) -> PooledBrowser:
+        """Return a browser for `kind`, launching one if the pool has none to spare."""
+        pooled = self._pick(kind)
+        if pooled:
+            self._stats["hits"] += 1
+            return pooled
+
+        # Serialize launches per profile so a burst of jobs doesn't launch a browser each
+        lock = self._launch_locks.setdefault(kind, asyncio.Lock())
+        async with lock:
+            pooled = self._pick(kind)
+            if pooled:
+                self._stats["hits"] += 1
+                return pooled
+
+            browsers = self._browsers.setdefault(kind, [])
+            for stale in [b for b in browsers if not b.healthy and b.active_contexts == 0]:
+                self._stats["crashed"] += 1
+                await self._retire(stale)
+
+            live = [b for b in browsers if b.available]
+            if len(browsers) >= self.max_browsers and live:
+                # Pool is full: oversubscribe the least-loaded browser rather than exceed the bound
+                self._stats["hits"] += 1
+                return min(live, key=lambda b: b.active_contexts)
+
+            self._stats["misses"] += 1
+            return await self._launch(kind)
+
+    async def _checkin(self, pooled: PooledBrowser):
+        pooled.active_contexts -= 1
+        if not pooled.healthy:
+            pooled.draining = True
+        elif pooled.contexts_served >= self.recycle_after:
+            pooled.draining = True
+
+        if pooled.draining and pooled.active_contexts <= 0:
+            self._stats["crashed" if not pooled.healthy else "recycled"] += 1
+            await self._retire(pooled)
+
+    @asynccontextmanager
+    async def context(self, kind: str = "headless", **context_options):
+        """
+        Lease a fresh BrowserContext from a pooled browser.
+        The context is always closed on exit; the browser stays warm unless it is due for recycling.
+        """
+        pooled = await self._checkout(kind)
+        pooled.active_contexts += 1
+        try:
+            context: BrowserContext = await pooled.browser.new_context(**context_options)
+        except Exception:
+            # Browser died between health check and use; replace it once
+            pooled.crashed = True
+            await self._checkin(pooled)
+            pooled = await self._checkout(kind)
+            pooled.active_contexts += 1
+            try:
+                context = await pooled.browser.new_context(**context_options)
+            except Exception:
+                await self._checkin(pooled)
+                raise
+
+        pooled.contexts_served += 1
+        self._stats["contexts_created"] += 1
+        try:
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Exception:
+                pass
+            await self._checkin(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for pool hit/miss, launches and launch latency."""
+        launches = self._stats["launches"]
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "launch_ms_avg": round(self._stats["launch_ms_total"] / launches, 1) if launches else 0.0,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "browsers": {kind: len(browsers) for kind, browsers in self._browsers.items()},
+        }
+
+    async def close(self):
+        """Close every pooled browser and stop Playwright."""
+        for browsers in list(self._browsers.values()):
+            for pooled in list(browsers):
+                await self._retire(pooled)
+        self._browsers.clear()
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
@@ -0,0 +1,161 @@
+"""
+Cooperative cancellation of running work.
+The API sets a cancel flag in Redis for a job execution or a session. The worker
+running it checks the flag between workflow nodes and before navigations, and
+a watcher polls it every CANCEL_POLL_INTERVAL seconds and interrupts the job's
+task, so a page stuck in a navigation or wait is let go as well. Either way the
+work ends with JobCancelled, its browser context is released, and its row is
+recorded as cancelled.
+"""
+import os
+import time
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Flags outlive the work they target by this long; queued work is also skipped by its row's status
+CANCEL_TTL = int(os.getenv("CANCEL_TTL", "86400"))
+CANCEL_POLL_INTERVAL = float(os.getenv("CANCEL_POLL_INTERVAL", "1"))  # seconds; 0 = only check at node boundaries
+
+CANCEL_KEY = "ntg:cancel:{kind}:{target_id}"
+CANCEL_KINDS = ("execution", "session")
+# After a Redis error, stop polling for this long
+REDIS_RETRY_AFTER = 30
+
+Target = Tuple[str, int]
+
+
+class JobCancelled(Exception):
+    """Raised in work whose cancel flag was set; the message is the cancel reason."""
+
+
+def cancel_key(kind: str, target_id: int) -> str:
+    if kind not in CANCEL_KINDS:
+        raise ValueError(f"Unknown cancel target: {kind}")
+    return CANCEL_KEY.format(kind=kind, target_id=target_id)
+
+
+class CancelFlags:
+    """Cancel flags in Redis: key per target, value is the reason."""
+
+    def __init__(self, redis_client, ttl: int = CANCEL_TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+        self._down_until = 0.0
+
+    def request(self, targets: Iterable[Target], reason: str = "Cancelled") -> int:
+        """Flag targets for cancellation. Raises on Redis errors so the caller can report them."""
+        keys = [cancel_key(kind, target_id) for kind, target_id in targets]
+        if not keys:
+            return 0
+        with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(key, reason, ex=self.ttl)
+            pipe.execute()
+        return len(keys)
+
+    def reason(self, keys: List[str]) -> Optional[str]:
+        """Reason of the first flagged key, or None. Redis errors count as not cancelled."""
+        if not keys or time.monotonic() < self._down_until:
+            return None
+        try:
+            values = self.redis.mget(keys)
+        except Exception as e:
+            self._down_until = time.monotonic() + REDIS_RETRY_AFTER
+            print(f"Cancel flags: Redis unavailable ({e}); not checking for {REDIS_RETRY_AFTER}s")
+            return None
+        for value in values:
+            if value is not None:
+                return value.decode() if isinstance(value, bytes) else str(value)
+        return None
+
+
+def _default_redis():
+    try:
+        from redis import Redis
+        return Redis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+    except Exception:
+        return None
+
+
+_flags: Optional[CancelFlags] = None
+_flags_lock = threading.Lock()
+
+
+def get_cancel_flags() -> CancelFlags:
+    """Per-process cancel flags, created lazily."""
+    global _flags
+    with _flags_lock:
+        if _flags is None:
+            _flags = CancelFlags(_default_redis())
+        return _flags
+
+
+# Scope of the work running in the current task (see CancelScope)
+current_scope: ContextVar[Optional["CancelScope"]] = ContextVar("ntg_cancel_scope", default=None)
+
+
+class CancelScope:
+    """
+    Async context manager around one unit of work (an execution, a session start).
+    Raises JobCancelled on entry if the work is already flagged, from check()
+    when it is flagged, and on exit after the watcher interrupted the task.
+    """
+
+    def __init__(self, targets: Iterable[Target], flags: Optional[CancelFlags] = None, interval: float = CANCEL_POLL_INTERVAL):
+        self.keys = [cancel_key(kind, target_id) for kind, target_id in targets]
+        self.flags = flags or get_cancel_flags()
+        self.interval = interval
+        self.reason: Optional[str] = None
+        self._interrupted = False
+        self._task: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._token = None
+
+    def check(self):
+        reason = self.flags.reason(self.keys)
+        if reason is not None:
+            raise JobCancelled(reason)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            reason = self.flags.reason(self.keys)
+            if reason is not None:
+                self.reason = reason
+                self._interrupted = True
+                self._task.cancel()
+                return
+
+    async def __aenter__(self) -> "CancelScope":
+        self.check()
+        self._task = asyncio.current_task()
+        self._token = current_scope.set(self)
+        if self.interval > 0 and self.keys:
+            self._watcher = asyncio.ensure_future(self._watch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._watcher:
+            self._watcher.cancel()
+        current_scope.reset(self._token)
+        if self._interrupted and exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            # Our own interruption: the task goes on to record the cancellation.
+            # Python 3.11+ counts pending cancellations per task; older versions have no count to undo
+            uncancel = getattr(self._task, "uncancel", None)
+            if uncancel is not None:
+                uncancel()
+            raise JobCancelled(self.reason) from None
+        return False
+
+
+def check_cancelled():
+    """Raise JobCancelled if the work running in this task was flagged; no-op outside a CancelScope."""
+    scope = current_scope.get()
+    if scope is not None:
+        scope.check()
@@ -0,0 +1,266 @@
+"""
+Asyncio job executor - runs many worker jobs concurrently in one process.
+Owns a background event loop thread, the browser pool and per-job futures so
+jobs can be awaited, bounded and cancelled from synchronous code (RQ, API).
+"""
+import os
+import asyncio
+import threading
+import atexit
+import uuid
+from contextvars import ContextVar
+from concurrent.futures import Future, wait as wait_futures
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+from db.database import use_pool_profile
+from worker.browser_pool import BrowserPool
+from worker.log_sink import get_log_sink, close_log_sink
+from services.injection_cache import get_injection_cache
+from worker.workflow_executor import plan_cache
+from worker.storage_state import get_storage_state_store
+from worker.session_supervisor import SessionSupervisor
+from worker.screenshots import screenshot_stats, run_gc_loop, SCREENSHOT_GC_INTERVAL
+from services.storage import screenshot_store_stats
+from worker.rate_limit import get_rate_limiter
+
+load_dotenv()
+
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "10"))
+# Jobs allowed to wait for a slot before submit() blocks the caller
+MAX_PENDING = int(os.getenv("EXECUTOR_MAX_PENDING", str(MAX_CONCURRENCY)))
+
+
+class ExecutorFull(Exception):
+    """Raised by submit(block=False) when no admission slot is free."""
+
+
+class JobTimeout(TimeoutError):
+    """A job ran past its timeout and was interrupted; retried like other timeouts."""
+
+
+# Error recorded on the rows of a job interrupted by its timeout
+JOB_TIMEOUT_REASON = "Job timed out"
+
+# Deadline of the job running in the current task: {"expired": bool}, None without a timeout
+_deadline: ContextVar[Optional[Dict[str, bool]]] = ContextVar("ntg_job_deadline", default=None)
+
+
+def job_timed_out() -> bool:
+    """Whether the current job is being cancelled because it ran past its timeout."""
+    deadline = _deadline.get()
+    return bool(deadline and deadline["expired"])
+
+
+class JobExecutor:
+    """
+    Runs `run_job_async` coroutines on a dedicated event loop.
+    At most `max_concurrency` jobs run at once; at most `max_pending` more may wait.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_pending: int = MAX_PENDING):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending = max(0, max_pending)
+        self._admission = threading.BoundedSemaphore(self.max_concurrency + self.max_pending)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="ntg-executor", daemon=True)
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._capacity = threading.Condition(self._lock)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.browser_pool: Optional[BrowserPool] = None
+        self.sessions: Optional[SessionSupervisor] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._gc: Optional[asyncio.Task] = None
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "running": 0,
+        }
+        self._closed = False
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _setup(self):
+        # Loop-bound primitives must be created on the executor loop
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.browser_pool = BrowserPool()
+        # Session rows are updated through run_job, which imports this module
+        from worker.run_job import close_session_row, running_session_ids
+        self.sessions = SessionSupervisor(self.browser_pool, on_close=close_session_row)
+        self._reaper = self._loop.create_task(self.sessions.run_reaper(running_ids=running_session_ids))
+        if SCREENSHOT_GC_INTERVAL > 0:
+            self._gc = self._loop.create_task(run_gc_loop(SCREENSHOT_GC_INTERVAL))
+
+    async def _close_sessions(self):
+        for task in (self._reaper, self._gc):
+            if task:
+                task.cancel()
+        await self.sessions.close()
+
+    async def _run(self, job_type: str, payload: Dict[str, Any], job_timeout: Optional[float]) -> Any:
+        """Run the job, cancelling it after `job_timeout` seconds; a timeout raises JobTimeout."""
+        from worker.run_job import run_job_async
+
+        if not job_timeout or job_timeout <= 0:
+            return await run_job_async(job_type, payload)
+
+        deadline = {"expired": False}
+        token = _deadline.set(deadline)
+        try:
+            # The task copies the current context, so its handlers can ask job_timed_out()
+            task = asyncio.ensure_future(run_job_async(job_type, payload))
+        finally:
+            _deadline.reset(token)
+
+        def expire():
+            deadline["expired"] = True
+            task.cancel()
+
+        timer = self._loop.call_later(job_timeout, expire)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if deadline["expired"] and task.cancelled():
+                raise JobTimeout(f"{job_type} exceeded its {job_timeout:g}s timeout") from None
+            raise
+        finally:
+            timer.cancel()
+
+    async def _execute(self, job_type: str, payload: Dict[str, Any], job_timeout: Optional[float] = None) -> Any:
+        try:
+            async with self._slots:
+                self._stats["running"] += 1
+                try:
+                    result = await self._run(job_type, payload, job_timeout)
+                finally:
+                    self._stats["running"] -= 1
+        except asyncio.CancelledError:
+            self._stats["cancelled"] += 1
+            raise
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        self._stats["completed"] += 1
+        return result
+
+    def submit(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        job_key: Optional[str] = None,
+        block: bool = True,
+        timeout: Optional[float] = None,
+        job_timeout: Optional[float] = None,
+    ) -> Future:
+        """
+        Schedule a job on the executor loop and return a concurrent Future for its result.
+        Blocks (backpressure) while the executor is saturated unless block=False.
+        A job still running after `job_timeout` seconds is cancelled and fails with JobTimeout.
+        """
+        if self._closed:
+            raise RuntimeError("Executor is shut down")
+        if not self._admission.acquire(blocking=block, timeout=timeout if block else None):
+            raise ExecutorFull(f"Executor saturated ({self.max_concurrency} running, {self.max_pending} pending)")
+
+        job_key = job_key or f"{job_type}:{uuid.uuid4().hex}"
+        self._stats["submitted"] += 1
+
+        def _done(_):
+            with self._lock:
+                if self._futures.get(job_key) is future:
+                    del self._futures[job_key]
+                self._capacity.notify_all()
+            self._admission.release()
+
+        with self._lock:
+            future = asyncio.run_coroutine_threadsafe(self._execute(job_type, payload, job_timeout), self._loop)
+            self._futures[job_key] = future
+        future.add_done_callback(_done)
+        return future
+
+    def run(self, job_type: str, payload: Dict[str, Any], job_key: Optional[str] = None) -> Any:
+        """Submit a job and block until it finishes, re-raising its exception."""
+        return self.submit(job_type, payload, job_key=job_key).result()
+
+    def cancel(self, job_key: str) -> bool:
+        """Cancel a running or waiting job. Returns False if the key is unknown."""
+        with self._lock:
+            future = self._futures.get(job_key)
+        if future is None:
+            return False
+        # Cancelling the concurrent future cancels the underlying task on the loop
+        return future.cancel()
+
+    def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """Block until fewer than max_concurrency jobs are in flight; does not reserve a slot."""
+        with self._capacity:
+            return self._capacity.wait_for(lambda: len(self._futures) < self.max_concurrency, timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+            "in_flight": len(self._futures),
+            "browser_pool": self.browser_pool.stats() if self.browser_pool else None,
+            "log_sink": get_log_sink().stats(),
+            "injection_cache": get_injection_cache().stats(),
+            "workflow_plans": plan_cache.stats(),
+            "storage_state": get_storage_state_store().stats(),
+            "sessions": self.sessions.stats() if self.sessions else None,
+            "rate_limits": get_rate_limiter().stats(),
+            "screenshots": {**screenshot_stats(), "store": screenshot_store_stats()},
+        }
+
+    def shutdown(self, cancel_running: bool = False, timeout: float = 30):
+        """Stop accepting jobs, optionally cancel running ones, then close the pool and loop."""
+        if self._closed:
+            return
+        self._closed = True
+
+        with self._lock:
+            futures = list(self._futures.values())
+        if cancel_running:
+            for future in futures:
+                future.cancel()
+        if futures:
+            wait_futures(futures, timeout=timeout)
+
+        if self.sessions:
+            try:
+                asyncio.run_coroutine_threadsafe(self._close_sessions(), self._loop).result(timeout=10)
+            except Exception:
+                pass
+        if self.browser_pool:
+            try:
+                asyncio.run_coroutine_threadsafe(self.browser_pool.close(), self._loop).result(timeout=10)
+            except Exception:
+                pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        # Guarantee buffered job logs reach the database before the process exits
+        close_log_sink()
+
+
+_executor: Optional[JobExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> JobExecutor:
+    """
+    Get the per-process executor, creating it lazily.
+    Created on first use so a forked RQ work horse never inherits a parent's loop or browsers.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            use_pool_profile("worker")
+            _executor = JobExecutor()
+            atexit.register(_executor.shutdown)
+        return _executor
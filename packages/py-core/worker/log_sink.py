@@ -0,0 +1,205 @@
+"""
+Buffered log sink for the worker.
+Collects Log rows in a bounded in-memory queue and writes them with bulk
+inserts from a background thread, flushing on size/time thresholds, on
+request (job end) and on worker shutdown.
+"""
+import os
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from sqlalchemy import insert
+from dotenv import load_dotenv
+from db.database import SessionLocal
+from db.models import Log
+
+load_dotenv()
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+
+
+class _FlushRequest:
+    """Queue marker asking the writer thread to write everything buffered so far."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class LogSink:
+    """Bounded, batched writer for the `logs` table."""
+
+    def __init__(
+        self,
+        max_queue: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        session_factory=SessionLocal,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self._session_factory = session_factory
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_queue))
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped_overflow": 0,
+            "dropped_errors": 0,
+            "write_errors": 0,
+        }
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ntg-log-sink", daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def emit(self, level: str, message: str, meta: Dict[str, Any] = None) -> bool:
+        """Buffer one log row. Never blocks; returns False if the row was dropped."""
+        if self._closed:
+            self._count("dropped_overflow")
+            return False
+        row = {
+            "level": level,
+            "message": message,
+            "meta": meta,
+            "created_at": datetime.now(timezone.utc),  # Time of the event, not of the flush
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("dropped_overflow")
+            return False
+        self._count("enqueued")
+        return True
+
+    def flush(self, wait: bool = True, timeout: float = 10) -> bool:
+        """
+        Ask the writer to write everything buffered so far.
+        With wait=True blocks until it is written; returns False on timeout.
+        """
+        if not self._thread.is_alive():
+            return False
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout) if wait else True
+
+    def close(self, timeout: float = 10):
+        """Flush remaining rows and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {**self._stats, "queue_depth": self._queue.qsize()}
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        db = self._session_factory()
+        try:
+            db.execute(insert(Log), rows)
+            db.commit()
+            self._count("written", len(rows))
+            self._count("batches")
+        except Exception as e:
+            db.rollback()
+            self._count("write_errors")
+            self._count("dropped_errors", len(rows))
+            print(f"Failed to write {len(rows)} logs to DB: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        batch: List[Dict[str, Any]] = []
+        deadline: Optional[float] = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, dict):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            # Size threshold, time threshold, flush request or stop: write what we have
+            self._write(batch)
+            batch = []
+            deadline = None
+
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is _STOP:
+                # Drain anything enqueued before close() and exit
+                remaining = []
+                while True:
+                    try:
+                        extra = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(extra, dict):
+                        remaining.append(extra)
+                    elif isinstance(extra, _FlushRequest):
+                        extra.done.set()
+                for start in range(0, len(remaining), self.batch_size):
+                    self._write(remaining[start:start + self.batch_size])
+                return
+
+
+_sink: Optional[LogSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_log_sink() -> LogSink:
+    """Get the per-process log sink, creating it (and its writer thread) lazily."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = LogSink()
+            atexit.register(_sink.close)
+        return _sink
+
+
+def close_log_sink():
+    """Flush and stop the per-process log sink (worker shutdown)."""
+    global _sink
+    with _sink_lock:
+        sink, _sink = _sink, None
+    if sink is not None:
+        sink.close()
+
+
+def _reset_after_fork():
+    # The writer thread does not survive fork; children start their own sink
+    global _sink, _sink_lock
+    _sink = None
+    _sink_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,39 +1,391 @@
 """
 RQ queue setup for background job processing.
+Jobs go to one of three priority lanes, each its own RQ queue:
+    interactive (ntg_interactive)  start_session / stop_session
+    normal      (ntg_jobs)         everything else
+    bulk        (ntg_bulk)         large fan-outs and batch jobs
+With QUEUE_FAIRNESS on, a user's jobs go to a per-user sub-queue of the lane
+("ntg_bulk:u7") that the async worker serves round-robin, so one user's
+10,000-profile fan-out does not delay everyone else's jobs in that lane.
 """
 import os
+import time
+import uuid
+from typing import Dict, Any, List, Tuple, Optional
 from redis import Redis
 from rq import Queue
+from rq.job import Job as RQJob
+from rq.exceptions import NoSuchJobError
+from rq.utils import utcnow
 from dotenv import load_dotenv
 
 load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
+# Jobs per Redis pipeline when enqueueing in bulk
+ENQUEUE_BATCH_SIZE = int(os.getenv("ENQUEUE_BATCH_SIZE", "500"))
+
+JOB_TIMEOUT = 30 * 60  # 30 minutes timeout
+RESULT_TTL = 3600  # Keep result for 1 hour
+FAILURE_TTL = 86400  # Keep failures for 24 hours
+
+LANES = ("interactive", "normal", "bulk")
+LANE_QUEUES = {"interactive": "ntg_interactive", "normal": "ntg_jobs", "bulk": "ntg_bulk"}
+LANE_TIMEOUTS = {
+    "interactive": int(os.getenv("QUEUE_INTERACTIVE_TIMEOUT", str(5 * 60))),
+    "normal": JOB_TIMEOUT,
+    "bulk": int(os.getenv("QUEUE_BULK_TIMEOUT", str(60 * 60))),
+}
+INTERACTIVE_JOB_TYPES = frozenset({"start_session", "stop_session"})
+BULK_JOB_TYPES = frozenset({"run_workflow_batch", "gc_screenshots"})
+# enqueue_jobs_bulk calls with more jobs than this use the bulk lane
+QUEUE_BULK_THRESHOLD = int(os.getenv("QUEUE_BULK_THRESHOLD", "50"))
+# Per-user sub-queues; only the async worker serves them, so enable it only when every worker is one
+QUEUE_FAIRNESS = os.getenv("QUEUE_FAIRNESS", "false").lower() in ("1", "true", "yes", "on")
+
+# zset per lane: sub-queue name -> last enqueue time
+TENANTS_KEY = "ntg:lanes:{lane}:tenants"
+# hash: "<lane>:dequeued" / "<lane>:wait_ms" counters written by the async worker
+METRICS_KEY = "ntg:lanes:metrics"
+
+# enqueue_job collapses a job onto an in-flight one with the same type and target for this long
+ENQUEUE_DEDUPE_TTL = int(os.getenv("ENQUEUE_DEDUPE_TTL", "3600"))
+DEDUPE_KEY = "ntg:dedupe:{key}"
+# A fresh claim lives this long until its RQ job exists and the claim is extended to ENQUEUE_DEDUPE_TTL
+DEDUPE_CLAIM_TTL = 30
+# Payload field naming the object a job acts on, per job type
+DEDUPE_TARGETS = {
+    "start_session": "session_id",
+    "stop_session": "session_id",
+    "run_job_execution": "job_execution_id",
+    "run_workflow": "job_execution_id",
+    "run_scheduled_job": "job_id",
+}
+
+# KEYS: dedupe key. ARGV: new RQ job id, claim TTL, RQ job key prefix.
+# Returns the id of an in-flight job holding the key, or claims the key for the new id.
+# A holder without a job hash is only in flight while its claim is fresh (still being
+# enqueued); once extended, a missing hash means the job was deleted and the key is free.
+DEDUPE_LUA = """
+local holder = redis.call('GET', KEYS[1])
+if holder then
+    local status = redis.call('HGET', ARGV[3] .. holder, 'status')
+    if status == 'queued' or status == 'started' or status == 'scheduled' or status == 'deferred' then
+        return holder
+    end
+    if not status and redis.call('TTL', KEYS[1]) <= tonumber(ARGV[2]) then
+        return holder
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
 # Connect to Redis
 redis_conn = Redis.from_url(REDIS_URL)
+_dedupe_script = redis_conn.register_script(DEDUPE_LUA)
+
+_queues: Dict[str, Queue] = {}
+
+
+def get_queue(name: str) -> Queue:
+    """RQ queue by name, cached."""
+    queue = _queues.get(name)
+    if queue is None:
+        queue = _queues[name] = Queue(name, connection=redis_conn)
+    return queue
+
 
 # Create queue
-ntg_queue = Queue("ntg_jobs", connection=redis_conn)
+ntg_queue = get_queue(LANE_QUEUES["normal"])
+
+
+def lane_for(job_type: str, payload: Optional[dict] = None, lane: Optional[str] = None) -> str:
+    """Lane for a job: explicit lane, then payload "priority", then by job type."""
+    lane = lane or (payload or {}).get("priority")
+    if lane:
+        if lane not in LANE_QUEUES:
+            raise ValueError(f"Unknown queue lane: {lane}")
+        return lane
+    if job_type in INTERACTIVE_JOB_TYPES:
+        return "interactive"
+    if job_type in BULK_JOB_TYPES:
+        return "bulk"
+    return "normal"
+
+
+def queue_name(lane: str, user_id: Optional[int] = None) -> str:
+    """RQ queue for a lane, or the user's sub-queue of it when fairness is on."""
+    base = LANE_QUEUES[lane]
+    if QUEUE_FAIRNESS and user_id is not None and lane != "interactive":
+        return f"{base}:u{int(user_id)}"
+    return base
 
 
-def enqueue_job(job_type: str, payload: dict, **kwargs):
+def lane_of_queue(name: str) -> str:
+    base = name.split(":", 1)[0]
+    for lane, lane_queue in LANE_QUEUES.items():
+        if lane_queue == base:
+            return lane
+    return "normal"
+
+
+def _register_tenant(lane: str, name: str, pipeline=None):
+    if name != LANE_QUEUES[lane]:
+        (pipeline or redis_conn).zadd(TENANTS_KEY.format(lane=lane), {name: time.time()})
+
+
+def dedupe_key(job_type: str, payload: dict) -> Optional[str]:
+    """"<job_type>:<target id>" for job types that act on one object, else None."""
+    field = DEDUPE_TARGETS.get(job_type)
+    target = (payload or {}).get(field) if field else None
+    return f"{job_type}:{target}" if target is not None else None
+
+
+def enqueue_job(
+    job_type: str,
+    payload: dict,
+    user_id: Optional[int] = None,
+    lane: Optional[str] = None,
+    dedupe: bool = True,
+    **kwargs
+):
     """
     Enqueue a job to the RQ queue.
+    A job whose type and target (see DEDUPE_TARGETS) match a job that is still
+    queued or running is not enqueued again; the in-flight RQ job is returned instead.
     Args:
         job_type: Type of job (start_session, stop_session, run_job_execution, etc.)
         payload: Job payload dictionary
+        user_id: User the job runs for (fair share between users within a lane)
+        lane: interactive, normal or bulk; chosen from the job type when omitted
+        dedupe: Collapse onto an in-flight duplicate (default True)
         **kwargs: Additional RQ job options (timeout, retry, etc.)
     """
     from worker.run_job import process_job
-    
-    return ntg_queue.enqueue(
-        process_job,
-        job_type,
-        payload,
-        job_timeout="30m",  # 30 minutes timeout
-        result_ttl=3600,  # Keep result for 1 hour
-        failure_ttl=86400,  # Keep failures for 24 hours
-        **kwargs
-    )
 
+    lane = lane_for(job_type, payload, lane)
+    name = queue_name(lane, user_id)
+    kwargs.setdefault("job_timeout", LANE_TIMEOUTS[lane])
+
+    key = dedupe_key(job_type, payload) if dedupe and ENQUEUE_DEDUPE_TTL > 0 else None
+    if key:
+        kwargs.setdefault("job_id", uuid.uuid4().hex)
+        holder = _dedupe_script(
+            keys=[DEDUPE_KEY.format(key=key)],
+            args=[kwargs["job_id"], min(DEDUPE_CLAIM_TTL, ENQUEUE_DEDUPE_TTL), RQJob.redis_job_namespace_prefix],
+        )
+        if holder:
+            holder = holder.decode() if isinstance(holder, bytes) else holder
+            try:
+                return RQJob.fetch(holder, connection=redis_conn)
+            except NoSuchJobError:
+                # Still being enqueued by the request that claimed the key
+                return RQJob(holder, connection=redis_conn)
+
+    try:
+        rq_job = get_queue(name).enqueue(
+            process_job,
+            job_type,
+            payload,
+            result_ttl=RESULT_TTL,
+            failure_ttl=FAILURE_TTL,
+            meta={"lane": lane, "user_id": user_id, "dedupe_key": key},
+            **kwargs
+        )
+    except Exception:
+        if key:
+            redis_conn.delete(DEDUPE_KEY.format(key=key))
+        raise
+    if key and ENQUEUE_DEDUPE_TTL > DEDUPE_CLAIM_TTL:
+        redis_conn.expire(DEDUPE_KEY.format(key=key), ENQUEUE_DEDUPE_TTL)
+    _register_tenant(lane, name)
+    return rq_job
+
+
+def enqueue_in_pipeline(pipe, jobs: List[Tuple[str, dict]], user_id: Optional[int] = None, lane: Optional[str] = None) -> List[RQJob]:
+    """
+    Queue RQ jobs for (job_type, payload) pairs on `pipe` without executing it,
+    so callers can make the enqueue part of a larger MULTI/EXEC.
+    Returns the RQ jobs in input order.
+    """
+    from worker.run_job import process_job
+
+    # Group by destination queue; enqueue_many works on one queue at a time
+    groups: Dict[str, List[int]] = {}
+    job_datas = []
+    for i, (job_type, payload) in enumerate(jobs):
+        job_lane = lane_for(job_type, payload, lane)
+        groups.setdefault(queue_name(job_lane, user_id), []).append(i)
+        job_datas.append(Queue.prepare_data(
+            process_job,
+            args=(job_type, payload),
+            timeout=LANE_TIMEOUTS[job_lane],
+            result_ttl=RESULT_TTL,
+            failure_ttl=FAILURE_TTL,
+            meta={"lane": job_lane, "user_id": user_id},
+        ))
+
+    rq_jobs: List[Optional[RQJob]] = [None] * len(jobs)
+    for name, indexes in groups.items():
+        enqueued = get_queue(name).enqueue_many([job_datas[i] for i in indexes], pipeline=pipe)
+        for i, rq_job in zip(indexes, enqueued):
+            rq_jobs[i] = rq_job
+        _register_tenant(lane_of_queue(name), name, pipeline=pipe)
+    return rq_jobs
+
+
+def enqueue_jobs_bulk(
+    jobs: List[Tuple[str, dict]],
+    batch_size: int = ENQUEUE_BATCH_SIZE,
+    user_id: Optional[int] = None,
+    lane: Optional[str] = None,
+) -> List[Tuple[Optional[RQJob], Optional[str]]]:
+    """
+    Enqueue many jobs using one Redis pipeline per batch.
+    Args:
+        jobs: List of (job_type, payload) tuples
+        batch_size: Jobs per pipeline round trip
+        user_id: User the jobs run for
+        lane: Lane for every job; fan-outs above QUEUE_BULK_THRESHOLD default to bulk
+    Returns:
+        One (rq_job, error) tuple per input, in order. A failed batch marks
+        only its own items as failed; later batches are still attempted.
+    """
+    if lane is None and len(jobs) > QUEUE_BULK_THRESHOLD:
+        lane = "bulk"
+
+    results: List[Tuple[Optional[RQJob], Optional[str]]] = []
+    for start in range(0, len(jobs), batch_size):
+        batch = jobs[start:start + batch_size]
+        try:
+            with redis_conn.pipeline() as pipe:
+                rq_jobs = enqueue_in_pipeline(pipe, batch, user_id, lane)
+                pipe.execute()
+            results.extend((rq_job, None) for rq_job in rq_jobs)
+        except Exception as e:
+            results.extend((None, str(e)) for _ in batch)
+
+    return results
+
+
+class LaneScheduler:
+    """
+    Decides which queues to try, in order, for the next dequeue.
+    interactive always goes first; normal and bulk share the rest by smooth
+    weighted round robin (QUEUE_LANE_WEIGHTS), so bulk work keeps moving but
+    cannot crowd out normal jobs. Inside a lane, sub-queues (users) are served
+    round-robin starting after the one served last.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = weights or parse_lane_weights(os.getenv("QUEUE_LANE_WEIGHTS", "normal=4,bulk=1"))
+        self._current = {lane: 0.0 for lane in LANES}
+        self._last: Dict[str, str] = {}
+        self._considered: List[str] = []
+
+    def order(self, queues_by_lane: Dict[str, List[str]]) -> List[str]:
+        weighted = [lane for lane in LANES if lane != "interactive" and queues_by_lane.get(lane)]
+        self._considered = weighted
+        lanes = (["interactive"] if queues_by_lane.get("interactive") else []) + sorted(
+            weighted, key=lambda lane: (-(self._current[lane] + self.weights.get(lane, 1)), LANES.index(lane))
+        )
+
+        ordered: List[str] = []
+        for lane in lanes:
+            names = sorted(set(queues_by_lane[lane]))
+            last = self._last.get(lane)
+            start = next((i for i, name in enumerate(names) if last is not None and name > last), 0)
+            ordered.extend(names[start:] + names[:start])
+        return ordered
+
+    def served(self, queue: str):
+        """Record a dequeue from `queue` (after order())."""
+        lane = lane_of_queue(queue)
+        self._last[lane] = queue
+        if lane not in self._considered:
+            return
+        total = sum(self.weights.get(l, 1) for l in self._considered)
+        for considered in self._considered:
+            self._current[considered] += self.weights.get(considered, 1)
+        self._current[lane] -= total
+        # A lane that sat empty must not bank unlimited credit and then monopolize the worker
+        for considered in self._considered:
+            self._current[considered] = max(-total, min(total, self._current[considered]))
+
+
+def parse_lane_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            lane, value = item.split("=", 1)
+            weights[lane.strip()] = max(0.0, float(value))
+    return weights
+
+
+# Drop a sub-queue from its lane's tenant set once it has been empty and idle for a while;
+# atomic so a concurrent enqueue (which re-adds it) is never lost
+PRUNE_TENANTS_LUA = """
+local removed = 0
+for _, name in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])) do
+    if redis.call('LLEN', 'rq:queue:' .. name) == 0 then
+        redis.call('ZREM', KEYS[1], name)
+        removed = removed + 1
+    end
+end
+return removed
+"""
+TENANT_IDLE_SECONDS = 60
+
+
+def lane_queues(prune: bool = False) -> Dict[str, List[str]]:
+    """Queue names per lane: the lane queue plus its active per-user sub-queues."""
+    with redis_conn.pipeline() as pipe:
+        for lane in LANES:
+            if prune:
+                pipe.eval(PRUNE_TENANTS_LUA, 1, TENANTS_KEY.format(lane=lane), time.time() - TENANT_IDLE_SECONDS)
+            pipe.zrange(TENANTS_KEY.format(lane=lane), 0, -1)
+        replies = pipe.execute()
+    members = replies[1::2] if prune else replies
+    return {
+        lane: [LANE_QUEUES[lane]] + [m.decode() if isinstance(m, bytes) else m for m in names]
+        for lane, names in zip(LANES, members)
+    }
+
+
+def record_dequeue(lane: str, rq_job: RQJob):
+    """Count a dequeue and its queue wait for the lane metrics."""
+    wait_ms = 0.0
+    if rq_job.enqueued_at:
+        wait_ms = max(0.0, (utcnow() - rq_job.enqueued_at).total_seconds() * 1000)
+    with redis_conn.pipeline() as pipe:
+        pipe.hincrby(METRICS_KEY, f"{lane}:dequeued", 1)
+        pipe.hincrbyfloat(METRICS_KEY, f"{lane}:wait_ms", wait_ms)
+        pipe.execute()
+
+
+def lane_stats() -> Dict[str, Any]:
+    """Depth (queued jobs, summed over sub-queues) and mean queue wait per lane."""
+    queues = lane_queues()
+    with redis_conn.pipeline() as pipe:
+        for lane in LANES:
+            for name in queues[lane]:
+                pipe.llen(get_queue(name).key)
+        pipe.hgetall(METRICS_KEY)
+        replies = pipe.execute()
+    metrics = {k.decode() if isinstance(k, bytes) else k: float(v) for k, v in replies[-1].items()}
+
+    stats, i = {}, 0
+    for lane in LANES:
+        depth = sum(replies[i:i + len(queues[lane])])
+        i += len(queues[lane])
+        dequeued = metrics.get(f"{lane}:dequeued", 0)
+        stats[lane] = {
+            "queue": LANE_QUEUES[lane],
+            "depth": depth,
+            "sub_queues": len(queues[lane]) - 1,
+            "dequeued": int(dequeued),
+            "avg_wait_ms": round(metrics.get(f"{lane}:wait_ms", 0) / dequeued, 1) if dequeued else None,
+        }
+    return stats
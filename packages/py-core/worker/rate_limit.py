@@ -0,0 +1,203 @@
+"""
+Per-target-domain and per-proxy rate limits for page navigations.
+Limits are fixed windows counted in Redis, so they hold across every worker;
+without Redis each process counts on its own. A navigation over the limit
+waits for the next window (up to RATE_LIMIT_MAX_WAIT seconds) instead of failing.
+Rates are "<count>/<seconds>", e.g. RATE_LIMIT_DOMAIN=30/60.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+RATE_LIMIT_DOMAIN = os.getenv("RATE_LIMIT_DOMAIN", "")  # default per domain; empty = no limit
+RATE_LIMIT_PROXY = os.getenv("RATE_LIMIT_PROXY", "")  # default per proxy server; empty = no limit
+RATE_LIMIT_DOMAINS = os.getenv("RATE_LIMIT_DOMAINS", "")  # overrides: "shop.com=10/60,api.site.com=5/1"
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))
+
+REDIS_KEY_PREFIX = "ntg:rl:"
+# After a Redis error, count locally for this long before retrying
+REDIS_RETRY_AFTER = 30
+
+# Proxy server of the job running in the current task (set by the worker around a job's context)
+current_proxy: ContextVar[Optional[str]] = ContextVar("ntg_current_proxy", default=None)
+
+Rate = Tuple[int, float]
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a navigation would have to wait longer than RATE_LIMIT_MAX_WAIT."""
+
+
+def parse_rate(spec: Optional[str]) -> Optional[Rate]:
+    """"30/60" -> (30, 60.0); empty -> None. Raises ValueError."""
+    if not spec:
+        return None
+    count, _, period = spec.partition("/")
+    rate = (int(count), float(period or 1))
+    if rate[0] <= 0 or rate[1] <= 0:
+        raise ValueError(f"Invalid rate: {spec}")
+    return rate
+
+
+def parse_overrides(spec: str) -> Dict[str, Rate]:
+    overrides = {}
+    for item in spec.split(","):
+        if "=" in item:
+            domain, rate = item.split("=", 1)
+            overrides[domain.strip().lower()] = parse_rate(rate.strip())
+    return overrides
+
+
+class RateLimiter:
+    """Fixed-window counters keyed by domain and proxy."""
+
+    def __init__(
+        self,
+        redis_client=None,
+        domain_rate: Optional[Rate] = None,
+        proxy_rate: Optional[Rate] = None,
+        domain_overrides: Optional[Dict[str, Rate]] = None,
+        max_wait: float = RATE_LIMIT_MAX_WAIT,
+    ):
+        self._redis = redis_client
+        self._redis_down_until = 0.0
+        self.domain_rate = domain_rate
+        self.proxy_rate = proxy_rate
+        self.domain_overrides = domain_overrides or {}
+        self.max_wait = max_wait
+        self._local: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"granted": 0, "throttled": 0, "wait_ms_total": 0.0, "rejected": 0, "redis_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.domain_rate or self.proxy_rate or self.domain_overrides)
+
+    def rule(self, kind: str, key: str) -> Tuple[Optional[Rate], str]:
+        """Rate and counter key for a domain or proxy. Subdomains share their override's counter."""
+        if kind == "proxy":
+            return self.proxy_rate, key
+        # Most specific override wins: "a.shop.com" then "shop.com"
+        parts = key.split(".")
+        for i in range(len(parts) - 1):
+            domain = ".".join(parts[i:])
+            if self.domain_overrides.get(domain):
+                return self.domain_overrides[domain], domain
+        return self.domain_rate, key
+
+    def _incr(self, key: str, ttl: int, expires_at: float) -> int:
+        if self._redis is not None and time.monotonic() >= self._redis_down_until:
+            try:
+                with self._redis.pipeline() as pipe:
+                    pipe.incr(key)
+                    pipe.expire(key, ttl)
+                    return int(pipe.execute()[0])
+            except Exception as e:
+                self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+                self._count("redis_errors")
+                print(f"Rate limiter: Redis unavailable ({e}); counting locally")
+        with self._lock:
+            now = time.time()
+            # Drop counters of finished windows
+            if len(self._local) > 10_000:
+                self._local = {k: v for k, v in self._local.items() if v[1] > now}
+            count = self._local.get(key, (0, expires_at))[0] + 1
+            self._local[key] = (count, expires_at)
+            return count
+
+    def try_acquire(self, kind: str, key: str, now: Optional[float] = None) -> float:
+        """Take a slot in the current window. Returns 0 if granted, else seconds until the next window."""
+        rate, key = self.rule(kind, key)
+        if not rate:
+            return 0.0
+        limit, period = rate
+        now = time.time() if now is None else now
+        window = int(now // period)
+        count = self._incr(f"{REDIS_KEY_PREFIX}{kind}:{key}:{window}", int(period) + 1, (window + 1) * period)
+        window_end = (window + 1) * period
+        return 0.0 if count <= limit else window_end - now
+
+    async def acquire(self, url: str, proxy: Optional[str] = None) -> float:
+        """Wait for a slot for the URL's domain and the proxy. Returns seconds waited."""
+        keys = []
+        host = (urlsplit(url).hostname or "").lower()
+        if host:
+            keys.append(("domain", host))
+        if proxy:
+            keys.append(("proxy", proxy))
+
+        waited = 0.0
+        for kind, key in keys:
+            while True:
+                # The Redis round trip runs in a thread so it does not stall the other jobs on the loop
+                if self._redis is not None:
+                    wait = await asyncio.to_thread(self.try_acquire, kind, key)
+                else:
+                    wait = self.try_acquire(kind, key)
+                if not wait:
+                    break
+                if waited + wait > self.max_wait:
+                    self._count("rejected")
+                    raise RateLimitExceeded(f"Rate limit for {kind} {key} would delay navigation over {self.max_wait:.0f}s")
+                # Jitter so waiters released by the same window do not stampede
+                wait += random.uniform(0, min(1.0, wait * 0.1))
+                await asyncio.sleep(wait)
+                waited += wait
+        self._count("granted")
+        if waited:
+            self._count("throttled")
+            self._count("wait_ms_total", waited * 1000)
+        return waited
+
+    def _count(self, key: str, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["wait_ms_total"] = round(stats["wait_ms_total"], 1)
+        return stats
+
+
+def _default_redis():
+    try:
+        from redis import Redis
+        return Redis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+    except Exception:
+        return None
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Per-process rate limiter, created lazily from the env."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                redis_client=_default_redis(),
+                domain_rate=parse_rate(RATE_LIMIT_DOMAIN),
+                proxy_rate=parse_rate(RATE_LIMIT_PROXY),
+                domain_overrides=parse_overrides(RATE_LIMIT_DOMAINS),
+            )
+        return _limiter
+
+
+async def throttle(url: str) -> float:
+    """Wait for the rate limits of a navigation to `url` via the current task's proxy."""
+    limiter = get_rate_limiter()
+    if not limiter.enabled:
+        return 0.0
+    return await limiter.acquire(url, current_proxy.get())
@@ -0,0 +1,155 @@
+"""
+Page readiness strategies: decide when a navigated page is ready to use.
+A strategy is given as a string ("domcontentloaded", "load", "networkidle",
+"network_quiet") or a dict such as
+    {"strategy": "selector", "selector": "#app", "timeout": 10000}
+    {"strategy": "network_quiet", "quiet_ms": 500, "allow": ["doubleclick.net"]}
+    {"strategy": "predicate", "expression": "() => window.appReady === true"}
+Navigation errors raise; a readiness wait that runs out of time is recorded
+as timed_out and the job carries on with the page as it is. Cancelled work
+raises JobCancelled (see worker.cancellation).
+"""
+import os
+import time
+import asyncio
+from typing import Dict, Any, Optional, Union
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from worker.rate_limit import throttle
+from worker.cancellation import check_cancelled
+from dotenv import load_dotenv
+
+load_dotenv()
+
+READINESS_DEFAULT = os.getenv("READINESS_DEFAULT", "network_quiet")
+READINESS_TIMEOUT = int(os.getenv("READINESS_TIMEOUT", "10000"))  # ms, readiness wait after navigation
+NAVIGATION_TIMEOUT = int(os.getenv("NAVIGATION_TIMEOUT", "30000"))  # ms, page.goto
+NETWORK_QUIET_MS = int(os.getenv("NETWORK_QUIET_MS", "500"))
+
+# Strategies Playwright's goto can wait for directly
+GOTO_STRATEGIES = ("commit", "domcontentloaded", "load", "networkidle")
+STRATEGIES = GOTO_STRATEGIES + ("network_quiet", "selector", "predicate")
+
+_ALIASES = {
+    "networkquiet": "network_quiet",
+    "network-quiet": "network_quiet",
+    "dom": "domcontentloaded",
+}
+
+
+def parse_readiness(spec: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+    """Normalize a readiness spec into a dict with a known "strategy". Raises ValueError."""
+    if spec is None or spec == "":
+        spec = READINESS_DEFAULT
+    if isinstance(spec, str):
+        spec = {"strategy": spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid readiness spec: {spec!r}")
+
+    spec = dict(spec)
+    strategy = str(spec.get("strategy") or READINESS_DEFAULT).lower()
+    strategy = _ALIASES.get(strategy, strategy)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown readiness strategy: {strategy}")
+    if strategy == "selector" and not spec.get("selector"):
+        raise ValueError("selector readiness requires 'selector'")
+    if strategy == "predicate" and not spec.get("expression"):
+        raise ValueError("predicate readiness requires 'expression'")
+
+    spec["strategy"] = strategy
+    spec["timeout"] = int(spec.get("timeout") or READINESS_TIMEOUT)
+    if strategy == "network_quiet":
+        spec["quiet_ms"] = int(spec.get("quiet_ms") or NETWORK_QUIET_MS)
+        spec["allow"] = [str(pattern) for pattern in (spec.get("allow") or [])]
+    return spec
+
+
+class NetworkTracker:
+    """Counts in-flight requests on a page, ignoring URLs that match the allow-list."""
+
+    def __init__(self, page, allow=None):
+        self.page = page
+        self.allow = list(allow or [])
+        self.inflight = set()
+        self.last_change = time.monotonic()
+        self.ignored = 0
+
+    def _on_request(self, request):
+        if any(pattern in request.url for pattern in self.allow):
+            self.ignored += 1
+            return
+        self.inflight.add(request)
+        self.last_change = time.monotonic()
+
+    def _on_done(self, request):
+        if request in self.inflight:
+            self.inflight.discard(request)
+            self.last_change = time.monotonic()
+
+    def __enter__(self):
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_done)
+        self.page.on("requestfailed", self._on_done)
+        return self
+
+    def __exit__(self, *exc):
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_done)
+        self.page.remove_listener("requestfailed", self._on_done)
+
+    async def wait_quiet(self, quiet_ms: int, timeout_ms: int) -> bool:
+        """Wait until no tracked request has been in flight for quiet_ms. False on timeout."""
+        deadline = time.monotonic() + timeout_ms / 1000
+        quiet = quiet_ms / 1000
+        while True:
+            now = time.monotonic()
+            if not self.inflight and now - self.last_change >= quiet:
+                return True
+            if now >= deadline:
+                return False
+            await asyncio.sleep(min(0.05, max(0.0, deadline - now)))
+
+
+async def navigate(page, url: str, readiness: Union[str, Dict[str, Any], None] = None, timeout: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Navigate and wait for readiness.
+    Returns {"strategy", "wait_ms", "timed_out", ...} for the job result.
+    """
+    spec = parse_readiness(readiness)
+    strategy = spec["strategy"]
+    nav_timeout = timeout or NAVIGATION_TIMEOUT
+    info: Dict[str, Any] = {"strategy": strategy, "timed_out": False}
+    
+    # Per-domain / per-proxy rate limits; not counted as readiness wait
+    throttled = await throttle(url)
+    if throttled:
+        info["throttled_ms"] = round(throttled * 1000, 1)
+    # Don't start a navigation for cancelled work; one already under way is interrupted by its CancelScope
+    check_cancelled()
+    started = time.perf_counter()
+
+    if strategy in GOTO_STRATEGIES:
+        await page.goto(url, wait_until=strategy, timeout=nav_timeout)
+    elif strategy == "network_quiet":
+        with NetworkTracker(page, spec["allow"]) as tracker:
+            await page.goto(url, wait_until="domcontentloaded", timeout=nav_timeout)
+            info["timed_out"] = not await tracker.wait_quiet(spec["quiet_ms"], spec["timeout"])
+            info["quiet_ms"] = spec["quiet_ms"]
+            info["pending_requests"] = len(tracker.inflight)
+            info["ignored_requests"] = tracker.ignored
+    else:
+        await page.goto(url, wait_until="domcontentloaded", timeout=nav_timeout)
+        try:
+            if strategy == "selector":
+                await page.wait_for_selector(spec["selector"], state=spec.get("state", "visible"), timeout=spec["timeout"])
+            else:
+                await page.wait_for_function(spec["expression"], timeout=spec["timeout"])
+        except PlaywrightTimeoutError:
+            info["timed_out"] = True
+
+    settle_ms = int(spec.get("settle_ms") or 0)
+    if settle_ms:
+        await asyncio.sleep(settle_ms / 1000)
+        info["settle_ms"] = settle_ms
+
+    info["wait_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return info
@@ -0,0 +1,144 @@
+"""
+Request interception with named blocking profiles.
+Blocks resource types (images, media, fonts, ...) and known tracker domains
+at the BrowserContext so jobs don't pay proxy bandwidth for them.
+Selected per job with payload "blocking": a profile name or
+    {"profile": "no-media", "block_types": ["font"], "block_domains": [...], "allow_domains": [...]}
+"""
+import os
+from typing import Dict, Any, Union
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESOURCE_BLOCKING_DEFAULT = os.getenv("RESOURCE_BLOCKING_DEFAULT", "full")
+
+TRACKER_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "adservice.google.com",
+    "connect.facebook.net",
+    "hotjar.com",
+    "segment.io",
+    "mixpanel.com",
+    "scorecardresearch.com",
+    "criteo.com",
+    "taboola.com",
+    "outbrain.com",
+    "amazon-adsystem.com",
+    "adnxs.com",
+)
+
+BLOCKING_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Everything loads (previous behaviour); no routing is installed
+    "full": {"block_types": (), "block_trackers": False},
+    # Main content with styling, for screenshots
+    "no-media": {"block_types": ("image", "media", "font"), "block_trackers": True},
+    # DOM only
+    "minimal": {
+        "block_types": ("image", "media", "font", "stylesheet", "texttrack", "eventsource", "websocket", "manifest", "other"),
+        "block_trackers": True,
+    },
+}
+
+# Rough transfer sizes per blocked request, used for the bytes-saved estimate
+ESTIMATED_BYTES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 30_000,
+    "stylesheet": 20_000,
+    "script": 30_000,
+    "texttrack": 5_000,
+    "manifest": 2_000,
+}
+DEFAULT_ESTIMATED_BYTES = 5_000
+
+
+def _domain_matches(host: str, domains) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def parse_blocking(spec: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+    """Resolve a blocking spec into {"profile", "block_types", "block_domains", "allow_domains"}. Raises ValueError."""
+    if spec is None or spec == "":
+        spec = RESOURCE_BLOCKING_DEFAULT
+    if isinstance(spec, str):
+        spec = {"profile": spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid blocking spec: {spec!r}")
+
+    name = spec.get("profile") or RESOURCE_BLOCKING_DEFAULT
+    if name not in BLOCKING_PROFILES:
+        raise ValueError(f"Unknown blocking profile: {name}")
+    profile = BLOCKING_PROFILES[name]
+
+    block_domains = list(TRACKER_DOMAINS) if profile["block_trackers"] else []
+    block_domains += [str(d).lower() for d in spec.get("block_domains") or []]
+    return {
+        "profile": name,
+        "block_types": frozenset(profile["block_types"]) | frozenset(spec.get("block_types") or []),
+        "block_domains": tuple(block_domains),
+        "allow_domains": tuple(str(d).lower() for d in spec.get("allow_domains") or []),
+    }
+
+
+class ResourceBlocker:
+    """Routes a context's requests through the blocking rules and counts what was blocked."""
+
+    def __init__(self, spec: Union[str, Dict[str, Any], None] = None):
+        rules = parse_blocking(spec)
+        self.profile = rules["profile"]
+        self.block_types = rules["block_types"]
+        self.block_domains = rules["block_domains"]
+        self.allow_domains = rules["allow_domains"]
+        self.allowed = 0
+        self.blocked = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.bytes_saved_estimate = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self.block_types or self.block_domains)
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        host = (urlsplit(url).hostname or "").lower()
+        if self.allow_domains and _domain_matches(host, self.allow_domains):
+            return False
+        if resource_type in self.block_types:
+            return True
+        return bool(self.block_domains) and _domain_matches(host, self.block_domains)
+
+    async def attach(self, context):
+        """Install the route on a context. No-op for profiles that block nothing (routing disables the HTTP cache)."""
+        if self.active:
+            await context.route("**/*", self._handle)
+
+    async def detach(self, context):
+        """Remove the route again, for contexts that outlive the job (live sessions)."""
+        if self.active:
+            await context.unroute("**/*", self._handle)
+
+    async def _handle(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        if self.should_block(request.url, resource_type):
+            self.blocked += 1
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+            self.bytes_saved_estimate += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+            await route.abort("blockedbyclient")
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "profile": self.profile,
+            "allowed": self.allowed,
+            "blocked": self.blocked,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "bytes_saved_estimate": self.bytes_saved_estimate,
+        }
@@ -0,0 +1,317 @@
+"""
+Retries and the dead-letter queue for worker jobs.
+A failed job whose error looks transient (navigation and network timeouts,
+dropped connections, proxy and network errors, a crashed browser) is re-enqueued through the delayed-job
+scheduler after an exponential backoff with jitter, up to its type's
+max_attempts. Anything else, or a job out of attempts, goes to the dead-letter
+queue: a Redis hash of entries (job type, payload, error, attempts) that can
+be listed and re-driven through /api/dead-letters.
+The attempt number travels in the payload ("attempt", 1 for the first run).
+"""
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DLQ_KEY = "ntg:dlq"  # hash: entry id -> JSON
+DLQ_INDEX_KEY = "ntg:dlq:index"  # zset: entry id -> failed_at
+DLQ_MAX_ENTRIES = int(os.getenv("DLQ_MAX_ENTRIES", "10000"))
+DLQ_RETENTION_DAYS = float(os.getenv("DLQ_RETENTION_DAYS", "14"))
+
+
+class RetryPolicy(NamedTuple):
+    max_attempts: int
+    backoff: float  # seconds before the first retry; doubles per attempt
+    max_backoff: float
+
+
+# Batch and scheduled-run jobs are not retried as a whole: a retry would repeat
+# the profiles that succeeded or create a second set of executions
+DEFAULT_RETRY_POLICIES = {
+    "run_job_execution": RetryPolicy(3, 30, 600),
+    "run_workflow": RetryPolicy(3, 30, 600),
+    "run_workflow_batch": RetryPolicy(1, 60, 600),
+    "start_session": RetryPolicy(2, 5, 60),
+    "stop_session": RetryPolicy(3, 2, 30),
+    "gc_screenshots": RetryPolicy(1, 60, 600),
+    "run_scheduled_job": RetryPolicy(1, 10, 60),
+}
+RETRY_DEFAULT_POLICY = RetryPolicy(1, 30, 600)
+
+# Exception class names (any module) treated as transient; Playwright's
+# TimeoutError is classified by its message (see NAVIGATION_TIMEOUT_MARKERS)
+TRANSIENT_ERROR_TYPES = frozenset({
+    "TimeoutError",  # asyncio/builtin and socket timeouts
+    "ConnectionError",
+    "ConnectionResetError",
+    "ConnectionRefusedError",
+    "BrokenPipeError",
+    "OperationalError",  # sqlalchemy: database connection dropped
+    "RateLimitExceeded",
+})
+# Substrings of a Playwright error message that mean the network, proxy or browser failed
+TRANSIENT_ERROR_MARKERS = (
+    "net::err_",
+    "ns_error_net",
+    "target closed",
+    "target page, context or browser has been closed",
+    "browser has been closed",
+    "browser has disconnected",
+    "connection closed",
+    "econnreset",
+    "econnrefused",
+    "socket hang up",
+)
+# Substrings of a Playwright timeout message that mean a page load timed out.
+# Other Playwright timeouts (a selector or predicate that never matched) repeat on retry
+NAVIGATION_TIMEOUT_MARKERS = (
+    "page.goto",
+    "page.reload",
+    "page.go_back",
+    "page.go_forward",
+    "navigating to",
+    "waiting for navigation",
+    "wait_for_load_state",
+    "wait_for_url",
+)
+
+
+def parse_retry_policies(spec: str) -> Dict[str, RetryPolicy]:
+    """"run_job_execution=5:30:600,start_session=2" -> {type: RetryPolicy}. Raises ValueError."""
+    policies = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        job_type, value = item.split("=", 1)
+        parts = value.strip().split(":")
+        default = DEFAULT_RETRY_POLICIES.get(job_type.strip(), RETRY_DEFAULT_POLICY)
+        policy = RetryPolicy(
+            int(parts[0]),
+            float(parts[1]) if len(parts) > 1 else default.backoff,
+            float(parts[2]) if len(parts) > 2 else default.max_backoff,
+        )
+        if policy.max_attempts < 1 or policy.backoff < 0 or policy.max_backoff < policy.backoff:
+            raise ValueError(f"Invalid retry policy: {item}")
+        policies[job_type.strip()] = policy
+    return policies
+
+
+RETRY_POLICIES = {**DEFAULT_RETRY_POLICIES, **parse_retry_policies(os.getenv("RETRY_POLICIES", ""))}
+
+
+def retry_policy(job_type: str) -> RetryPolicy:
+    return RETRY_POLICIES.get(job_type, RETRY_DEFAULT_POLICY)
+
+
+def job_attempt(payload: Dict[str, Any]) -> int:
+    """1 for a job's first run, 2 for its first retry, ..."""
+    try:
+        return max(1, int(payload.get("attempt") or 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def error_type(exc: BaseException) -> str:
+    return f"{type(exc).__module__}.{type(exc).__qualname__}"
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Whether a failure is worth retrying. Navigation and network timeouts,
+    dropped connections and network/proxy/browser-crash errors are; selector
+    timeouts, bad input (missing rows, invalid selectors, unknown actions) and
+    anything unrecognized are not.
+    """
+    if type(exc).__module__.startswith("playwright"):
+        message = str(exc).lower()
+        if type(exc).__name__ == "TimeoutError":
+            return any(marker in message for marker in NAVIGATION_TIMEOUT_MARKERS)
+        return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+    for cls in type(exc).__mro__:
+        if cls.__name__ in TRANSIENT_ERROR_TYPES:
+            return True
+    return False
+
+
+def backoff_delay(policy: RetryPolicy, attempt: int) -> float:
+    """Seconds before retry number `attempt` (1 = first retry): exponential, capped, with equal jitter."""
+    delay = min(policy.max_backoff, policy.backoff * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_decision(job_type: str, payload: Dict[str, Any], exc: BaseException) -> Optional[float]:
+    """Seconds until the retry if this failure should be retried, else None."""
+    attempt = job_attempt(payload)
+    policy = retry_policy(job_type)
+    if attempt >= policy.max_attempts or not is_retryable(exc):
+        return None
+    return backoff_delay(policy, attempt)
+
+
+def execution_ids(job_type: str, payload: Dict[str, Any]) -> List[int]:
+    """JobExecution ids a worker job runs."""
+    if payload.get("job_execution_ids"):
+        return [int(i) for i in payload["job_execution_ids"]]
+    exec_id = payload.get("job_execution_id") or payload.get("jobExecId")
+    return [int(exec_id)] if exec_id else []
+
+
+def schedule_retry(job_type: str, payload: Dict[str, Any], delay: float, user_id: Optional[int] = None, lane: Optional[str] = None) -> str:
+    """Re-enqueue a job with the next attempt number after `delay` seconds. Returns the scheduler entry id."""
+    from worker.scheduler import get_delayed_jobs
+
+    entry_id = f"retry:{uuid.uuid4().hex}"
+    retry_payload = {**payload, "attempt": job_attempt(payload) + 1}
+    get_delayed_jobs().schedule(entry_id, time.time() + delay, [(job_type, retry_payload)], user_id=user_id, lane=lane)
+    return entry_id
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class DeadLetters:
+    """Dead-letter queue in Redis; newest entries first."""
+
+    def __init__(self, redis_client, max_entries: int = DLQ_MAX_ENTRIES, retention_days: float = DLQ_RETENTION_DAYS):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.retention_days = retention_days
+
+    def add(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        exc: BaseException,
+        user_id: Optional[int] = None,
+        lane: Optional[str] = None,
+        rq_job_id: Optional[str] = None,
+    ) -> str:
+        entry_id = uuid.uuid4().hex
+        now = time.time()
+        entry = {
+            "id": entry_id,
+            "job_type": job_type,
+            "payload": payload,
+            "attempts": job_attempt(payload),
+            "error": str(exc)[:2000],
+            "error_type": error_type(exc),
+            "retryable": is_retryable(exc),
+            "user_id": user_id,
+            "lane": lane,
+            "rq_job_id": rq_job_id,
+            "failed_at": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        }
+        with self.redis.pipeline() as pipe:
+            pipe.hset(DLQ_KEY, entry_id, json.dumps(entry, default=str))
+            pipe.zadd(DLQ_INDEX_KEY, {entry_id: now})
+            pipe.execute()
+        self.trim(now)
+        return entry_id
+
+    def trim(self, now: Optional[float] = None) -> int:
+        """Drop entries past the retention period or beyond max_entries (oldest first)."""
+        now = time.time() if now is None else now
+        stale = self.redis.zrangebyscore(DLQ_INDEX_KEY, "-inf", now - self.retention_days * 86400)
+        overflow = self.redis.zcard(DLQ_INDEX_KEY) - len(stale) - self.max_entries
+        if overflow > 0:
+            stale += self.redis.zrange(DLQ_INDEX_KEY, len(stale), len(stale) + overflow - 1)
+        if stale:
+            with self.redis.pipeline() as pipe:
+                pipe.hdel(DLQ_KEY, *stale)
+                pipe.zrem(DLQ_INDEX_KEY, *stale)
+                pipe.execute()
+        return len(stale)
+
+    def count(self) -> int:
+        return self.redis.zcard(DLQ_INDEX_KEY)
+
+    def list(self, job_type: Optional[str] = None, limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Entries newest first, optionally of one job type. Returns (entries, total matching)."""
+        ids = [_text(i) for i in self.redis.zrevrange(DLQ_INDEX_KEY, 0, -1)]
+        if job_type is None:
+            total = len(ids)
+            page = ids[offset:offset + limit]
+            return [entry for entry in self.get(page) if entry], total
+        entries = [entry for entry in self.get(ids) if entry and entry["job_type"] == job_type]
+        return entries[offset:offset + limit], len(entries)
+
+    def get(self, entry_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        if not entry_ids:
+            return []
+        return [json.loads(raw) if raw else None for raw in self.redis.hmget(DLQ_KEY, entry_ids)]
+
+    def take(self, entry_ids: List[str]) -> List[Dict[str, Any]]:
+        """Remove entries and return those this call removed (safe against concurrent re-drives)."""
+        if not entry_ids:
+            return []
+        entries = self.get(entry_ids)
+        with self.redis.pipeline() as pipe:
+            for entry_id in entry_ids:
+                pipe.hdel(DLQ_KEY, entry_id)
+            pipe.zrem(DLQ_INDEX_KEY, *entry_ids)
+            removed = pipe.execute()[:len(entry_ids)]
+        return [entry for entry, gone in zip(entries, removed) if entry and gone]
+
+    def restore(self, entries: List[Dict[str, Any]]):
+        """Put back entries that could not be re-driven."""
+        with self.redis.pipeline() as pipe:
+            for entry in entries:
+                pipe.hset(DLQ_KEY, entry["id"], json.dumps(entry, default=str))
+                pipe.zadd(DLQ_INDEX_KEY, {entry["id"]: datetime.fromisoformat(entry["failed_at"]).timestamp()})
+            pipe.execute()
+
+    def select(self, entry_ids: Optional[List[str]] = None, job_type: Optional[str] = None, limit: int = 1000) -> List[str]:
+        """Ids to re-drive: the given ids, else the newest `limit` entries (of `job_type` if set)."""
+        if entry_ids:
+            return list(entry_ids)[:limit]
+        entries, _ = self.list(job_type=job_type, limit=limit)
+        return [entry["id"] for entry in entries]
+
+    def redrive(self, entry_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str]]]:
+        """
+        Re-enqueue entries from attempt 1 and drop them from the queue.
+        Returns (re-driven entries, [(entry, error)] put back after an enqueue failure).
+        """
+        from worker.queue import enqueue_jobs_bulk
+
+        entries = self.take(entry_ids)
+        groups: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+        for entry in entries:
+            groups.setdefault((entry.get("user_id"), entry.get("lane")), []).append(entry)
+
+        redriven, failed = [], []
+        for (user_id, lane), group in groups.items():
+            jobs = [
+                (entry["job_type"], {k: v for k, v in entry["payload"].items() if k != "attempt"})
+                for entry in group
+            ]
+            for entry, (_, error) in zip(group, enqueue_jobs_bulk(jobs, user_id=user_id, lane=lane)):
+                if error:
+                    failed.append((entry, error))
+                else:
+                    redriven.append(entry)
+        if failed:
+            self.restore([entry for entry, _ in failed])
+        return redriven, failed
+
+
+_dead_letters: Optional[DeadLetters] = None
+_dead_letters_lock = threading.Lock()
+
+
+def get_dead_letters() -> DeadLetters:
+    """Per-process DeadLetters on the queue's Redis connection, created lazily."""
+    global _dead_letters
+    with _dead_letters_lock:
+        if _dead_letters is None:
+            from worker.queue import redis_conn
+            _dead_letters = DeadLetters(redis_conn)
+        return _dead_letters
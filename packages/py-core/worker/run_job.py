@@ -3,18 +3,35 @@ RQ worker job handler - processes jobs using Playwright.
 """
 import os
 import time
+import asyncio
+import threading
 import traceback
+import concurrent.futures
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union
 from pathlib import Path
-from playwright.sync_api import sync_playwright, Browser, BrowserContext, Page
+from sqlalchemy import update, select, or_
 from sqlalchemy.orm import Session
+from rq import get_current_job
 from db.database import SessionLocal
-from db.models import Session as SessionModel, Profile, Proxy, JobExecution, Job, Log, Workflow
-from services.fingerprint_injection import build_injection
+from db.models import Session as SessionModel, Profile, Proxy, JobExecution, Job, Workflow
+from services.injection_cache import get_injection_cache, normalize_fingerprint
 from services.crypto import decrypt
-from services.storage import save_screenshot
-from worker.workflow_executor import execute_workflow
+from services.events import publish_event
+from worker.readiness import navigate
+from worker.rate_limit import current_proxy
+from worker.resource_blocking import ResourceBlocker
+from worker.screenshots import parse_screenshot, capture_screenshot, process_screenshot, gc_screenshots
+from worker.storage_state import get_storage_state_store, storage_enabled
+from worker.workflow_executor import execute_workflow, get_workflow_plan
+from worker.executor import JOB_TIMEOUT_REASON, get_executor, job_timed_out
+from worker.queue import redis_conn, enqueue_jobs_bulk
+from worker.scheduler import get_delayed_jobs, job_entry_id
+from worker.cancellation import CancelScope, JobCancelled
+from worker.retry import retry_decision, schedule_retry, get_dead_letters, job_attempt, execution_ids
+from services.job_fanout import existing_profile_ids, create_job_executions, fanout_jobs
+from worker.log_sink import get_log_sink
 
 # Load fingerprint patch and audio spoof scripts
 _fingerprint_patch_path = Path(__file__).parent.parent.parent / "src" / "inject" / "fingerprintPatch.js"
@@ -32,63 +49,235 @@ if _audio_spoof_path.exists():
 else:
     AUDIO_SPOOF_SCRIPT = ""
 
-# Import socketio for emitting events
-import socketio
-
-# Socket.IO client for emitting events
-sio_client = socketio.Client()
+# run_workflow_batch: profiles run at once per batch, and status rows buffered per bulk UPDATE
+WORKFLOW_BATCH_CONCURRENCY = int(os.getenv("WORKFLOW_BATCH_CONCURRENCY", "5"))
+WORKFLOW_BATCH_FLUSH_EVERY = int(os.getenv("WORKFLOW_BATCH_FLUSH_EVERY", "20"))
 
 
 def get_db_session() -> Session:
-    """Get database session."""
-    return SessionLocal()
+    """
+    Get database session.
+    Loaded rows stay readable after a commit, so handlers commit before browser
+    work and hold no pooled connection while they await it.
+    """
+    return SessionLocal(expire_on_commit=False)
 
 
-def emit_event(event_name: str, data: Dict[str, Any]):
-    """Emit socket event (if socketio server is running)."""
+_event_publisher: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_event_publisher_lock = threading.Lock()
+
+
+def get_event_publisher() -> concurrent.futures.ThreadPoolExecutor:
+    """Per-process thread publishing events in the order they were emitted, created lazily."""
+    global _event_publisher
+    with _event_publisher_lock:
+        if _event_publisher is None:
+            _event_publisher = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ntg-events")
+        return _event_publisher
+
+
+def _publish(event_name: str, data: Dict[str, Any]):
     try:
-        # Try to connect and emit (non-blocking)
-        # In production, use Redis pub/sub or message queue
-        print(f"[Socket Event] {event_name}: {data}")
-        # TODO: Implement proper socket emission via Redis pub/sub or HTTP request to API
+        publish_event(redis_conn, event_name, data)
     except Exception as e:
         print(f"Failed to emit event: {e}")
 
 
-def log_to_db(level: str, message: str, meta: Dict[str, Any] = None, db: Session = None):
-    """Log message to database."""
-    if db is None:
-        db = get_db_session()
-    
+def emit_event(event_name: str, data: Dict[str, Any]):
+    """
+    Publish a realtime event to the API's Socket.IO relay via Redis pub/sub.
+    On the event loop the publish is handed to the publisher thread, so a slow
+    Redis never stalls the other jobs running on it.
+    """
     try:
-        log = Log(level=level, message=message, meta=meta)
-        db.add(log)
-        db.commit()
+        asyncio.get_running_loop()
+    except RuntimeError:
+        _publish(event_name, data)
+        return
+    get_event_publisher().submit(_publish, event_name, data)
+
+
+def flush_events(timeout: float = 5):
+    """Wait until events emitted so far are published (or `timeout` passes)."""
+    publisher = _event_publisher
+    if publisher is None:
+        return
+    try:
+        publisher.submit(lambda: None).result(timeout)
     except Exception as e:
-        print(f"Failed to log to DB: {e}")
-    finally:
-        if db:
-            db.close()
+        print(f"Failed to flush events: {e}")
+
+
+def _reset_after_fork():
+    # The publisher thread does not survive fork; children start their own
+    global _event_publisher, _event_publisher_lock
+    _event_publisher = None
+    _event_publisher_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def log_to_db(level: str, message: str, meta: Dict[str, Any] = None, db: Session = None):
+    """
+    Log message to database via the buffered log sink.
+    Rows are bulk-inserted in the background; `db` is accepted for compatibility and left untouched.
+    """
+    if not get_log_sink().emit(level, message, meta):
+        print(f"[Log dropped] {level}: {message}")
 
 
 def process_job(job_type: str, payload: Dict[str, Any]):
     """
     Main job processing function called by RQ worker.
+    Runs the job on the process-wide asyncio executor and blocks until it finishes.
     Args:
         job_type: Type of job (start_session, stop_session, run_job_execution)
         payload: Job payload dictionary
     """
+    rq_job = get_current_job()
+    try:
+        return get_executor().run(job_type, payload, job_key=rq_job.id if rq_job else None)
+    except Exception as e:
+        retry = handle_job_failure(job_type, payload, e, rq_job)
+        if retry is None:
+            raise
+        return retry
+    finally:
+        # A forked work horse leaves through os._exit, skipping the sink's atexit close:
+        # write this job's logs (including handle_job_failure's) and events before returning to RQ
+        get_log_sink().flush(wait=True)
+        flush_events()
+
+
+def handle_job_failure(job_type: str, payload: Dict[str, Any], exc: BaseException, rq_job=None) -> Optional[Dict[str, Any]]:
+    """
+    Retry a failed job after a backoff if its error is transient and it has attempts
+    left (returns the retry info to record as the RQ job's result); otherwise add it
+    to the dead-letter queue and return None. Cancelled jobs are neither.
+    """
+    if isinstance(exc, (asyncio.CancelledError, concurrent.futures.CancelledError, JobCancelled)):
+        return None
+    meta = (rq_job.meta if rq_job is not None else None) or {}
+    user_id, lane = meta.get("user_id"), meta.get("lane")
+    attempt = job_attempt(payload)
+
+    delay = retry_decision(job_type, payload, exc)
+    if delay is not None:
+        try:
+            schedule_retry(job_type, payload, delay, user_id=user_id, lane=lane)
+        except Exception as e:
+            print(f"Failed to schedule retry of {job_type}: {e}")
+            delay = None
+    if delay is not None:
+        mark_retrying(job_type, payload, exc, delay)
+        log_to_db("warn", f"{job_type} attempt {attempt} failed; retrying in {delay:.0f}s", {
+            "job_type": job_type,
+            "payload": payload,
+            "error": str(exc),
+        })
+        return {"retry_scheduled": True, "attempt": attempt, "retry_in": round(delay, 1), "error": str(exc)}
+
+    try:
+        get_dead_letters().add(job_type, payload, exc, user_id=user_id, lane=lane, rq_job_id=rq_job.id if rq_job is not None else None)
+    except Exception as e:
+        print(f"Failed to dead-letter {job_type}: {e}")
+    return None
+
+
+def mark_retrying(job_type: str, payload: Dict[str, Any], exc: BaseException, delay: float):
+    """Put a retried job's failed executions back to pending."""
+    exec_ids = execution_ids(job_type, payload)
+    if not exec_ids:
+        return
+    error = f"Attempt {job_attempt(payload)} failed, retrying in {delay:.0f}s: {exc}"
+    db = get_db_session()
+    try:
+        db.execute(
+            update(JobExecution)
+            .where(JobExecution.id.in_(exec_ids), JobExecution.status == "failed")
+            .values(status="pending", completed_at=None, error=error)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+    for exec_id in exec_ids:
+        emit_event("jobExecution:update", {"id": exec_id, "status": "pending", "error": error})
+
+
+def set_execution_status(db: Session, exec_id: int, status: str, **values):
+    """Update one JobExecution by id and publish the change."""
+    db.execute(
+        update(JobExecution)
+        .where(JobExecution.id == exec_id)
+        .values(status=status, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    event = {key: value.isoformat() if isinstance(value, datetime) else value for key, value in values.items()}
+    emit_event("jobExecution:update", {"id": exec_id, "status": status, **event})
+
+
+def mark_cancelled(db: Session, exec_ids: List[int], reason: str):
+    """Record executions as cancelled unless they already finished."""
+    completed_at = datetime.utcnow()
+    db.execute(
+        update(JobExecution)
+        .where(JobExecution.id.in_(exec_ids), JobExecution.status.in_(("pending", "running")))
+        .values(status="cancelled", completed_at=completed_at, error=reason)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    for exec_id in exec_ids:
+        emit_event("jobExecution:update", {"id": exec_id, "status": "cancelled", "completed_at": completed_at.isoformat(), "error": reason})
+
+
+def record_attempt(db: Session, job_type: str, payload: Dict[str, Any]):
+    """Raise Job.attempts to this run's attempt number (1 on the first run) for the Job it belongs to."""
+    exec_ids = execution_ids(job_type, payload)
+    if exec_ids:
+        job_filter = Job.id.in_(select(JobExecution.job_id).where(JobExecution.id.in_(exec_ids)))
+    elif job_type == "run_scheduled_job" and payload.get("job_id"):
+        job_filter = Job.id == payload["job_id"]
+    else:
+        return
+    attempt = job_attempt(payload)
+    db.execute(
+        update(Job)
+        .where(job_filter, or_(Job.attempts.is_(None), Job.attempts < attempt))
+        .values(attempts=attempt)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+async def run_job_async(job_type: str, payload: Dict[str, Any]):
+    """
+    Dispatch a job to its async handler. Each job gets its own DB session and browser context.
+    Args:
+        job_type: Type of job (start_session, stop_session, run_job_execution, run_workflow, run_workflow_batch, gc_screenshots)
+        payload: Job payload dictionary
+    """
     db = get_db_session()
     
     try:
+        record_attempt(db, job_type, payload)
         if job_type == "start_session":
-            handle_start_session(payload, db)
+            return await handle_start_session(payload, db)
         elif job_type == "stop_session":
-            handle_stop_session(payload, db)
+            return await handle_stop_session(payload, db)
         elif job_type == "run_job_execution":
-            handle_run_job_execution(payload, db)
+            return await handle_run_job_execution(payload, db)
         elif job_type == "run_workflow":
-            handle_run_workflow(payload, db)
+            return await handle_run_workflow(payload, db)
+        elif job_type == "run_workflow_batch":
+            return await handle_run_workflow_batch(payload, db)
+        elif job_type == "gc_screenshots":
+            return await handle_gc_screenshots(payload, db)
+        elif job_type == "run_scheduled_job":
+            return await handle_run_scheduled_job(payload, db)
         else:
             log_to_db("error", f"Unknown job type: {job_type}", {"payload": payload}, db)
     except Exception as e:
@@ -97,10 +286,26 @@ def process_job(job_type: str, payload: Dict[str, Any]):
         raise
     finally:
         db.close()
+        # Write this job's logs now instead of waiting for the next size/time threshold
+        get_log_sink().flush(wait=False)
 
 
-def handle_start_session(payload: Dict[str, Any], db: Session):
-    """Handle start_session job."""
+def session_event(session: SessionModel) -> Dict[str, Any]:
+    return {
+        "id": session.id,
+        "profile_id": session.profile_id,
+        "status": session.status,
+        "started_at": session.started_at.isoformat() if session.started_at else None,
+        "stopped_at": session.stopped_at.isoformat() if session.stopped_at else None,
+    }
+
+
+async def handle_start_session(payload: Dict[str, Any], db: Session):
+    """
+    Handle start_session job.
+    Opens a live browser context for the session and keeps it until stop_session
+    or idle/budget eviction; jobs for the profile attach to it.
+    """
     session_id = payload.get("session_id")
     if not session_id:
         raise ValueError("session_id required")
@@ -114,30 +319,68 @@ def handle_start_session(payload: Dict[str, Any], db: Session):
     if not profile:
         raise ValueError(f"Profile {session.profile_id} not found")
     
-    proxy = None
+    proxy_config = None
     if session.proxy_id:
         proxy = db.query(Proxy).filter(Proxy.id == session.proxy_id).first()
+        if proxy and proxy.active:
+            proxy_config = build_proxy_config(proxy, db)
     
-    # Update session status
-    session.status = "running"
-    session.started_at = datetime.utcnow()
+    context_options, injection_script = await profile_context_options(profile, proxy_config)
+    storage = get_storage_state_store() if storage_enabled(payload) else None
+    if storage:
+        stored_state = storage.load(profile.id)
+        if stored_state:
+            context_options["storage_state"] = stored_state
+    
+    supervisor = get_executor().sessions
+    kind = "headless" if payload.get("headless") else "headed"
+    # End the read transaction: no pooled connection is held while the browser starts
     db.commit()
     
-    emit_event("session:update", {
-        "id": session.id,
-        "status": session.status,
-        "started_at": session.started_at.isoformat() if session.started_at else None,
-    })
+    try:
+        async with CancelScope([("session", session.id)]):
+            live = await supervisor.start(
+                session.id,
+                profile.id,
+                kind,
+                context_options,
+                prepare=lambda context: prepare_context(context, injection_script),
+            )
+            # Mark running before any further await so the reaper never sees a live context for a non-running row
+            session.status = "running"
+            session.started_at = datetime.utcnow()
+            db.commit()
+            if payload.get("url"):
+                await navigate(live.page, payload["url"], payload.get("readiness"))
+    except JobCancelled as e:
+        await supervisor.stop(session.id)
+        session.status = "stopped"
+        session.stopped_at = datetime.utcnow()
+        session.meta = {**(session.meta or {}), "stopped_reason": "cancelled"}
+        db.commit()
+        emit_event("session:update", {**session_event(session), "reason": "cancelled"})
+        log_to_db("warn", f"Session {session_id} cancelled while starting: {e}", {"session_id": session_id}, db)
+        return {"session_id": session_id, "cancelled": True, "reason": str(e)}
+    except Exception as e:
+        await supervisor.stop(session.id)
+        session.status = "stopped"
+        session.stopped_at = datetime.utcnow()
+        session.meta = {**(session.meta or {}), "error": str(e)}
+        db.commit()
+        emit_event("session:update", {**session_event(session), "error": str(e)})
+        log_to_db("error", f"Session {session_id} failed to start: {e}", {"session_id": session_id}, db)
+        raise
     
-    log_to_db("info", f"Session {session_id} started", {"session_id": session_id}, db)
+    emit_event("session:update", session_event(session))
     
-    # Launch browser and navigate (simplified - actual implementation would keep browser alive)
-    # For now, we'll just update status
-    # In production, you'd maintain browser instances and keep them running
+    log_to_db("info", f"Session {session_id} started", {
+        "session_id": session_id,
+        "live_sessions": supervisor.stats()["live"],
+    }, db)
 
 
-def handle_stop_session(payload: Dict[str, Any], db: Session):
-    """Handle stop_session job."""
+async def handle_stop_session(payload: Dict[str, Any], db: Session):
+    """Handle stop_session job: close the live context (if this worker holds it) and mark the session stopped."""
     session_id = payload.get("session_id")
     if not session_id:
         raise ValueError("session_id required")
@@ -146,20 +389,54 @@ def handle_stop_session(payload: Dict[str, Any], db: Session):
     if not session:
         raise ValueError(f"Session {session_id} not found")
     
+    # Save the session's cookies/localStorage before its context goes away
+    supervisor = get_executor().sessions
+    live = supervisor.get(session.id)
+    if live and storage_enabled(payload):
+        await save_storage_state(get_storage_state_store(), live.profile_id, live.context)
+    # Another worker's live context is closed by its reaper once it sees the row stopped
+    closed_here = await supervisor.stop(session.id)
+    
     session.status = "stopped"
     session.stopped_at = datetime.utcnow()
     db.commit()
     
-    emit_event("session:update", {
-        "id": session.id,
-        "status": session.status,
-        "stopped_at": session.stopped_at.isoformat() if session.stopped_at else None,
-    })
+    emit_event("session:update", session_event(session))
     
-    log_to_db("info", f"Session {session_id} stopped", {"session_id": session_id}, db)
+    log_to_db("info", f"Session {session_id} stopped", {"session_id": session_id, "closed_here": closed_here}, db)
+
+
+def close_session_row(live, reason: str):
+    """Supervisor callback: a live session was evicted, so its row is no longer running."""
+    db = get_db_session()
+    try:
+        session = db.query(SessionModel).filter(SessionModel.id == live.session_id).first()
+        if not session or session.status != "running":
+            return
+        session.status = "stopped"
+        session.stopped_at = datetime.utcnow()
+        session.meta = {**(session.meta or {}), "stopped_reason": reason}
+        db.commit()
+        emit_event("session:update", {**session_event(session), "reason": reason})
+        log_to_db("info", f"Session {live.session_id} stopped ({reason})", {"session_id": live.session_id, "reason": reason})
+    finally:
+        db.close()
+
+
+def running_session_ids(session_ids: List[int]) -> List[int]:
+    """Which of `session_ids` are still running according to the database."""
+    db = get_db_session()
+    try:
+        rows = db.query(SessionModel.id).filter(
+            SessionModel.id.in_(session_ids),
+            SessionModel.status == "running",
+        ).all()
+        return [row[0] for row in rows]
+    finally:
+        db.close()
 
 
-def handle_run_job_execution(payload: Dict[str, Any], db: Session):
+async def handle_run_job_execution(payload: Dict[str, Any], db: Session):
     """
     Handle run_job_execution - main Playwright automation job.
     Creates browser, applies fingerprint, navigates, takes screenshot.
@@ -172,135 +449,85 @@ def handle_run_job_execution(payload: Dict[str, Any], db: Session):
     if not job_exec:
         raise ValueError(f"JobExecution {job_exec_id} not found")
     
+    if job_exec.status == "cancelled":
+        log_to_db("info", f"JobExecution {job_exec_id} was cancelled before it started", {"job_exec_id": job_exec_id}, db)
+        return {"job_execution_id": job_exec_id, "skipped": True}
+    
     profile = db.query(Profile).filter(Profile.id == job_exec.profile_id).first()
     if not profile:
         raise ValueError(f"Profile {job_exec.profile_id} not found")
     
-    # Update status
+    # Proxy of the profile's running session, if any
+    proxy_config = proxy_configs_for_profiles(db, [profile.id]).get(profile.id)
+    
+    # Get URL and per-job options from job payload
+    job = db.query(Job).filter(Job.id == job_exec.job_id).first()
+    job_payload = (job.payload if job else None) or {}
+    test_url = job_payload.get("url") or "https://example.com"
+    blocker = ResourceBlocker(job_payload.get("blocking"))
+    storage = get_storage_state_store() if storage_enabled(job_payload) else None
+    screenshot_options = parse_screenshot(job_payload.get("screenshot"))
+    
+    # Update status; the commit also hands the connection back to the pool for the browser work
     job_exec.status = "running"
     job_exec.started_at = datetime.utcnow()
     db.commit()
     
     emit_event("jobExecution:update", {
         "id": job_exec.id,
+        "job_id": job_exec.job_id,
+        "profile_id": job_exec.profile_id,
         "status": job_exec.status,
         "started_at": job_exec.started_at.isoformat() if job_exec.started_at else None,
     })
     
-    browser = None
-    context = None
-    page = None
+    pool = get_executor().browser_pool
     
     try:
-        # Get proxy config if available
-        proxy_config = None
-        if job_exec.profile_id and profile:
-            # Check if profile has associated proxy (via session)
-            session = db.query(SessionModel).filter(
-                SessionModel.profile_id == job_exec.profile_id,
-                SessionModel.status == "running"
-            ).first()
+        # Cancel flags are polled while the browser work runs; a cancelled execution frees its context at once
+        async with CancelScope([("execution", job_exec_id)]):
+            # Attach to the profile's live session, or lease a fresh context from a warm pooled browser
+            async with profile_context(pool, profile, proxy_config, "headless", storage) as (context, attached):
+                await blocker.attach(context)
+                page = await context.new_page()
+                try:
+                    # Navigate and wait until the page is ready per the job's readiness strategy
+                    log_to_db("info", f"Navigating to {test_url}", {"job_exec_id": job_exec_id, "attached": attached}, db)
+                    readiness = await navigate(page, test_url, job_payload.get("readiness"))
             
-            if session and session.proxy_id:
-                proxy = db.query(Proxy).filter(Proxy.id == session.proxy_id).first()
-                if proxy and proxy.active:
-                    # Decrypt proxy password
-                    proxy_password = None
-                    if proxy.password:
-                        try:
-                            proxy_password = decrypt(proxy.password)
-                        except Exception as e:
-                            log_to_db("warn", f"Failed to decrypt proxy password: {e}", {}, db)
-                    
-                    proxy_config = {
-                        "server": f"{proxy.type}://{proxy.host}:{proxy.port}",
-                        "username": proxy.username,
-                        "password": proxy_password,
-                    }
-        
-        # Get fingerprint data
-        fingerprint_data = profile.fingerprint or {}
-        if profile.user_agent:
-            fingerprint_data["user_agent"] = profile.user_agent
-        
-        # Build injection script
-        injection_script = build_injection(fingerprint_data)
-        
-        # Launch Playwright
-        playwright = sync_playwright().start()
-        
-        # Launch browser with proxy if configured
-        browser = playwright.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-dev-shm-usage",
-                "--no-sandbox",
-                "--use-fake-device-for-media-stream",
-                "--use-fake-ui-for-media-stream",
-                "--disable-webgpu",
-                "--disable-features=WebRtcHideLocalIpsWithMdns",
-                "--force-webrtc-ip-handling-policy=disable_non_proxied_udp",
-                "--no-first-run",
-                "--no-default-browser-check",
-                "--autoplay-policy=no-user-gesture-required",
-            ]
-        )
-        
-        # Create context with proxy
-        context_options = {
-            "viewport": {
-                "width": fingerprint_data.get("screen_width", 1920),
-                "height": fingerprint_data.get("screen_height", 1080),
-            },
-            "user_agent": fingerprint_data.get("user_agent") or profile.user_agent,
-        }
-        
-        if proxy_config:
-            context_options["proxy"] = proxy_config
-        
-        context = browser.new_context(**context_options)
-        
-        # Add scripts as early as possible: fingerprint patch, audio spoof, then fingerprint injection
-        if FINGERPRINT_PATCH_SCRIPT:
-            context.add_init_script(FINGERPRINT_PATCH_SCRIPT)
-        if AUDIO_SPOOF_SCRIPT:
-            context.add_init_script(AUDIO_SPOOF_SCRIPT)
-        context.add_init_script(injection_script)
-        
-        # Create page
-        page = context.new_page()
-        
-        # Get URL from job payload or default test URL
-        job = db.query(Job).filter(Job.id == job_exec.job_id).first()
-        test_url = "https://example.com"
-        if job and job.payload:
-            test_url = job.payload.get("url") or test_url
-        
-        # Navigate
-        log_to_db("info", f"Navigating to {test_url}", {"job_exec_id": job_exec_id}, db)
-        page.goto(test_url, wait_until="networkidle", timeout=30000)
-        
-        # Wait a bit for page to settle
-        page.wait_for_timeout(2000)
-        
-        # Take screenshot
-        screenshot_bytes = page.screenshot(full_page=True)
-        
-        # Save screenshot
-        screenshot_path = save_screenshot(job_exec_id, screenshot_bytes)
+                    # Take screenshot (encoding and thumbnails happen after the context is released)
+                    screenshot_bytes, capture = await capture_screenshot(page, screenshot_options)
+            
+                    if storage:
+                        await save_storage_state(storage, profile.id, context)
+                finally:
+                    if attached:
+                        await release_live_context(context, page, blocker)
+            
+            # Encode, thumbnail and save screenshot off the event loop
+            screenshot = {
+                **await process_screenshot(screenshot_bytes, screenshot_options, job_exec_id, profile.id),
+                **capture,
+            }
+        screenshot_path = screenshot["path"]
         
         # Update job execution
         job_exec.status = "completed"
         job_exec.completed_at = datetime.utcnow()
         job_exec.result = {
             "screenshot": screenshot_path,
+            "screenshot_info": screenshot,
             "url": test_url,
+            "readiness": readiness,
+            "blocking": blocker.stats(),
+            "session_attached": attached,
         }
         db.commit()
         
         emit_event("jobExecution:update", {
             "id": job_exec.id,
+            "job_id": job_exec.job_id,
+            "profile_id": job_exec.profile_id,
             "status": job_exec.status,
             "completed_at": job_exec.completed_at.isoformat() if job_exec.completed_at else None,
             "result": job_exec.result,
@@ -309,8 +536,31 @@ def handle_run_job_execution(payload: Dict[str, Any], db: Session):
         log_to_db("info", f"JobExecution {job_exec_id} completed", {
             "job_exec_id": job_exec_id,
             "screenshot": screenshot_path,
+            "browser_pool": pool.stats(),
         }, db)
         
+    except (JobCancelled, asyncio.CancelledError) as e:
+        # A job cancelled by its timeout is a failure, which handle_job_failure may retry
+        timed_out = isinstance(e, asyncio.CancelledError) and job_timed_out()
+        reason = str(e) if isinstance(e, JobCancelled) else JOB_TIMEOUT_REASON if timed_out else "Cancelled"
+        job_exec.status = "failed" if timed_out else "cancelled"
+        job_exec.completed_at = datetime.utcnow()
+        job_exec.error = reason
+        db.commit()
+        
+        emit_event("jobExecution:update", {
+            "id": job_exec.id,
+            "job_id": job_exec.job_id,
+            "profile_id": job_exec.profile_id,
+            "status": job_exec.status,
+            "error": job_exec.error,
+        })
+        
+        log_to_db("error" if timed_out else "warn", f"JobExecution {job_exec_id} {job_exec.status}", {"job_exec_id": job_exec_id, "reason": reason}, db)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return {"job_execution_id": job_exec_id, "cancelled": True, "reason": reason}
+    
     except Exception as e:
         error_msg = f"JobExecution {job_exec_id} failed: {str(e)}\n{traceback.format_exc()}"
         log_to_db("error", error_msg, {"job_exec_id": job_exec_id}, db)
@@ -322,177 +572,495 @@ def handle_run_job_execution(payload: Dict[str, Any], db: Session):
         
         emit_event("jobExecution:update", {
             "id": job_exec.id,
+            "job_id": job_exec.job_id,
+            "profile_id": job_exec.profile_id,
             "status": job_exec.status,
             "error": job_exec.error,
         })
         
         raise
+
+
+async def handle_gc_screenshots(payload: Dict[str, Any], db: Session):
+    """
+    Handle gc_screenshots - enforce screenshot retention now.
+    Payload may override the env policy: max_age_days, per_profile, total_bytes.
+    """
+    policy = {key: payload[key] for key in ("max_age_days", "per_profile", "total_bytes") if payload.get(key) is not None}
+    result = await gc_screenshots(**policy)
+    log_to_db("info", "Screenshot GC finished", {"policy": policy, "result": result}, db)
+    return result
+
+
+async def handle_run_scheduled_job(payload: Dict[str, Any], db: Session):
+    """
+    Handle run_scheduled_job - one run of a recurring Job, fired by the scheduler.
+    Creates a JobExecution per profile and enqueues them like a new job's fan-out;
+    without profiles the job itself is enqueued (e.g. a nightly gc_screenshots).
+    """
+    job_id = payload["job_id"]
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        # Deleted while its schedule was still armed
+        get_delayed_jobs().cancel(job_entry_id(job_id))
+        log_to_db("warn", f"Scheduled job {job_id} no longer exists; schedule removed", {"job_id": job_id}, db)
+        return {"job_id": job_id, "skipped": True}
+
+    job_payload = dict(job.payload or {})
+    schedule = job_payload.pop("schedule", None)
+    executions = []
+    if payload.get("profile_ids"):
+        existing = existing_profile_ids(db, payload["profile_ids"])
+        executions = create_job_executions(db, job.id, [pid for pid in payload["profile_ids"] if pid in existing])
+        jobs = [item for _, item in fanout_jobs(job.type, job_payload, executions)]
+    else:
+        jobs = [(job.type, job_payload)]
+    # The scheduler re-armed the entry before enqueueing this run
+    next_due = get_delayed_jobs().due_at(job_entry_id(job.id)) if schedule else None
+    if next_due:
+        job.scheduled_at = datetime.utcfromtimestamp(next_due)
+    db.commit()
+
+    results = enqueue_jobs_bulk(jobs, user_id=payload.get("user_id"), lane=job_payload.get("priority"))
+    failed = sum(1 for _, error in results if error)
+    result = {"job_id": job.id, "executions": len(executions), "enqueued": len(jobs) - failed, "failed": failed}
+    log_to_db("error" if failed else "info", f"Scheduled run of job {job.id} enqueued", result, db)
+    return result
+
+
+def workflow_version(workflow: Workflow) -> str:
+    """Cache key for a workflow's compiled plan; changes whenever the row is updated."""
+    changed_at = workflow.updated_at or workflow.created_at
+    return f"{workflow.id}:{changed_at.isoformat() if changed_at else ''}"
+
+
+async def profile_context_options(profile: Profile, proxy_config: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+    """Context options and injection script for a profile's fingerprint and proxy."""
+    fingerprint_data = normalize_fingerprint(profile.fingerprint, profile.user_agent)
     
+    # Injection script (built once per fingerprint, usually when the profile was saved)
+    injection_script = await get_injection_cache().aget(fingerprint_data)
+    
+    context_options = {
+        "viewport": {
+            "width": fingerprint_data.get("screen_width", 1920),
+            "height": fingerprint_data.get("screen_height", 1080),
+        },
+        "user_agent": fingerprint_data.get("user_agent") or profile.user_agent,
+    }
+    if proxy_config:
+        context_options["proxy"] = proxy_config
+    return context_options, injection_script
+
+
+async def prepare_context(context, injection_script: str):
+    """Add scripts as early as possible: fingerprint patch, audio spoof, then fingerprint injection."""
+    if FINGERPRINT_PATCH_SCRIPT:
+        await context.add_init_script(FINGERPRINT_PATCH_SCRIPT)
+    if AUDIO_SPOOF_SCRIPT:
+        await context.add_init_script(AUDIO_SPOOF_SCRIPT)
+    await context.add_init_script(injection_script)
+
+
+@asynccontextmanager
+async def profile_context(pool, profile: Profile, proxy_config: Optional[Dict[str, Any]], kind: str, storage=None):
+    """
+    Yield (context, attached) for a job on `profile`: the live context of its
+    running session when this worker holds one, otherwise a fresh pooled context.
+    """
+    # Navigations in this job are rate limited per proxy as well as per domain
+    proxy_token = current_proxy.set(proxy_config["server"] if proxy_config else None)
+    try:
+        async with get_executor().sessions.attach(profile.id) as live_context:
+            if live_context is not None:
+                yield live_context, True
+                return
+        
+        context_options, injection_script = await profile_context_options(profile, proxy_config)
+        if storage:
+            stored_state = storage.load(profile.id)
+            if stored_state:
+                context_options["storage_state"] = stored_state
+        
+        async with pool.context(kind, **context_options) as context:
+            await prepare_context(context, injection_script)
+            yield context, False
     finally:
-        # Cleanup
-        if page:
-            try:
-                page.close()
-            except:
-                pass
-        if context:
-            try:
-                context.close()
-            except:
-                pass
-        if browser:
-            try:
-                browser.close()
-            except:
-                pass
+        current_proxy.reset(proxy_token)
+
+
+async def release_live_context(context, page, blocker: ResourceBlocker):
+    """Undo a job's changes to a live session context: its page and request routing."""
+    try:
+        await blocker.detach(context)
+        if not page.is_closed():
+            await page.close()
+    except Exception as e:
+        print(f"Failed to release live session context: {e}")
+
+
+async def save_storage_state(store, profile_id: int, context):
+    """Persist a profile's storage state at job end; failures are logged, never raised."""
+    try:
+        await store.save(profile_id, context)
+    except Exception as e:
+        log_to_db("warn", f"Failed to save storage state for profile {profile_id}: {e}", {"profile_id": profile_id})
+
+
+def build_proxy_config(proxy: Proxy, db: Session) -> Dict[str, Any]:
+    """Playwright proxy settings for an active proxy row."""
+    proxy_password = None
+    if proxy.password:
+        try:
+            proxy_password = decrypt(proxy.password)
+        except Exception as e:
+            log_to_db("warn", f"Failed to decrypt proxy password: {e}", {}, db)
+    
+    return {
+        "server": f"{proxy.type}://{proxy.host}:{proxy.port}",
+        "username": proxy.username,
+        "password": proxy_password,
+    }
+
+
+def proxy_configs_for_profiles(db: Session, profile_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Proxy settings of each profile's running session, loaded with one query."""
+    if not profile_ids:
+        return {}
+    rows = (
+        db.query(SessionModel.profile_id, Proxy)
+        .join(Proxy, Proxy.id == SessionModel.proxy_id)
+        .filter(
+            SessionModel.profile_id.in_(set(profile_ids)),
+            SessionModel.status == "running",
+            Proxy.active.is_(True),
+        )
+        .all()
+    )
+    configs = {}
+    for profile_id, proxy in rows:
+        configs.setdefault(profile_id, build_proxy_config(proxy, db))
+    return configs
+
+
+async def run_workflow_for_profile(
+    pool,
+    plan,
+    profile: Profile,
+    proxy_config: Optional[Dict[str, Any]],
+    kind: str = "headed",
+    blocking: Union[str, Dict[str, Any], None] = None,
+    persist_storage: bool = True,
+) -> Dict[str, Any]:
+    """
+    Run a compiled workflow in the profile's live session context, or in a fresh
+    pooled context set up with its fingerprint and, when persist_storage is set,
+    its saved cookies/localStorage.
+    """
+    blocker = ResourceBlocker(blocking)
+    storage = get_storage_state_store() if persist_storage else None
+    
+    async with profile_context(pool, profile, proxy_config, kind, storage) as (context, attached):
+        await blocker.attach(context)
+        page = await context.new_page()
+        
+        # Execute workflow (compiled once per workflow version); keep logins even if a later step failed
         try:
-            playwright.stop()
-        except:
-            pass
+            result = await execute_workflow(page, plan)
+        finally:
+            if storage:
+                await save_storage_state(storage, profile.id, context)
+            if attached:
+                await release_live_context(context, page, blocker)
+    
+    result["session_attached"] = attached
+    if blocker.active:
+        result["blocking"] = blocker.stats()
+    return result
 
 
-def handle_run_workflow(payload: Dict[str, Any], db: Session):
+async def handle_run_workflow(payload: Dict[str, Any], db: Session):
     """
     Handle run_workflow - execute workflow using React Flow graph.
+    Its JobExecution (payload "job_execution_id", if any) goes running -> completed/failed
+    like run_job_execution's, so retries and dead letters show on the row.
     """
     workflow_id = payload.get("workflow_id")
     profile_id = payload.get("profile_id")
+    exec_id = payload.get("job_execution_id")
     
     if not workflow_id:
         raise ValueError("workflow_id required")
     if not profile_id:
         raise ValueError("profile_id required")
     
-    workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
-    if not workflow:
-        raise ValueError(f"Workflow {workflow_id} not found")
-    
-    profile = db.query(Profile).filter(Profile.id == profile_id).first()
-    if not profile:
-        raise ValueError(f"Profile {profile_id} not found")
-    
-    log_to_db("info", f"Starting workflow {workflow.name} for profile {profile_id}", {
-        "workflow_id": workflow_id,
-        "profile_id": profile_id,
-    }, db)
+    if exec_id:
+        if db.query(JobExecution.status).filter(JobExecution.id == exec_id).scalar() == "cancelled":
+            log_to_db("info", f"JobExecution {exec_id} was cancelled before it started", {"job_exec_id": exec_id}, db)
+            return {"job_execution_id": exec_id, "skipped": True}
+        set_execution_status(db, exec_id, "running", started_at=datetime.utcnow(), completed_at=None, error=None)
     
-    browser = None
-    context = None
-    page = None
-    playwright = None
+    pool = get_executor().browser_pool
+    result = None
     
     try:
-        # Get proxy config if available
-        proxy_config = None
-        session = db.query(SessionModel).filter(
-            SessionModel.profile_id == profile_id,
-            SessionModel.status == "running"
-        ).first()
-        
-        if session and session.proxy_id:
-            proxy = db.query(Proxy).filter(Proxy.id == session.proxy_id).first()
-            if proxy and proxy.active:
-                proxy_password = None
-                if proxy.password:
-                    try:
-                        proxy_password = decrypt(proxy.password)
-                    except Exception as e:
-                        log_to_db("warn", f"Failed to decrypt proxy password: {e}", {}, db)
-                
-                proxy_config = {
-                    "server": f"{proxy.type}://{proxy.host}:{proxy.port}",
-                    "username": proxy.username,
-                    "password": proxy_password,
-                }
-        
-        # Get fingerprint data
-        fingerprint_data = profile.fingerprint or {}
-        if profile.user_agent:
-            fingerprint_data["user_agent"] = profile.user_agent
-        
-        # Build injection script
-        injection_script = build_injection(fingerprint_data)
+        workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+        if not workflow:
+            raise ValueError(f"Workflow {workflow_id} not found")
         
-        # Launch Playwright
-        playwright = sync_playwright().start()
+        profile = db.query(Profile).filter(Profile.id == profile_id).first()
+        if not profile:
+            raise ValueError(f"Profile {profile_id} not found")
         
-        # Run in non-headless mode so user can see automation
-        browser = playwright.chromium.launch(
-            headless=False,  # Show browser window for visibility
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-dev-shm-usage",
-                "--no-sandbox",
-                "--disable-infobars",  # Hide "Chrome is being controlled" message
-                "--use-fake-device-for-media-stream",
-                "--use-fake-ui-for-media-stream",
-                "--disable-webgpu",
-                "--disable-features=WebRtcHideLocalIpsWithMdns",
-                "--force-webrtc-ip-handling-policy=disable_non_proxied_udp",
-                "--no-first-run",
-                "--no-default-browser-check",
-                "--autoplay-policy=no-user-gesture-required",
-            ]
-        )
+        plan = get_workflow_plan(workflow.data or {}, workflow_version(workflow))
         
-        # Create context with proxy
-        context_options = {
-            "viewport": {
-                "width": fingerprint_data.get("screen_width", 1920),
-                "height": fingerprint_data.get("screen_height", 1080),
-            },
-            "user_agent": fingerprint_data.get("user_agent") or profile.user_agent,
-        }
+        log_to_db("info", f"Starting workflow {workflow.name} for profile {profile_id}", {
+            "workflow_id": workflow_id,
+            "profile_id": profile_id,
+        }, db)
         
-        if proxy_config:
-            context_options["proxy"] = proxy_config
+        proxy_config = proxy_configs_for_profiles(db, [profile_id]).get(profile_id)
+        # End the read transaction: no pooled connection is held while the browser runs
+        db.commit()
         
-        context = browser.new_context(**context_options)
-        # Add scripts as early as possible: fingerprint patch, audio spoof, then fingerprint injection
-        if FINGERPRINT_PATCH_SCRIPT:
-            context.add_init_script(FINGERPRINT_PATCH_SCRIPT)
-        if AUDIO_SPOOF_SCRIPT:
-            context.add_init_script(AUDIO_SPOOF_SCRIPT)
-        context.add_init_script(injection_script)
-        page = context.new_page()
+        # Headed by default so the user can see automation (retries of headless batches keep "headless")
+        async with CancelScope([("execution", exec_id)] if exec_id else []):
+            result = await run_workflow_for_profile(
+                pool, plan, profile, proxy_config,
+                "headless" if payload.get("headless") else "headed",
+                blocking=payload.get("blocking"),
+                persist_storage=storage_enabled(payload),
+            )
         
-        # Execute workflow
-        workflow_data = workflow.data or {}
-        result = execute_workflow(page, workflow_data)
+        node_error = result.pop("exception", None)
+        if node_error is not None:
+            # A failed node is retried or dead-lettered by its error, like any other job failure
+            raise node_error
+        if exec_id:
+            error = None if result.get("success") else (result.get("error") or "; ".join(result.get("errors") or []) or "Workflow failed")
+            set_execution_status(
+                db, exec_id, "failed" if error else "completed",
+                completed_at=datetime.utcnow(), result=result, error=error,
+            )
         
         log_to_db("info", f"Workflow {workflow_id} completed", {
             "workflow_id": workflow_id,
             "profile_id": profile_id,
             "result": result,
+            "browser_pool": pool.stats(),
         }, db)
         
         return result
         
+    except JobCancelled as e:
+        if exec_id:
+            mark_cancelled(db, [exec_id], str(e))
+        log_to_db("warn", f"Workflow {workflow_id} cancelled for profile {profile_id}", {
+            "workflow_id": workflow_id,
+            "profile_id": profile_id,
+            "job_exec_id": exec_id,
+            "reason": str(e),
+        }, db)
+        return {"success": False, "cancelled": True, "reason": str(e)}
+    
+    except asyncio.CancelledError:
+        if exec_id:
+            db.rollback()
+            if job_timed_out():
+                set_execution_status(db, exec_id, "failed", completed_at=datetime.utcnow(), error=JOB_TIMEOUT_REASON)
+            else:
+                mark_cancelled(db, [exec_id], "Cancelled")
+        raise
+    
     except Exception as e:
         error_msg = f"Workflow {workflow_id} failed: {str(e)}\n{traceback.format_exc()}"
         log_to_db("error", error_msg, {"workflow_id": workflow_id, "profile_id": profile_id}, db)
+        if exec_id:
+            # handle_job_failure puts it back to pending if a retry is scheduled
+            db.rollback()
+            values = {"result": result} if result is not None else {}
+            set_execution_status(db, exec_id, "failed", completed_at=datetime.utcnow(), error=str(e), **values)
         raise
+
+
+class ExecutionUpdates:
+    """Buffers JobExecution status changes and writes them with one bulk UPDATE per flush."""
     
-    finally:
-        # Cleanup
-        if page:
-            try:
-                page.close()
-            except:
-                pass
-        if context:
-            try:
-                context.close()
-            except:
-                pass
-        if browser:
-            try:
-                browser.close()
-            except:
-                pass
-        if playwright:
-            try:
-                playwright.stop()
-            except:
-                pass
+    def __init__(self, db: Session, flush_every: int = WORKFLOW_BATCH_FLUSH_EVERY):
+        self.db = db
+        self.flush_every = max(1, flush_every)
+        self._pending: List[Dict[str, Any]] = []
+        self._events: List[Dict[str, Any]] = []
+    
+    def add(self, values: Dict[str, Any], event: Dict[str, Any]):
+        self._pending.append(values)
+        self._events.append(event)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+    
+    def flush(self):
+        if not self._pending:
+            return
+        pending, events = self._pending, self._events
+        self._pending, self._events = [], []
+        # ORM bulk UPDATE by primary key: rows are grouped into executemany batches
+        self.db.execute(update(JobExecution), pending)
+        self.db.commit()
+        for event in events:
+            emit_event("jobExecution:update", event)
 
+
+async def handle_run_workflow_batch(payload: Dict[str, Any], db: Session):
+    """
+    Handle run_workflow_batch - run one workflow across many profiles.
+    The workflow is loaded and compiled once; profiles run concurrently
+    (payload "concurrency") and their JobExecution rows are updated in bulk.
+    """
+    workflow_id = payload.get("workflow_id")
+    exec_ids = payload.get("job_execution_ids") or []
+    concurrency = max(1, int(payload.get("concurrency") or WORKFLOW_BATCH_CONCURRENCY))
+    kind = "headless" if payload.get("headless") else "headed"
+    
+    if not workflow_id:
+        raise ValueError("workflow_id required")
+    if not exec_ids:
+        raise ValueError("job_execution_ids required")
+    
+    workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    if not workflow:
+        raise ValueError(f"Workflow {workflow_id} not found")
+    
+    plan = get_workflow_plan(workflow.data or {}, workflow_version(workflow))
+    
+    # (job_execution_id, job_id, Profile) for the whole batch in one query
+    executions = [
+        tuple(row) for row in (
+            db.query(JobExecution.id, JobExecution.job_id, Profile)
+            .join(Profile, Profile.id == JobExecution.profile_id)
+            .filter(JobExecution.id.in_(set(exec_ids)), JobExecution.status != "cancelled")
+            .order_by(JobExecution.id)
+            .all()
+        )
+    ]
+    proxy_configs = proxy_configs_for_profiles(db, [profile.id for _, _, profile in executions])
+    
+    missing = set(exec_ids) - {exec_id for exec_id, _, _ in executions}
+    if missing:
+        log_to_db("warn", f"Workflow batch skipped {len(missing)} missing or cancelled job executions", {
+            "workflow_id": workflow_id,
+            "job_execution_ids": sorted(missing),
+        }, db)
+    
+    # Mark the whole batch running with one UPDATE
+    started_at = datetime.utcnow()
+    db.execute(
+        update(JobExecution)
+        .where(JobExecution.id.in_([exec_id for exec_id, _, _ in executions]))
+        .values(status="running", started_at=started_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    for exec_id, job_id, profile in executions:
+        emit_event("jobExecution:update", {
+            "id": exec_id,
+            "job_id": job_id,
+            "profile_id": profile.id,
+            "status": "running",
+            "started_at": started_at.isoformat(),
+        })
+    
+    log_to_db("info", f"Starting workflow {workflow.name} for {len(executions)} profiles", {
+        "workflow_id": workflow_id,
+        "profiles": len(executions),
+        "concurrency": concurrency,
+    }, db)
+    
+    pool = get_executor().browser_pool
+    updates = ExecutionUpdates(db)
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = set()
+    summary = {"completed": 0, "failed": 0, "cancelled": 0}
+    # (job_execution_id, profile_id, exception) of failed profiles, retried or dead-lettered one by one
+    failures: List[Tuple[int, int, BaseException]] = []
+    
+    def record(exec_id: int, job_id: int, profile_id: int, status: str, result=None, error=None):
+        finished.add(exec_id)
+        summary[status] += 1
+        completed_at = datetime.utcnow()
+        updates.add(
+            {"id": exec_id, "status": status, "completed_at": completed_at, "result": result, "error": error},
+            {
+                "id": exec_id,
+                "job_id": job_id,
+                "profile_id": profile_id,
+                "status": status,
+                "completed_at": completed_at.isoformat(),
+                "result": result,
+                "error": error,
+            },
+        )
+    
+    async def run_one(exec_id: int, job_id: int, profile: Profile):
+        async with semaphore:
+            try:
+                # Each profile is cancelled on its own; the rest of the batch carries on
+                async with CancelScope([("execution", exec_id)]):
+                    result = await run_workflow_for_profile(
+                        pool, plan, profile, proxy_configs.get(profile.id), kind,
+                        payload.get("blocking"), storage_enabled(payload),
+                    )
+            except asyncio.CancelledError:
+                raise
+            except JobCancelled as e:
+                record(exec_id, job_id, profile.id, "cancelled", error=str(e))
+                return
+            except Exception as e:
+                log_to_db("error", f"Workflow {workflow_id} failed for profile {profile.id}: {e}", {
+                    "workflow_id": workflow_id,
+                    "profile_id": profile.id,
+                    "job_exec_id": exec_id,
+                }, db)
+                record(exec_id, job_id, profile.id, "failed", error=str(e))
+                failures.append((exec_id, profile.id, e))
+                return
+            node_error = result.pop("exception", None)
+            if node_error is not None:
+                failures.append((exec_id, profile.id, node_error))
+            if result.get("success"):
+                record(exec_id, job_id, profile.id, "completed", result=result)
+            else:
+                error = result.get("error") or "; ".join(result.get("errors") or []) or "Workflow failed"
+                record(exec_id, job_id, profile.id, "failed", result=result, error=error)
+    
+    try:
+        await asyncio.gather(*(run_one(*execution) for execution in executions))
+    except asyncio.CancelledError:
+        status, error = ("failed", JOB_TIMEOUT_REASON) if job_timed_out() else ("cancelled", "Cancelled")
+        for exec_id, job_id, profile in executions:
+            if exec_id not in finished:
+                record(exec_id, job_id, profile.id, status, error=error)
+        log_to_db("warn", f"Workflow batch for workflow {workflow_id} {error.lower()}", {"workflow_id": workflow_id, **summary}, db)
+        raise
+    finally:
+        updates.flush()
+    
+    # Rows are written as failed above, so a scheduled retry can put them back to pending
+    loop = asyncio.get_running_loop()
+    summary["retrying"] = 0
+    for exec_id, profile_id, exc in failures:
+        retry_payload = {
+            "workflow_id": workflow_id,
+            "profile_id": profile_id,
+            "job_execution_id": exec_id,
+            **{key: payload[key] for key in ("blocking", "persist_storage", "headless") if key in payload},
+        }
+        if await loop.run_in_executor(None, handle_job_failure, "run_workflow", retry_payload, exc):
+            summary["retrying"] += 1
+    
+    log_to_db("info", f"Workflow {workflow_id} batch completed", {
+        "workflow_id": workflow_id,
+        **summary,
+        "browser_pool": pool.stats(),
+    }, db)
+    
+    return {"workflow_id": workflow_id, "profiles": len(executions), **summary}
@@ -0,0 +1,372 @@
+"""
+Delayed and recurring jobs.
+Entries live in Redis: a sorted set of entry id -> due time and a hash of entry
+id -> JSON (the worker jobs to enqueue, and for recurring entries the schedule).
+One poll loop per process claims due entries with a Lua script (moving them
+to a claims set under a lease) and fires each in a MULTI/EXEC that enqueues its
+jobs, sets a per-occurrence "fired" marker and re-arms or drops the entry.
+The marker is WATCHed, so an occurrence whose claim expired and was taken
+again by another poller is never enqueued twice; a poller that dies after
+claiming leaves the claim to expire and be retried. Any number of workers can
+run the loop.
+
+Schedules are {"cron": "<min> <hour> <day> <month> <weekday>"} (UTC, or an
+alias such as "@daily") or {"every": <seconds>}. Missed occurrences (scheduler
+down) fire once, not once per missed slot.
+
+Usage (when no async worker runs the loop):
+    python -m worker.scheduler
+"""
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple, FrozenSet, NamedTuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("ntg.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+SCHEDULER_POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", "1"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+SCHEDULER_LEASE = int(os.getenv("SCHEDULER_LEASE", "60"))  # seconds before a claimed entry is retried
+SCHEDULER_MIN_INTERVAL = int(os.getenv("SCHEDULER_MIN_INTERVAL", "60"))  # shortest {"every": n}
+
+SCHEDULE_KEY = "ntg:scheduled"  # zset: entry id -> due time
+SCHEDULE_DATA_KEY = "ntg:scheduled:data"  # hash: entry id -> JSON
+SCHEDULE_CLAIMS_KEY = "ntg:scheduled:claims"  # zset: "<entry id>|<due>" -> lease expiry
+FIRED_KEY = "ntg:scheduled:fired:{entry_id}:{due}"
+FIRED_TTL = 7 * 86400
+
+# KEYS: schedule zset, claims zset. ARGV: now, lease expiry, limit.
+# Expired claims go back to the schedule (unless it was re-armed meanwhile),
+# then up to `limit` due entries move to the claims set.
+CLAIM_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], member)
+    local sep = string.find(member, '|', 1, true)
+    redis.call('ZADD', KEYS[1], 'NX', string.sub(member, sep + 1), string.sub(member, 1, sep - 1))
+end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[3])
+local claimed = {}
+for i = 1, #due, 2 do
+    redis.call('ZREM', KEYS[1], due[i])
+    local member = due[i] .. '|' .. due[i + 1]
+    redis.call('ZADD', KEYS[2], ARGV[2], member)
+    claimed[#claimed + 1] = member
+end
+return claimed
+"""
+
+CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# (low, high) for minute, hour, day of month, month, day of week (0 and 7 are Sunday)
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# Give up looking for a matching minute after this long (e.g. "0 0 31 2 *")
+CRON_HORIZON = timedelta(days=5 * 366)
+
+
+class CronSpec(NamedTuple):
+    minutes: FrozenSet[int]
+    hours: FrozenSet[int]
+    days: FrozenSet[int]
+    months: FrozenSet[int]
+    weekdays: FrozenSet[int]
+    any_day: bool
+    any_weekday: bool
+
+
+def _cron_field(text: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        body, slash, step_text = part.partition("/")
+        step = int(step_text) if slash else 1
+        if body == "*":
+            start, end = low, high
+        elif "-" in body:
+            start, end = (int(v) for v in body.split("-", 1))
+        else:
+            start = int(body)
+            end = high if slash else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(part)
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+def parse_cron(expr: str) -> CronSpec:
+    """Parse a 5-field cron expression or alias. Raises ValueError."""
+    text = CRON_ALIASES.get(expr.strip().lower(), expr)
+    fields = text.split()
+    if len(fields) != 5:
+        raise ValueError(f"Invalid cron expression (expected 5 fields): {expr}")
+    try:
+        minutes, hours, days, months, weekdays = (
+            _cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_RANGES)
+        )
+    except ValueError:
+        raise ValueError(f"Invalid cron expression: {expr}")
+    weekdays = frozenset(d % 7 for d in weekdays)
+    return CronSpec(minutes, hours, days, months, weekdays, fields[2] == "*", fields[4] == "*")
+
+
+def _day_matches(spec: CronSpec, t: datetime) -> bool:
+    in_days = t.day in spec.days
+    in_weekdays = (t.weekday() + 1) % 7 in spec.weekdays
+    # Like cron: when both day fields are restricted, either may match
+    if not spec.any_day and not spec.any_weekday:
+        return in_days or in_weekdays
+    return in_days and in_weekdays
+
+
+def next_cron(spec: CronSpec, after: datetime) -> datetime:
+    """First minute strictly after `after` (UTC) matching the spec."""
+    t = after.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = t + CRON_HORIZON
+    while t < limit:
+        if t.month not in spec.months:
+            t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+        elif not _day_matches(spec, t):
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in spec.hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute not in spec.minutes:
+            t += timedelta(minutes=1)
+        else:
+            return t
+    raise ValueError("Cron expression never matches")
+
+
+def parse_schedule(spec: Any) -> Dict[str, Any]:
+    """
+    Normalize a recurring schedule: a cron string, {"cron": ...} or {"every": seconds}.
+    Raises ValueError.
+    """
+    if isinstance(spec, str):
+        spec = {"cron": spec}
+    if not isinstance(spec, dict) or len(spec) != 1:
+        raise ValueError('schedule must be a cron expression, {"cron": ...} or {"every": seconds}')
+    if "cron" in spec:
+        # Also rejects expressions that never match, like "0 0 31 2 *"
+        next_cron(parse_cron(str(spec["cron"])), datetime.now(timezone.utc))
+        return {"cron": str(spec["cron"])}
+    if "every" in spec:
+        try:
+            every = int(spec["every"])
+        except (TypeError, ValueError):
+            raise ValueError("schedule.every must be a number of seconds")
+        if every < SCHEDULER_MIN_INTERVAL:
+            raise ValueError(f"schedule.every must be at least {SCHEDULER_MIN_INTERVAL} seconds")
+        return {"every": every}
+    raise ValueError('schedule must be a cron expression, {"cron": ...} or {"every": seconds}')
+
+
+def next_run(schedule: Dict[str, Any], after: float, last_due: Optional[float] = None) -> float:
+    """
+    Next occurrence of a parsed schedule strictly after `after` (epoch seconds).
+    Interval schedules keep their phase from `last_due` when given.
+    """
+    if "every" in schedule:
+        every = schedule["every"]
+        if last_due is None:
+            return after + every
+        missed = max(0, int((after - last_due) // every))
+        return last_due + (missed + 1) * every
+    after_dt = datetime.fromtimestamp(after, timezone.utc)
+    return next_cron(parse_cron(schedule["cron"]), after_dt).timestamp()
+
+
+def job_entry_id(job_id: int) -> str:
+    """Entry holding a Job's delayed fan-out or its recurring runs."""
+    return f"job:{job_id}"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class DelayedJobs:
+    """Delayed/recurring job entries in Redis and the loop that promotes them to the RQ queues."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._claim = redis_client.register_script(CLAIM_LUA)
+        self._stats = {"fired": 0, "duplicates_skipped": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def schedule(
+        self,
+        entry_id: str,
+        due: float,
+        jobs: List[Tuple[str, dict]],
+        user_id: Optional[int] = None,
+        lane: Optional[str] = None,
+        schedule: Optional[Dict[str, Any]] = None,
+    ):
+        """Create or replace an entry. `jobs` are (job_type, payload) pairs enqueued when it fires."""
+        entry = {"jobs": [list(job) for job in jobs], "user_id": user_id, "lane": lane, "schedule": schedule}
+        with self.redis.pipeline() as pipe:
+            pipe.hset(SCHEDULE_DATA_KEY, entry_id, json.dumps(entry, default=str))
+            pipe.zadd(SCHEDULE_KEY, {entry_id: due})
+            pipe.execute()
+
+    def reschedule(self, entry_id: str, due: float) -> bool:
+        """Move a pending entry to a new due time. False if it has no pending occurrence."""
+        if self.redis.zscore(SCHEDULE_KEY, entry_id) is None:
+            return False
+        self.redis.zadd(SCHEDULE_KEY, {entry_id: due}, xx=True)
+        return True
+
+    def cancel(self, entry_id: str) -> bool:
+        """Drop an entry; an occurrence already claimed is skipped when it would fire."""
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(SCHEDULE_KEY, entry_id)
+            pipe.hdel(SCHEDULE_DATA_KEY, entry_id)
+            removed, _ = pipe.execute()
+        return bool(removed)
+
+    def due_at(self, entry_id: str) -> Optional[float]:
+        return self.redis.zscore(SCHEDULE_KEY, entry_id)
+
+    def fire(self, member: str, now: float) -> bool:
+        """Enqueue one claimed occurrence exactly once and re-arm or drop its entry."""
+        from redis.exceptions import WatchError
+        from worker.queue import enqueue_in_pipeline, QUEUE_BULK_THRESHOLD
+
+        entry_id, _, due_text = member.rpartition("|")
+        raw = self.redis.hget(SCHEDULE_DATA_KEY, entry_id)
+        if raw is None:
+            # Cancelled after it was claimed
+            self.redis.zrem(SCHEDULE_CLAIMS_KEY, member)
+            return False
+        entry = json.loads(raw)
+        jobs = [tuple(job) for job in entry["jobs"]]
+        lane = entry.get("lane")
+        if lane is None and len(jobs) > QUEUE_BULK_THRESHOLD:
+            lane = "bulk"
+        next_due = None
+        if entry.get("schedule"):
+            next_due = next_run(entry["schedule"], max(now, float(due_text)), float(due_text))
+
+        marker = FIRED_KEY.format(entry_id=entry_id, due=due_text)
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(marker)
+                already_fired = pipe.exists(marker)
+                pipe.multi()
+                if not already_fired:
+                    enqueue_in_pipeline(pipe, jobs, entry.get("user_id"), lane)
+                    pipe.set(marker, 1, ex=FIRED_TTL)
+                pipe.zrem(SCHEDULE_CLAIMS_KEY, member)
+                if next_due is not None:
+                    pipe.zadd(SCHEDULE_KEY, {entry_id: next_due})
+                else:
+                    pipe.hdel(SCHEDULE_DATA_KEY, entry_id)
+                pipe.execute()
+            except WatchError:
+                # Another poller fired this occurrence between our check and EXEC
+                already_fired = True
+        self._count("duplicates_skipped" if already_fired else "fired")
+        return not already_fired
+
+    def promote(self, now: Optional[float] = None) -> int:
+        """Claim and fire due entries (up to SCHEDULER_BATCH_SIZE). Returns occurrences claimed."""
+        now = time.time() if now is None else now
+        claimed = self._claim(
+            keys=[SCHEDULE_KEY, SCHEDULE_CLAIMS_KEY],
+            args=[now, now + SCHEDULER_LEASE, SCHEDULER_BATCH_SIZE],
+        )
+        for member in claimed:
+            try:
+                self.fire(_text(member), now)
+            except Exception:
+                # Left claimed; retried once its lease expires
+                self._count("errors")
+                logger.exception("Failed to fire scheduled entry %s", _text(member))
+        return len(claimed)
+
+    def next_due(self) -> Optional[float]:
+        first = self.redis.zrange(SCHEDULE_KEY, 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    def run(self, stop: threading.Event, poll_interval: float = SCHEDULER_POLL_INTERVAL):
+        """Poll loop: fire what is due, then sleep until the next due time (at most poll_interval)."""
+        logger.info("Scheduler polling every %.1fs", poll_interval)
+        while not stop.is_set():
+            try:
+                if self.promote() >= SCHEDULER_BATCH_SIZE:
+                    continue
+                next_due = self.next_due()
+                delay = poll_interval if next_due is None else min(poll_interval, max(0.0, next_due - time.time()))
+            except Exception:
+                self._count("errors")
+                logger.exception("Scheduler poll failed")
+                delay = poll_interval * 5
+            stop.wait(delay)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.redis.pipeline() as pipe:
+            pipe.zcard(SCHEDULE_KEY)
+            pipe.zcard(SCHEDULE_CLAIMS_KEY)
+            pipe.zrange(SCHEDULE_KEY, 0, 0, withscores=True)
+            pending, claimed, first = pipe.execute()
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "pending": pending,
+            "claimed": claimed,
+            "next_due_at": datetime.fromtimestamp(first[0][1], timezone.utc).isoformat() if first else None,
+        })
+        return stats
+
+
+_delayed: Optional[DelayedJobs] = None
+_delayed_lock = threading.Lock()
+
+
+def get_delayed_jobs() -> DelayedJobs:
+    """Per-process DelayedJobs on the queue's Redis connection, created lazily."""
+    global _delayed
+    with _delayed_lock:
+        if _delayed is None:
+            from worker.queue import redis_conn
+            _delayed = DelayedJobs(redis_conn)
+        return _delayed
+
+
+def start_scheduler_thread(stop: threading.Event) -> Optional[threading.Thread]:
+    """Run the poll loop in a daemon thread, unless SCHEDULER_ENABLED is off."""
+    if not SCHEDULER_ENABLED:
+        return None
+    thread = threading.Thread(target=get_delayed_jobs().run, args=(stop,), name="ntg-scheduler", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    get_delayed_jobs().run(stop)
+
+
+if __name__ == "__main__":
+    main()
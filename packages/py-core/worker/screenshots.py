@@ -0,0 +1,199 @@
+"""
+Screenshot pipeline: capture in the cheapest requested format, then encode,
+thumbnail and store off the event loop.
+Selected per job with payload "screenshot" (or a screenshot node's config):
+a format name or
+    {"format": "webp", "quality": 70, "full_page": true, "max_height": 8000, "thumbnail": true}
+Capture happens while the page is open; encoding, thumbnails and the
+content-addressed write run in a small thread pool after the context is
+released. Identical images are stored once.
+"""
+import os
+import io
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple, Union
+from PIL import Image
+from dotenv import load_dotenv
+from services.storage import encode_image, get_screenshot_store, save_screenshot_content, thumbnail_image
+
+load_dotenv()
+
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "jpeg")
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+SCREENSHOT_MAX_HEIGHT = int(os.getenv("SCREENSHOT_MAX_HEIGHT", "10000"))  # px of a full-page capture, 0 = no cap
+SCREENSHOT_THUMBNAIL_WIDTH = int(os.getenv("SCREENSHOT_THUMBNAIL_WIDTH", "320"))
+SCREENSHOT_WORKERS = int(os.getenv("SCREENSHOT_WORKERS", "2"))
+SCREENSHOT_GC_INTERVAL = float(os.getenv("SCREENSHOT_GC_INTERVAL", "3600"))  # seconds, 0 = only the gc_screenshots job
+
+# Requested format -> file extension
+FORMATS = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "webp": "webp"}
+
+
+def parse_screenshot(spec: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+    """Normalize a screenshot spec into {"format", "quality", "full_page", "max_height", "thumbnail"}. Raises ValueError."""
+    if spec is None or spec == "":
+        spec = {}
+    if isinstance(spec, str):
+        spec = {"format": spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid screenshot spec: {spec!r}")
+
+    fmt = str(spec.get("format") or SCREENSHOT_FORMAT).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown screenshot format: {fmt}")
+    if fmt == "jpg":
+        fmt = "jpeg"
+
+    quality = int(spec.get("quality") or SCREENSHOT_QUALITY)
+    if not 1 <= quality <= 100:
+        raise ValueError("screenshot quality must be between 1 and 100")
+
+    full_page = spec.get("full_page", spec.get("fullPage", True))
+    max_height = spec.get("max_height", spec.get("maxHeight"))
+    return {
+        "format": fmt,
+        "quality": quality,
+        "full_page": bool(full_page),
+        "max_height": SCREENSHOT_MAX_HEIGHT if max_height is None else int(max_height),
+        "thumbnail": bool(spec.get("thumbnail", True)),
+    }
+
+
+async def capture_screenshot(page, options: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Take the screenshot in the format Chromium can produce most cheaply for the
+    request: JPEG directly, PNG (lossless, re-encoded later) for png/webp.
+    CSS-pixel scale keeps high-DPI captures at layout size; long pages are cut at max_height.
+    """
+    started = time.perf_counter()
+    kwargs: Dict[str, Any] = {"full_page": options["full_page"], "scale": "css"}
+    if options["format"] == "jpeg":
+        kwargs.update(type="jpeg", quality=options["quality"])
+    else:
+        kwargs["type"] = "png"
+
+    truncated = False
+    if options["full_page"] and options["max_height"]:
+        width, height = await page.evaluate(
+            "() => [document.documentElement.scrollWidth, document.documentElement.scrollHeight]"
+        )
+        if height > options["max_height"]:
+            kwargs["clip"] = {"x": 0, "y": 0, "width": width, "height": options["max_height"]}
+            truncated = True
+
+    data = await page.screenshot(**kwargs)
+    return data, {
+        "captured_bytes": len(data),
+        "truncated": truncated,
+        "capture_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def process_screenshot_sync(
+    data: bytes,
+    options: Dict[str, Any],
+    job_exec_id: Optional[int] = None,
+    profile_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Encode to the requested format, build the thumbnail and store both. Blocking; runs in the pool."""
+    started = time.perf_counter()
+    fmt = options["format"]
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+
+    if fmt == "webp":
+        data = encode_image(image, "webp", options["quality"])
+
+    thumb_info = None
+    if options["thumbnail"]:
+        thumb = thumbnail_image(image, SCREENSHOT_THUMBNAIL_WIDTH)
+        # Referenced together with the screenshot below, so retention drops both at once
+        thumb_info = save_screenshot_content(encode_image(thumb, "webp"), "webp", reference=False)
+        thumb_info.update(width=thumb.width, height=thumb.height)
+
+    info = save_screenshot_content(
+        data,
+        FORMATS[fmt],
+        job_exec_id=job_exec_id,
+        profile_id=profile_id,
+        thumbnail_key=thumb_info["key"] if thumb_info else None,
+    )
+    info.update(format=fmt, width=width, height=height)
+    if thumb_info:
+        info["thumbnail"] = thumb_info
+
+    info["process_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _record(info)
+    return info
+
+
+async def process_screenshot(
+    data: bytes,
+    options: Dict[str, Any],
+    job_exec_id: Optional[int] = None,
+    profile_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """process_screenshot_sync on the screenshot thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        get_screenshot_pool(), process_screenshot_sync, data, options, job_exec_id, profile_id
+    )
+
+
+async def take_screenshot(page, spec: Union[str, Dict[str, Any], None] = None) -> Dict[str, Any]:
+    """Capture and process in one step, for callers that keep the page open anyway."""
+    options = parse_screenshot(spec)
+    data, capture = await capture_screenshot(page, options)
+    return {**await process_screenshot(data, options), **capture}
+
+
+async def gc_screenshots(**policy) -> Dict[str, Any]:
+    """Apply the retention policy (env defaults, overridable per call) on the screenshot pool."""
+    store = get_screenshot_store()
+    return await asyncio.get_running_loop().run_in_executor(get_screenshot_pool(), lambda: store.gc(**policy))
+
+
+async def run_gc_loop(interval: float = SCREENSHOT_GC_INTERVAL):
+    """Background task: enforce screenshot retention periodically until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await gc_screenshots()
+            if result["refs_removed"] or result["artifacts_deleted"]:
+                print(f"Screenshot GC: {result}")
+        except Exception as e:
+            print(f"Screenshot GC error: {e}")
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_stats = {"processed": 0, "deduplicated": 0, "bytes_written": 0, "bytes_deduplicated": 0}
+
+
+def _record(info: Dict[str, Any]):
+    with _pool_lock:
+        for entry in (info, info.get("thumbnail")):
+            if not entry:
+                continue
+            if entry["deduplicated"]:
+                _stats["deduplicated"] += 1
+                _stats["bytes_deduplicated"] += entry["bytes"]
+            else:
+                _stats["bytes_written"] += entry["bytes"]
+        _stats["processed"] += 1
+
+
+def get_screenshot_pool() -> ThreadPoolExecutor:
+    """Per-process pool for image encoding, created lazily."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, SCREENSHOT_WORKERS), thread_name_prefix="ntg-screenshot")
+        return _pool
+
+
+def screenshot_stats() -> Dict[str, Any]:
+    with _pool_lock:
+        return dict(_stats)
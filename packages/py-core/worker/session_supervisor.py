@@ -0,0 +1,214 @@
+"""
+Session supervisor for the worker.
+Keeps one live BrowserContext per running Session so jobs for that profile
+can attach to it instead of starting a fresh context, within a budget of
+live sessions. Idle sessions are evicted, least recently used first.
+"""
+import os
+import time
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_MAX_LIVE = int(os.getenv("SESSION_MAX_LIVE", "5"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "900"))  # seconds
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "30"))
+
+
+class SessionBudgetExceeded(Exception):
+    """Raised by start() when every live session slot is busy."""
+
+
+class LiveSession:
+    """A running session's context, held open until stopped or evicted."""
+
+    def __init__(self, session_id: int, profile_id: int, context, page, stack: AsyncExitStack):
+        self.session_id = session_id
+        self.profile_id = profile_id
+        self.context = context
+        self.page = page
+        self._stack = stack
+        self.started_at = time.monotonic()
+        self.last_used = self.started_at
+        self.in_use = 0
+        self.jobs = 0
+
+    @property
+    def idle_for(self) -> float:
+        return 0.0 if self.in_use else time.monotonic() - self.last_used
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+class SessionSupervisor:
+    """
+    Owns live session contexts leased from the browser pool.
+    `on_close(session, reason)` is called when the supervisor ends a session on its
+    own ("idle", "budget", "replaced", "shutdown") so its row can be updated.
+    Both it and reap()'s `running_ids` do database work, so they run in a thread.
+    """
+
+    def __init__(
+        self,
+        pool,
+        max_live: int = SESSION_MAX_LIVE,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        on_close: Optional[Callable[[LiveSession, str], None]] = None,
+    ):
+        self.pool = pool
+        self.max_live = max(1, max_live)
+        self.idle_timeout = idle_timeout
+        self.on_close = on_close
+        self._sessions: Dict[int, LiveSession] = {}
+        self._by_profile: Dict[int, int] = {}
+        self._lock = asyncio.Lock()
+        self._stats = {"started": 0, "attached": 0, "stopped": 0, "evicted_idle": 0, "evicted_budget": 0, "gone": 0}
+
+    async def start(
+        self,
+        session_id: int,
+        profile_id: int,
+        kind: str = "headed",
+        context_options: Optional[Dict[str, Any]] = None,
+        prepare: Optional[Callable[[Any], Awaitable[None]]] = None,
+    ) -> LiveSession:
+        """Open a live context for a session (idempotent). Evicts the LRU idle session when at budget."""
+        async with self._lock:
+            live = self._sessions.get(session_id)
+            if live:
+                live.touch()
+                return live
+
+            # One live context per profile: a new session for it replaces the old one
+            previous = self._by_profile.get(profile_id)
+            if previous is not None:
+                await self._close(self._sessions[previous], "replaced")
+
+            while len(self._sessions) >= self.max_live:
+                idle = [s for s in self._sessions.values() if not s.in_use]
+                if not idle:
+                    raise SessionBudgetExceeded(f"All {self.max_live} live sessions are busy")
+                await self._close(min(idle, key=lambda s: s.last_used), "budget")
+                self._stats["evicted_budget"] += 1
+
+            stack = AsyncExitStack()
+            try:
+                context = await stack.enter_async_context(self.pool.context(kind, **(context_options or {})))
+                if prepare:
+                    await prepare(context)
+                page = await context.new_page()
+            except BaseException:
+                await stack.aclose()
+                raise
+
+            live = LiveSession(session_id, profile_id, context, page, stack)
+            self._sessions[session_id] = live
+            self._by_profile[profile_id] = session_id
+            self._stats["started"] += 1
+            return live
+
+    def get(self, session_id: int) -> Optional[LiveSession]:
+        return self._sessions.get(session_id)
+
+    @asynccontextmanager
+    async def attach(self, profile_id: int):
+        """Yield the live context of the profile's running session, or None if it has none."""
+        session_id = self._by_profile.get(profile_id)
+        live = self._sessions.get(session_id) if session_id is not None else None
+        if live is None:
+            yield None
+            return
+        live.in_use += 1
+        live.jobs += 1
+        live.touch()
+        self._stats["attached"] += 1
+        try:
+            yield live.context
+        finally:
+            live.in_use -= 1
+            live.touch()
+
+    async def stop(self, session_id: int) -> bool:
+        """Close a session's context. Returns False if it was not live in this process."""
+        async with self._lock:
+            live = self._sessions.get(session_id)
+            if live is None:
+                return False
+            await self._close(live, "stopped")
+            self._stats["stopped"] += 1
+            return True
+
+    async def reap(self, running_ids: Optional[Callable[[List[int]], Iterable[int]]] = None) -> List[int]:
+        """
+        Evict sessions idle longer than idle_timeout, and (given `running_ids`) sessions
+        whose row is no longer running, e.g. stopped by a job handled in another worker.
+        Returns the closed session ids.
+        """
+        closed = []
+        async with self._lock:
+            still_running: Optional[Set[int]] = None
+            if running_ids is not None and self._sessions:
+                still_running = set(await asyncio.to_thread(running_ids, list(self._sessions)))
+            for live in list(self._sessions.values()):
+                if live.in_use:
+                    continue
+                if still_running is not None and live.session_id not in still_running:
+                    await self._close(live, "gone")
+                    self._stats["gone"] += 1
+                elif live.idle_for >= self.idle_timeout:
+                    await self._close(live, "idle")
+                    self._stats["evicted_idle"] += 1
+                else:
+                    continue
+                closed.append(live.session_id)
+        return closed
+
+    async def run_reaper(self, interval: float = SESSION_REAP_INTERVAL, running_ids=None):
+        """Background task: reap periodically until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap(running_ids)
+            except Exception as e:
+                print(f"Session reaper error: {e}")
+
+    async def close(self):
+        """Close every live session (worker shutdown)."""
+        async with self._lock:
+            for live in list(self._sessions.values()):
+                await self._close(live, "shutdown")
+
+    async def _close(self, live: LiveSession, reason: str):
+        self._sessions.pop(live.session_id, None)
+        if self._by_profile.get(live.profile_id) == live.session_id:
+            del self._by_profile[live.profile_id]
+        try:
+            await live._stack.aclose()
+        except Exception as e:
+            print(f"Failed to close session {live.session_id}: {e}")
+        if self.on_close and reason not in ("stopped", "gone"):
+            try:
+                await asyncio.to_thread(self.on_close, live, reason)
+            except Exception as e:
+                print(f"Session close callback failed for {live.session_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "live": len(self._sessions),
+            "max_live": self.max_live,
+            "sessions": [
+                {
+                    "session_id": s.session_id,
+                    "profile_id": s.profile_id,
+                    "in_use": s.in_use,
+                    "jobs": s.jobs,
+                    "idle_s": round(s.idle_for, 1),
+                }
+                for s in list(self._sessions.values())
+            ],
+        }
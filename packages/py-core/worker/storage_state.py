@@ -0,0 +1,166 @@
+"""
+Per-profile persistent browser storage (cookies + localStorage).
+Pooled browsers hand out fresh contexts, so instead of per-profile user-data
+dirs the worker keeps each profile's Playwright storage state on disk: it is
+loaded lazily when a context is created and saved again at job end when it
+changed. Files are size-capped per profile and evicted LRU across profiles.
+"""
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_STATE_ENABLED = os.getenv("STORAGE_STATE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+STORAGE_STATE_DIR = os.getenv("STORAGE_STATE_DIR", "./data/storage_state")
+STORAGE_STATE_MAX_BYTES = int(os.getenv("STORAGE_STATE_MAX_BYTES", str(5 * 1024 * 1024)))
+STORAGE_STATE_TOTAL_BYTES = int(os.getenv("STORAGE_STATE_TOTAL_BYTES", str(500 * 1024 * 1024)))
+
+
+def _encode(state: Dict[str, Any]) -> bytes:
+    return json.dumps(state, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def trim_state(state: Dict[str, Any], max_bytes: int) -> Optional[Dict[str, Any]]:
+    """
+    Shrink a storage state under max_bytes by dropping the largest origins'
+    localStorage first. Returns None if the cookies alone do not fit.
+    """
+    origins = sorted(state.get("origins") or [], key=lambda o: len(_encode(o)))
+    trimmed = {**state, "origins": list(origins)}
+    while len(_encode(trimmed)) > max_bytes and trimmed["origins"]:
+        trimmed["origins"].pop()
+    return trimmed if len(_encode(trimmed)) <= max_bytes else None
+
+
+class StorageStateStore:
+    """Storage state files under `root`, one per profile."""
+
+    def __init__(self, root: str = STORAGE_STATE_DIR, max_bytes: int = STORAGE_STATE_MAX_BYTES, total_bytes: int = STORAGE_STATE_TOTAL_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.total_bytes = total_bytes
+        self._digests: Dict[int, str] = {}  # profile_id -> hash of the last state loaded or saved
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "misses": 0, "saves": 0, "unchanged": 0, "trimmed": 0, "oversize": 0, "evicted": 0}
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def path(self, profile_id: int) -> Path:
+        return self.root / f"profile_{int(profile_id)}.json"
+
+    def load(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        """Stored state for a profile, or None. Marks the profile as recently used."""
+        path = self.path(profile_id)
+        try:
+            raw = path.read_bytes()
+            state = json.loads(raw)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable storage state {path}: {e}")
+            self._count("misses")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._digests[profile_id] = hashlib.sha256(_encode(state)).hexdigest()
+            self._stats["loads"] += 1
+        return state
+
+    def save_state(self, profile_id: int, state: Dict[str, Any]) -> bool:
+        """Write a profile's state if it changed. Returns True when a file was written."""
+        data = _encode(state)
+        if len(data) > self.max_bytes:
+            state = trim_state(state, self.max_bytes)
+            if state is None:
+                self._count("oversize")
+                return False
+            self._count("trimmed")
+            data = _encode(state)
+
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if self._digests.get(profile_id) == digest:
+                self._stats["unchanged"] += 1
+                return False
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(profile_id)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)  # Atomic: concurrent jobs for one profile never leave a torn file
+        with self._lock:
+            self._digests[profile_id] = digest
+            self._stats["saves"] += 1
+        self.gc()
+        return True
+
+    async def save(self, profile_id: int, context) -> bool:
+        """Capture a context's storage state and persist it off the event loop."""
+        state = await context.storage_state()
+        return await asyncio.get_running_loop().run_in_executor(None, self.save_state, profile_id, state)
+
+    def delete(self, profile_id: int):
+        with self._lock:
+            self._digests.pop(profile_id, None)
+        try:
+            self.path(profile_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def gc(self) -> int:
+        """Evict least recently used profiles until the directory fits total_bytes. Returns files removed."""
+        try:
+            files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.root.glob("profile_*.json")]
+        except OSError:
+            return 0
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.total_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            with self._lock:
+                self._digests.pop(int(path.stem.split("_", 1)[1]), None)
+            total -= size
+            removed += 1
+        if removed:
+            self._count("evicted", removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+
+_store: Optional[StorageStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_storage_state_store() -> StorageStateStore:
+    """Per-process storage state store, created lazily."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StorageStateStore()
+        return _store
+
+
+def storage_enabled(payload: Optional[Dict[str, Any]]) -> bool:
+    """Whether a job persists its profile's storage; payload "persist_storage" overrides the env default."""
+    value = (payload or {}).get("persist_storage")
+    return STORAGE_STATE_ENABLED if value is None else bool(value)
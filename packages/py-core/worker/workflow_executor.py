@@ -1,8 +1,204 @@
 """
 Workflow executor - parses React Flow graph and executes actions using Playwright.
 """
-from typing import Dict, Any, List
-from playwright.sync_api import Page
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, NamedTuple, Optional, Union
+from playwright.async_api import Page
+from worker.cancellation import JobCancelled, check_cancelled
+from worker.readiness import navigate, parse_readiness
+from worker.screenshots import parse_screenshot, take_screenshot
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Compiled plans kept per worker process
+WORKFLOW_PLAN_CACHE_SIZE = int(os.getenv("WORKFLOW_PLAN_CACHE_SIZE", "128"))
+# Upper bound for a workflow's "maxParallel" (branches running at once, one page each)
+WORKFLOW_MAX_PARALLEL = int(os.getenv("WORKFLOW_MAX_PARALLEL", "4"))
+
+
+class PlanStep(NamedTuple):
+    node_id: str
+    node_type: str
+    action: str
+    config: Dict[str, Any]
+
+
+class WorkflowPlan:
+    """
+    A React Flow graph compiled for execution: steps in dependency order plus
+    id-indexed adjacency. Built once per workflow version and shared read-only
+    by every run.
+    """
+
+    def __init__(self, nodes: List[Dict], edges: List[Dict], max_parallel: int = 1):
+        self.max_parallel = max(1, min(int(max_parallel or 1), WORKFLOW_MAX_PARALLEL))
+        self.nodes: Dict[str, Dict] = {}
+        self.successors: Dict[str, List[str]] = {}
+        self.predecessors: Dict[str, List[str]] = {}
+        self.errors: List[str] = []
+
+        for node in nodes:
+            node_id = node.get('id')
+            if node_id is None:
+                self.errors.append("Node without id")
+                continue
+            if node_id in self.nodes:
+                self.errors.append(f"Duplicate node id: {node_id}")
+                continue
+            self.nodes[node_id] = node
+            self.successors[node_id] = []
+            self.predecessors[node_id] = []
+
+        seen_edges = set()
+        for edge in edges:
+            source = edge.get('source')
+            target = edge.get('target')
+            # Edges to unknown nodes are ignored, as the editor can leave them behind
+            if source not in self.nodes or target not in self.nodes or (source, target) in seen_edges:
+                continue
+            seen_edges.add((source, target))
+            self.successors[source].append(target)
+            self.predecessors[target].append(source)
+
+        self.steps: Dict[str, PlanStep] = {}
+        for node_id, node in self.nodes.items():
+            node_type = node.get('type', '')
+            node_data = node.get('data') or {}
+            # Support both: action field and node_type as action
+            action = node_data.get('action', '') or node_type
+            if (action or '').lower() not in KNOWN_ACTIONS:
+                self.errors.append(f"Unknown action {action} on node {node_id}")
+            elif action.lower() in ('openpage', 'open_page'):
+                config = node_data.get('config') or {}
+                try:
+                    parse_readiness(config.get('readiness') or config.get('waitUntil'))
+                except ValueError as e:
+                    self.errors.append(f"Invalid readiness on node {node_id}: {e}")
+            elif action.lower() == 'screenshot':
+                try:
+                    parse_screenshot(node_data.get('config') or {})
+                except ValueError as e:
+                    self.errors.append(f"Invalid screenshot on node {node_id}: {e}")
+            self.steps[node_id] = PlanStep(node_id, node_type, action, node_data.get('config', {}) or {})
+
+        self.start_nodes: List[str] = [nid for nid in self.nodes if not self.predecessors[nid]]
+        self.order: List[PlanStep] = self._order()
+        self.branch_of: Dict[str, int] = self._branches()
+        self.branch_count = len(set(self.branch_of.values()))
+
+    def _order(self) -> List[PlanStep]:
+        """Kahn's algorithm; FIFO so independent nodes keep their definition order."""
+        remaining = {nid: len(preds) for nid, preds in self.predecessors.items()}
+        ready = deque(self.start_nodes)
+        order = []
+        while ready:
+            node_id = ready.popleft()
+            order.append(self.steps[node_id])
+            for succ_id in self.successors[node_id]:
+                remaining[succ_id] -= 1
+                if remaining[succ_id] == 0:
+                    ready.append(succ_id)
+
+        if len(order) < len(self.nodes):
+            ordered = {step.node_id for step in order}
+            stuck = [nid for nid in self.nodes if nid not in ordered]
+            self.errors.append(f"Workflow has a cycle through nodes: {stuck}")
+        return order
+
+    def _branches(self) -> Dict[str, int]:
+        """
+        Assign each node to a branch (one page per branch). A node continues its
+        first predecessor's branch; extra start nodes and extra successors of a
+        fork start new branches. A merge continues the branch that reaches it first.
+        """
+        branch_of: Dict[str, int] = {}
+        next_branch = 0
+        for step in self.order:
+            node_id = step.node_id
+            if node_id not in branch_of:
+                branch_of[node_id] = next_branch
+                next_branch += 1
+            handed_on = False
+            for succ_id in self.successors[node_id]:
+                if succ_id in branch_of:
+                    continue
+                if not handed_on:
+                    branch_of[succ_id] = branch_of[node_id]
+                    handed_on = True
+                else:
+                    branch_of[succ_id] = next_branch
+                    next_branch += 1
+        return branch_of
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+def compile_workflow(workflow_data: Dict[str, Any]) -> WorkflowPlan:
+    """Compile a React Flow graph {nodes, edges} into a WorkflowPlan."""
+    workflow_data = workflow_data or {}
+    return WorkflowPlan(
+        workflow_data.get('nodes') or [],
+        workflow_data.get('edges') or [],
+        max_parallel=workflow_data.get('maxParallel') or 1,
+    )
+
+
+def workflow_key(workflow_data: Dict[str, Any]) -> str:
+    """Content hash of a workflow graph, used when no explicit version is given."""
+    canonical = json.dumps(workflow_data or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """Small LRU of compiled plans, keyed by workflow version."""
+
+    def __init__(self, maxsize: int = WORKFLOW_PLAN_CACHE_SIZE):
+        self.maxsize = max(1, maxsize)
+        self._plans: "OrderedDict[str, WorkflowPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "compiles": 0}
+
+    def get(self, workflow_data: Dict[str, Any], version: Optional[str] = None) -> WorkflowPlan:
+        key = version if version is not None else workflow_key(workflow_data)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self._stats["hits"] += 1
+                return plan
+
+        plan = compile_workflow(workflow_data)
+        with self._lock:
+            self._stats["compiles"] += 1
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "size": len(self._plans)}
+
+
+plan_cache = PlanCache()
+
+
+def get_workflow_plan(workflow_data: Dict[str, Any], version: Optional[str] = None) -> WorkflowPlan:
+    """
+    Compiled plan for a workflow, compiled at most once per version.
+    Pass version (e.g. "<id>:<updated_at>") to skip hashing the graph on every run.
+    """
+    return plan_cache.get(workflow_data, version)
 
 
 def topological_sort(nodes: List[Dict], edges: List[Dict]) -> List[Dict]:
@@ -10,147 +206,242 @@ def topological_sort(nodes: List[Dict], edges: List[Dict]) -> List[Dict]:
     if not nodes:
         return []
     
-    # Build adjacency list
-    incoming = {n['id']: [] for n in nodes}
-    outgoing = {n['id']: [] for n in nodes}
-    
-    for edge in edges:
-        source = edge.get('source')
-        target = edge.get('target')
-        if source and target and source in incoming and target in incoming:
-            outgoing[source].append(target)
-            incoming[target].append(source)
-    
-    # Find start nodes (no incoming edges)
-    queue = [n['id'] for n in nodes if not incoming[n['id']]]
-    result = []
-    visited = set()
-    
-    while queue:
-        node_id = queue.pop(0)
-        if node_id in visited:
-            continue
-        visited.add(node_id)
-        
-        # Find node data
-        node_data = next((n for n in nodes if n['id'] == node_id), None)
-        if node_data:
-            result.append(node_data)
-        
-        # Add children to queue
-        for child_id in outgoing[node_id]:
-            if all(parent in visited for parent in incoming[child_id]):
-                queue.append(child_id)
-    
-    # Add any remaining nodes (orphaned)
-    for node in nodes:
-        if node['id'] not in visited:
-            result.append(node)
+    plan = WorkflowPlan(nodes, edges)
+    result = [plan.nodes[step.node_id] for step in plan.order]
     
+    # Add any remaining nodes (orphaned or in a cycle)
+    ordered = {step.node_id for step in plan.order}
+    result.extend(n for n in nodes if n.get('id') not in ordered)
     return result
 
 
-def execute_workflow(page: Page, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
+async def execute_workflow(
+    page: Page,
+    workflow: Union[WorkflowPlan, Dict[str, Any]],
+    max_parallel: Optional[int] = None,
+) -> Dict[str, Any]:
     """
     Execute a workflow using Playwright page.
     Args:
         page: Playwright Page instance
-        workflow_data: React Flow graph {nodes, edges, version}
+        workflow: Compiled WorkflowPlan, or a React Flow graph {nodes, edges, version, maxParallel}
+        max_parallel: Branches to run at once; defaults to the workflow's maxParallel (1 = sequential)
     Returns:
-        dict with results and any errors
+        dict with results and any errors; on a failed node also "exception", the
+        node's exception for retry classification (callers pop it before storing the result)
     """
-    nodes = workflow_data.get('nodes', [])
-    edges = workflow_data.get('edges', [])
+    plan = workflow if isinstance(workflow, WorkflowPlan) else get_workflow_plan(workflow)
+    limit = plan.max_parallel if max_parallel is None else max(1, max_parallel)
     
-    if not nodes:
+    if not plan.nodes:
         return {"success": False, "error": "No nodes in workflow"}
     
-    # Build adjacency for merge node handling
-    in_edges: Dict[str, List[str]] = {n['id']: [] for n in nodes}
-    for edge in edges:
-        in_edges.get(edge['target'], []).append(edge['source'])
+    # Reject invalid graphs before touching the page
+    if not plan.valid:
+        return {
+            "success": False,
+            "error": "Invalid workflow",
+            "results": [],
+            "errors": list(plan.errors),
+        }
     
-    # Track execution state for merge nodes
-    executed_nodes: Dict[str, bool] = {n['id']: False for n in nodes}
-    ready_nodes: List[str] = [n['id'] for n in nodes if len(in_edges[n['id']]) == 0]  # Start nodes
+    if limit > 1 and plan.branch_count > 1:
+        return await execute_parallel(page, plan, limit)
     
     results = []
     errors = []
+    executed = 0
+    failure: Optional[Exception] = None
     
     try:
-        while ready_nodes:
-            node_id = ready_nodes.pop(0)
-            if executed_nodes[node_id]:
-                continue
-            
-            node = next((n for n in nodes if n['id'] == node_id), None)
-            if not node:
-                continue
-            
-            node_type = node.get('type', '')
-            node_data = node.get('data', {})
-            # Support both: action field and node_type as action
-            action = node_data.get('action', '') or node_type
-            config = node_data.get('config', {})
-            
-            # For merge nodes, check if all inputs are ready
-            if node_type == 'merge':
-                predecessors = in_edges.get(node_id, [])
-                if not all(executed_nodes.get(p, False) for p in predecessors):
-                    ready_nodes.append(node_id)  # Re-queue for later
-                    continue
-            
+        for step in plan.order:
+            # Cancellation is honoured between nodes (and interrupts long waits via the CancelScope)
+            check_cancelled()
             try:
-                result = execute_action(page, action, config)
+                result = await execute_action(page, step.action, step.config)
                 results.append({
-                    'node_id': node_id,
-                    'node_type': node_type,
-                    'action': action,
+                    'node_id': step.node_id,
+                    'node_type': step.node_type,
+                    'action': step.action,
                     'result': result,
                 })
-                executed_nodes[node_id] = True
-                
-                # Add successors to ready queue
-                successors = [e['target'] for e in edges if e['source'] == node_id]
-                for succ_id in successors:
-                    if not executed_nodes[succ_id]:
-                        # Check if this successor is a merge with all predecessors done
-                        preds = in_edges.get(succ_id, [])
-                        if all(executed_nodes.get(p, False) for p in preds):
-                            ready_nodes.append(succ_id)
+                executed += 1
             
+            except JobCancelled:
+                raise
             except Exception as e:
-                error_msg = f"Action {action} failed on node {node_id}: {str(e)}"
+                failure = e
+                error_msg = f"Action {step.action} failed on node {step.node_id}: {str(e)}"
                 errors.append(error_msg)
                 results.append({
-                    'node_id': node_id,
-                    'node_type': node_type,
-                    'action': action,
+                    'node_id': step.node_id,
+                    'node_type': step.node_type,
+                    'action': step.action,
                     'error': str(e),
                 })
-                executed_nodes[node_id] = True
+                executed += 1
                 # Stop on error
                 break
         
         # Check if all nodes were executed
-        if not all(executed_nodes.values()):
-            unreached = [nid for nid, ex in executed_nodes.items() if not ex]
+        if executed < len(plan.order):
+            unreached = [step.node_id for step in plan.order[executed:]]
             errors.append(f"Nodes never reached: {unreached}")
         
-        return {
+        outcome = {
             "success": len(errors) == 0,
             "results": results,
             "errors": errors,
         }
+        if failure is not None:
+            outcome["exception"] = failure
+        return outcome
+    except JobCancelled:
+        raise
     except Exception as e:
         return {
             "success": False,
             "error": f"Workflow execution failed: {str(e)}",
             "results": results,
+            "exception": e,
         }
 
 
-def execute_action(page: Page, action: str, config: Dict[str, Any]) -> Any:
+async def execute_parallel(page: Page, plan: WorkflowPlan, limit: int) -> Dict[str, Any]:
+    """
+    Run independent branches concurrently, each on its own page in the page's
+    BrowserContext (sharing its cookies and storage). A branch forked off another
+    opens at the URL its parent page had when the fork node finished. A node
+    starts once all its predecessors finished, so merge nodes act as join barriers. At most `limit` actions run at once; the first
+    failure stops new nodes from starting, and a cancellation stops all branches.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    # Branch 0 (the first start node's) uses the caller's page; others open their own
+    pages: Dict[int, Page] = {0: page}
+    remaining = {node_id: len(preds) for node_id, preds in plan.predecessors.items()}
+    results: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    executed = set()
+    branch_times: Dict[int, Dict[str, Any]] = {}
+    # URL of each finished node's page, where branches forking off it start
+    urls: Dict[str, str] = {}
+    failed = False
+    failure: Optional[Exception] = None
+    
+    async def branch_page(branch: int, step: PlanStep) -> Page:
+        if branch not in pages:
+            new_page = pages[branch] = await page.context.new_page()
+            predecessors = plan.predecessors[step.node_id]
+            url = urls.get(predecessors[0]) if predecessors else None
+            if url and url != "about:blank":
+                await navigate(new_page, url)
+        return pages[branch]
+    
+    async def run(step: PlanStep) -> bool:
+        nonlocal failed, failure
+        branch = plan.branch_of[step.node_id]
+        async with semaphore:
+            if failed:
+                return False
+            check_cancelled()
+            started = time.perf_counter()
+            entry = {
+                'node_id': step.node_id,
+                'node_type': step.node_type,
+                'action': step.action,
+                'branch': branch,
+            }
+            try:
+                step_page = await branch_page(branch, step)
+                entry['result'] = await execute_action(step_page, step.action, step.config)
+                urls[step.node_id] = step_page.url
+                ok = True
+            except JobCancelled:
+                raise
+            except Exception as e:
+                failed = True
+                failure = failure or e
+                errors.append(f"Action {step.action} failed on node {step.node_id}: {str(e)}")
+                entry['error'] = str(e)
+                ok = False
+            finished = time.perf_counter()
+            entry['duration_ms'] = round((finished - started) * 1000, 1)
+            results.append(entry)
+            executed.add(step.node_id)
+            timing = branch_times.setdefault(branch, {"nodes": 0, "started": started, "finished": finished})
+            timing["nodes"] += 1
+            timing["finished"] = max(timing["finished"], finished)
+            return ok
+    
+    workflow_started = time.perf_counter()
+    running = {asyncio.ensure_future(run(plan.steps[node_id])): node_id for node_id in plan.start_nodes}
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node_id = running.pop(task)
+                if not task.result() or failed:
+                    continue
+                for succ_id in plan.successors[node_id]:
+                    remaining[succ_id] -= 1
+                    if remaining[succ_id] == 0:
+                        running[asyncio.ensure_future(run(plan.steps[succ_id]))] = succ_id
+    except JobCancelled:
+        raise
+    except Exception as e:
+        failed = True
+        failure = failure or e
+        errors.append(f"Workflow execution failed: {str(e)}")
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        # Branch pages are scratch pages; the caller's page stays open
+        for branch, branch_page_obj in pages.items():
+            if branch_page_obj is not page:
+                try:
+                    await branch_page_obj.close()
+                except Exception:
+                    pass
+    
+    unreached = [step.node_id for step in plan.order if step.node_id not in executed]
+    if unreached:
+        errors.append(f"Nodes never reached: {unreached}")
+    
+    outcome = {
+        "success": len(errors) == 0,
+        "results": results,
+        "errors": errors,
+        "mode": "parallel",
+        "max_parallel": limit,
+        "duration_ms": round((time.perf_counter() - workflow_started) * 1000, 1),
+        "branches": {
+            str(branch): {
+                "nodes": timing["nodes"],
+                "duration_ms": round((timing["finished"] - timing["started"]) * 1000, 1),
+            }
+            for branch, timing in sorted(branch_times.items())
+        },
+    }
+    if failure is not None:
+        outcome["exception"] = failure
+    return outcome
+
+
+# Action names accepted by execute_action (compared lowercased)
+KNOWN_ACTIONS = frozenset({
+    'openpage', 'open_page',
+    'waitselector', 'wait_selector',
+    'click',
+    'typetext', 'type_text',
+    'screenshot',
+    'closepage', 'close_page',
+    'start', 'end', 'merge',
+})
+
+
+async def execute_action(page: Page, action: str, config: Dict[str, Any]) -> Any:
     """Execute a single action on Playwright page."""
     
     # Normalize action name (support both 'openPage' and 'openpage')
@@ -160,22 +451,22 @@ def execute_action(page: Page, action: str, config: Dict[str, Any]) -> Any:
         url = config.get('url', '')
         if not url:
             raise ValueError("openPage requires 'url' in config")
-        page.goto(url, wait_until='networkidle', timeout=30000)
-        return {"url": page.url}
+        readiness = await navigate(page, url, config.get('readiness') or config.get('waitUntil'), config.get('timeout'))
+        return {"url": page.url, "readiness": readiness}
     
     elif action == 'waitselector' or action == 'wait_selector':
         selector = config.get('selector', '')
         timeout = config.get('timeout', 5000)
         if not selector:
             raise ValueError("waitSelector requires 'selector' in config")
-        page.wait_for_selector(selector, timeout=timeout)
+        await page.wait_for_selector(selector, timeout=timeout)
         return {"found": True}
     
     elif action == 'click':
         selector = config.get('selector', '')
         if not selector:
             raise ValueError("click requires 'selector' in config")
-        page.click(selector)
+        await page.click(selector)
         return {"clicked": True}
     
     elif action == 'typetext' or action == 'type_text':
@@ -183,16 +474,22 @@ def execute_action(page: Page, action: str, config: Dict[str, Any]) -> Any:
         text = config.get('text', '')
         if not selector:
             raise ValueError("typeText requires 'selector' in config")
-        page.fill(selector, text)
+        await page.fill(selector, text)
         return {"typed": True, "text_length": len(text)}
     
     elif action == 'screenshot':
         path = config.get('path', None)
-        screenshot_data = page.screenshot(path=path, full_page=True)
-        return {"screenshot": path if path else "captured", "bytes": len(screenshot_data) if screenshot_data else 0}
+        if path:
+            # Explicit file path: keep Playwright's direct write, in the node's format
+            options = parse_screenshot(config)
+            kwargs = {"type": "jpeg", "quality": options["quality"]} if options["format"] == "jpeg" else {"type": "png"}
+            screenshot_data = await page.screenshot(path=path, full_page=options["full_page"], scale="css", **kwargs)
+            return {"screenshot": path, "bytes": len(screenshot_data) if screenshot_data else 0}
+        info = await take_screenshot(page, config)
+        return {"screenshot": info["path"], **info}
     
     elif action == 'closepage' or action == 'close_page':
-        page.close()
+        await page.close()
         return {"closed": True}
     
     elif action == 'start':